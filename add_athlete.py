@@ -0,0 +1,34 @@
+# add_athlete.py
+# como usar: python add_athlete.py <athlete_id> <refresh_token> [nombre]
+# Registra un atleta del club para sincronizarlo con sync_all_athletes().
+# El refresh token es el que devuelve Strava al autorizar la aplicación (scope activity:read_all).
+# Funciona con SQLite local o PostgreSQL (Supabase)
+
+import sys
+from strava_client import init_db
+from utils import rollups
+from utils.analytics_cache import bump_sync_generation
+from utils.athletes import add_athlete
+from utils.db_config import get_connection
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("❌ Uso: python add_athlete.py <athlete_id> <refresh_token> [nombre]")
+        sys.exit(1)
+
+    try:
+        athlete_id = int(sys.argv[1])
+    except ValueError:
+        print("❌ El ID debe ser un número entero.")
+        sys.exit(1)
+
+    init_db("data/strava_activities.db")
+    conn = get_connection()
+    cur = conn.cursor()
+    add_athlete(cur, athlete_id, sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+    # Sus actividades ya guardadas dejan de contar en el tablero y los agregados del dueño
+    rollups.rebuild(cur)
+    bump_sync_generation(cur)
+    conn.commit()
+    conn.close()
+    print(f"✅ Atleta {athlete_id} registrado.")
@@ -2,6 +2,7 @@
 import streamlit as st
 from i18n import t
 from auth import check_password
+from utils.data_processing import ensure_schema
 
 # Configuració principal de la pàgina
 st.set_page_config(
@@ -15,5 +16,8 @@ st.set_page_config(
 if not check_password():
     st.stop()
 
+# Taules i migracions pendents (índexs, columnes de dates tipades) abans de cap consulta
+ensure_schema()
+
 # Redirigir automàticament a la pàgina d'Inici
 st.switch_page("pages/0_Inici.py")
\ No newline at end of file
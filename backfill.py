@@ -0,0 +1,15 @@
+# backfill.py
+# como usar: python backfill.py laps|splits|streams [--limit N]
+# Rellena el dato indicado de las actividades guardadas que no lo tienen (reanudable).
+# Funciona con SQLite local o PostgreSQL (Supabase)
+
+import argparse
+
+from strava_client import ARTEFACTS, backfill_missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de datos por actividad desde Strava")
+    parser.add_argument("artefact", choices=sorted(ARTEFACTS))
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de actividades a procesar")
+    args = parser.parse_args()
+    backfill_missing(args.artefact, limit=args.limit)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark del coste fijo de execute_query(): resolución del backend en cada llamada
+(comportamiento anterior) frente a la configuración memoizada de get_db_config().
+
+Uso:
+    python benchmarks/bench_execute_query.py                     # SQLite (fichero temporal)
+    python benchmarks/bench_execute_query.py --postgres-url URL  # PostgreSQL local
+
+La query es trivial (SELECT 1) para que lo medido sea el overhead de db_config y no la BD.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.db_config as db_config
+
+
+def resolve_every_call() -> db_config.DatabaseConfig:
+    """Comportamiento anterior: entorno + st.secrets + logs en cada is_postgres()/get_connection()."""
+    url = db_config._resolve_database_url()
+    return db_config.DatabaseConfig(url=url, is_postgres=url is not None and db_config.POSTGRES_AVAILABLE)
+
+
+def measure(calls: int, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        # Los logs del camino antiguo van a un buffer para no medir la terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(calls):
+                db_config.execute_query("SELECT 1 WHERE 1 = ?", (1,), fetch='one')
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.postgres_url:
+            os.environ["DATABASE_URL"] = args.postgres_url
+        else:
+            os.environ.pop("DATABASE_URL", None)
+            os.chdir(tmp)
+            os.makedirs("data", exist_ok=True)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            config = db_config.reload_db_config()
+        print(f"== {config.db_type}: {args.calls} llamadas, {args.rounds} rondas ==")
+
+        cached = db_config.get_db_config
+        db_config.get_db_config = resolve_every_call
+        try:
+            before = measure(args.calls, args.rounds)
+        finally:
+            db_config.get_db_config = cached
+        after = measure(args.calls, args.rounds)
+
+        print(f"  resolver en cada llamada {before:8.1f} µs/llamada")
+        print(f"  config memoizada         {after:8.1f} µs/llamada  (x{before / after:.1f})")
+        db_config.close_pool()
+
+
+if __name__ == "__main__":
+    main()
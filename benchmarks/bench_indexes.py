@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Benchmark de los índices de las migraciones (utils/migrations.py): plan de ejecución
+(EXPLAIN QUERY PLAN / EXPLAIN) y latencia de las consultas calientes sin índices y
+después de aplicar las migraciones.
+
+Uso:
+    python benchmarks/bench_indexes.py                     # SQLite (fichero temporal)
+    python benchmarks/bench_indexes.py --postgres-url URL  # PostgreSQL, en un esquema temporal
+
+En PostgreSQL las tablas se crean en el esquema 'bench_indexes', que se borra al terminar.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.db_config as db_config
+from utils import migrations, timestamps
+
+PG_SCHEMA = "bench_indexes"
+
+# (nombre, SQL, parámetros) tal y como las lanzan ai_functions, ai_context, planning y la página del coach
+QUERIES = (
+    ("actividades recientes", """
+        SELECT id, name, start_date_local, distance, moving_time, average_heartrate
+        FROM activities
+        WHERE type = 'Run' AND start_at >= ?
+        ORDER BY start_at DESC
+    """, ("2025-06-01",)),
+    ("volumen del periodo", """
+        SELECT COUNT(*), SUM(distance), SUM(moving_time), AVG(average_heartrate)
+        FROM activities
+        WHERE type = 'Run' AND start_at >= ?
+    """, ("2025-01-01",)),
+    ("volumen semanal", """
+        SELECT week_key, COUNT(*), SUM(distance), AVG(average_heartrate)
+        FROM activities
+        WHERE type = 'Run' AND start_at >= ?
+        GROUP BY week_key
+        ORDER BY week_key DESC
+    """, ("2025-09-01",)),
+    ("semanas (histórico)", """
+        SELECT week_key, COUNT(*), SUM(distance), SUM(moving_time)
+        FROM activities
+        WHERE type = 'Run'
+        GROUP BY week_key
+    """, ()),
+    ("entrenos del plan", """
+        SELECT pw.*, a.name, a.distance
+        FROM planned_workouts pw
+        LEFT JOIN activities a ON pw.linked_activity_id = a.id
+        WHERE pw.plan_id = ?
+        ORDER BY pw.date
+    """, (250,)),
+    ("sin vincular", """
+        SELECT a.id FROM activities a
+        WHERE a.type = 'Run' AND a.start_at >= ?
+        AND a.id NOT IN (SELECT linked_activity_id FROM planned_workouts WHERE linked_activity_id IS NOT NULL)
+        ORDER BY a.start_at DESC
+    """, ("2025-10-01",)),
+    ("plan activo", """
+        SELECT * FROM training_plans WHERE status = 'active' ORDER BY week_start_date DESC LIMIT 1
+    """, ()),
+    ("historial del chat", """
+        SELECT role, content, timestamp FROM chat_history ORDER BY timestamp DESC LIMIT 20
+    """, ()),
+)
+
+
+def populate(conn, n_activities: int, n_plans: int, n_messages: int):
+    rng = random.Random(42)
+    cur = conn.cursor()
+    start = datetime(2016, 1, 1, 7, 0)
+    step = (datetime(2026, 1, 1) - start) / n_activities
+    dates = [start + step * i for i in range(1, n_activities + 1)]
+    cur.insert_many("activities", ("id", "name", "start_date_local", "start_at", "week_key", "distance",
+                                   "moving_time", "average_heartrate", "type", "sport_type"), [
+        (i, f"Act {i}", dt.isoformat(), timestamps.db_value(dt, conn.is_postgres), timestamps.week_key(dt),
+         rng.uniform(3000, 20000), rng.randint(900, 6000), rng.uniform(120, 170),
+         rng.choice(("Run", "Run", "Run", "Ride", "Walk")), "Run")
+        for i, dt in enumerate(dates, start=1)
+    ])
+
+    plan_start = datetime(2026, 1, 5) - timedelta(weeks=n_plans)
+    cur.insert_many("training_plans", ("id", "week_start_date", "week_number", "goal", "status"), [
+        (p, (plan_start + timedelta(weeks=p - 1)).date().isoformat(), p, "Base",
+         "active" if p == n_plans else "completed")
+        for p in range(1, n_plans + 1)
+    ])
+    cur.insert_many("planned_workouts", ("id", "plan_id", "date", "workout_type", "distance_km", "status",
+                                         "linked_activity_id"), [
+        (p * 7 + d, p, (plan_start + timedelta(weeks=p - 1, days=d)).date().isoformat(), "easy", 10.0, "completed",
+         rng.randint(1, n_activities) if rng.random() < 0.7 else None)
+        for p in range(1, n_plans + 1) for d in range(7)
+    ])
+    cur.insert_many("chat_history", ("id", "role", "content", "timestamp"), [
+        (m, "user" if m % 2 else "assistant", f"Mensaje {m}",
+         (datetime(2024, 1, 1) + timedelta(minutes=13 * m)).isoformat())
+        for m in range(1, n_messages + 1)
+    ])
+    if conn.is_postgres:
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def drop_migration_indexes(conn):
+    """Deja la BD como antes de las migraciones (las columnas añadidas se quedan)."""
+    cur = conn.cursor()
+    for name, *_ in migrations.HOT_PATH_INDEXES + migrations.TYPED_DATE_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+    cur.execute("DELETE FROM schema_migrations")
+    conn.commit()
+
+
+def db_params(conn, params) -> tuple:
+    """Las fechas de corte ('YYYY-MM-DD') se comparan con start_at: epoch en SQLite."""
+    return tuple(timestamps.db_value(p, conn.is_postgres) if isinstance(p, str) else p for p in params)
+
+
+def explain(conn, sql: str, params) -> list:
+    cur = conn.cursor()
+    if conn.is_postgres:
+        cur.execute("EXPLAIN " + sql, params)
+        return [row[0] for row in cur.fetchall()]
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[-1] for row in cur.fetchall()]
+
+
+def measure(conn, sql: str, params, repeat: int) -> float:
+    cur = conn.cursor()
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cur.execute(sql, params)
+            cur.fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000 / repeat
+
+
+def report(conn, label: str, repeat: int) -> dict:
+    print(f"\n-- {label} --")
+    timings = {}
+    for name, sql, params in QUERIES:
+        params = db_params(conn, params)
+        timings[name] = measure(conn, sql, params, repeat)
+        print(f"  {name:22s} {timings[name]:8.3f} ms")
+        for line in explain(conn, sql, params)[:4]:
+            print(f"      {line.strip()}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--activities", type=int, default=20000)
+    parser.add_argument("--plans", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    args = parser.parse_args()
+
+    import strava_client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.postgres_url:
+            import psycopg2
+            admin = psycopg2.connect(args.postgres_url)
+            admin.autocommit = True
+            admin.cursor().execute(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE; CREATE SCHEMA {PG_SCHEMA}")
+            separator = "&" if "?" in args.postgres_url else "?"
+            os.environ["DATABASE_URL"] = f"{args.postgres_url}{separator}options=-csearch_path%3D{PG_SCHEMA}"
+        else:
+            os.environ.pop("DATABASE_URL", None)
+            os.chdir(tmp)
+            os.makedirs("data", exist_ok=True)
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                config = db_config.reload_db_config()
+                strava_client.init_db(config.sqlite_path)
+            print(f"== {config.db_type}: {args.activities} actividades, {args.plans} planes, "
+                  f"{args.messages} mensajes ==")
+
+            conn = db_config.get_connection()
+            drop_migration_indexes(conn)
+            populate(conn, args.activities, args.plans, args.messages)
+            before = report(conn, "sin índices", args.repeat)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                migrations.run_migrations(conn)
+            if conn.is_postgres:
+                conn.cursor().execute("ANALYZE")
+                conn.commit()
+            after = report(conn, "migraciones aplicadas", args.repeat)
+
+            print("\n-- resumen --")
+            for name, *_ in QUERIES:
+                print(f"  {name:22s} {before[name]:8.3f} → {after[name]:8.3f} ms  (x{before[name] / after[name]:.1f})")
+            conn.close()
+        finally:
+            db_config.close_pool()
+            if args.postgres_url:
+                admin.cursor().execute(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE")
+                admin.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+Benchmark de concurrencia en SQLite: un proceso escritor (la sync guardando páginas de
+actividades con _store_activities) mientras N procesos lectores (el tablero) consultan sin parar.
+
+Compara:
+- antes: sqlite3.connect() sin pragmas, journal en modo rollback (DELETE) y la misma
+  conexión de lectura/escritura para todos
+- wal:   get_connection() con WAL y pragmas; los lectores con get_connection(read_only=True)
+
+Para cada modo muestra la latencia de lectura (p50/p95/máx), lecturas por segundo,
+actividades escritas por segundo y errores "database is locked".
+
+Uso:
+    python benchmarks/bench_sqlite_concurrency.py [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.db_config as db_config
+from utils.db_config import ConnectionWrapper
+
+# Consultas de una carga del tablero: últimas actividades y volumen semanal
+READ_QUERIES = (
+    """
+    SELECT id, name, start_date_local, distance, moving_time, average_heartrate
+    FROM activities
+    WHERE type = 'Run'
+    ORDER BY start_at DESC
+    LIMIT 200
+    """,
+    "SELECT * FROM weekly_rollup ORDER BY week_key",
+    "SELECT COUNT(*), SUM(distance) FROM splits",
+)
+
+
+def fake_bundle(activity_id: int, rng: random.Random):
+    start = datetime(2020, 1, 1, 7) + timedelta(hours=rng.randint(0, 6 * 365 * 24))
+    detail = {
+        "id": activity_id, "name": f"Run {activity_id}", "description": None, "private_note": None,
+        "start_date_local": start.strftime("%Y-%m-%dT%H:%M:%SZ"), "distance": rng.uniform(3000, 25000),
+        "moving_time": rng.randint(900, 8000), "elapsed_time": 9000, "average_speed": 3.2,
+        "average_heartrate": rng.uniform(120, 170), "total_elevation_gain": 40.0, "type": "Run",
+        "sport_type": "Run",
+        "splits_metric": [
+            {"split": i, "distance": 1000.0, "elapsed_time": 300, "elevation_difference": 1.5, "average_speed": 3.33}
+            for i in range(1, 13)
+        ],
+    }
+    laps = [
+        {"id": activity_id * 100 + i, "lap_index": i, "name": f"Lap {i}", "split": i,
+         "start_date_local": detail["start_date_local"], "elapsed_time": 300, "moving_time": 300,
+         "distance": 1000.0, "average_speed": 3.33, "max_speed": 4.0, "start_index": 0,
+         "end_index": 300, "total_elevation_gain": 5.0, "pace_zone": 2}
+        for i in range(1, 13)
+    ]
+    return detail, laps
+
+
+def legacy_connection(read_only: bool = False):
+    """Como get_connection() antes de WAL: conexión nueva sin pragmas."""
+    return ConnectionWrapper(sqlite3.connect(db_config.get_db_config().sqlite_path), is_postgres=False)
+
+
+def writer(connect, stop, results, page_size: int):
+    import strava_client
+    rng = random.Random(1)
+    next_id = 10 ** 9
+    written, errors = 0, []
+    with contextlib.redirect_stdout(io.StringIO()):
+        while not stop.is_set():
+            bundles = [fake_bundle(next_id + i, rng) for i in range(page_size)]
+            next_id += page_size
+            conn = connect()
+            try:
+                strava_client._store_activities(conn.cursor(), bundles, archive=False)
+                conn.commit()
+                written += page_size
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                errors.append(str(e))
+            finally:
+                conn.close()
+    results.put(("writer", written, errors))
+
+
+def reader(connect, stop, results):
+    latencies, errors = [], []
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn = connect(read_only=True)
+        try:
+            cur = conn.cursor()
+            for query in READ_QUERIES:
+                cur.execute(query)
+                cur.fetchall()
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+        finally:
+            conn.close()
+    results.put(("reader", latencies, errors))
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else float("nan")
+
+
+def run(label: str, connect, journal_mode: str, seed_path: str, args) -> None:
+    # Cada modo parte de una copia de la misma BD inicial
+    db_path = db_config.get_db_config().sqlite_path
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    shutil.copyfile(seed_path, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.close()
+
+    # Procesos (como la sync por CLI junto a Streamlit): con hilos el GIL taparía los bloqueos
+    ctx = multiprocessing.get_context("fork")
+    stop, results = ctx.Event(), ctx.Queue()
+    workers = [ctx.Process(target=reader, args=(connect, stop, results)) for _ in range(args.readers)]
+    workers.append(ctx.Process(target=writer, args=(connect, stop, results, args.page_size)))
+    for worker in workers:
+        worker.start()
+    time.sleep(args.seconds)
+    stop.set()
+
+    latencies, read_errors, written, write_errors = [], [], 0, []
+    for _ in workers:
+        kind, values, errors = results.get()
+        if kind == "reader":
+            latencies.extend(values)
+            read_errors.extend(errors)
+        else:
+            written, write_errors = values, errors
+    for worker in workers:
+        worker.join()
+
+    print(f"\n-- {label} ({journal_mode}) --")
+    print(f"  lecturas         {len(latencies):6d}  ({len(latencies) / args.seconds:.0f}/s)")
+    print(f"  latencia lectura p50 {percentile(latencies, 0.5):7.2f} ms   p95 {percentile(latencies, 0.95):7.2f} ms   "
+          f"máx {max(latencies, default=float('nan')) * 1000:7.2f} ms")
+    print(f"  escritas         {written:6d}  ({written / args.seconds:.0f} act/s)")
+    print(f"  errores          lectura {len(read_errors)}, escritura {len(write_errors)}"
+          + (f"  (p.ej. '{(read_errors + write_errors)[0]}')" if read_errors or write_errors else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--activities", type=int, default=5000, help="actividades iniciales")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.pop("DATABASE_URL", None)
+    import strava_client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("data", exist_ok=True)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                config = db_config.reload_db_config()
+                strava_client.init_db(config.sqlite_path)
+                db_config.close_pool()
+                gc.collect()  # las conexiones de la caché de init_db se cierran al recolectarla
+                conn = legacy_connection()
+                rng = random.Random(0)
+                for start in range(1, args.activities + 1, 500):
+                    strava_client._store_activities(
+                        conn.cursor(), [fake_bundle(i, rng) for i in range(start, min(start + 500, args.activities + 1))],
+                        archive=False)
+                    conn.commit()
+                conn.close()
+            seed_path = os.path.join(tmp, "seed.db")
+            shutil.copyfile(config.sqlite_path, seed_path)
+            print(f"== SQLite: {args.activities} actividades, 1 escritor (páginas de {args.page_size}), "
+                  f"{args.readers} lectores, {args.seconds:g}s ==")
+
+            run("antes", legacy_connection, "DELETE", seed_path, args)
+            run("wal", db_config.get_connection, "WAL", seed_path, args)
+        finally:
+            db_config.close_pool()
+
+
+if __name__ == "__main__":
+    main()
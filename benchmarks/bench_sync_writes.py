@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Benchmark de escritura de la sincronización: latencia por actividad del camino antiguo
+(DELETE + un INSERT por split y por lap) frente al upsert en bloque de
+strava_client._store_activities.
+
+Uso:
+    python benchmarks/bench_sync_writes.py                      # solo SQLite (fichero temporal)
+    python benchmarks/bench_sync_writes.py --postgres-url URL   # además, un PostgreSQL local
+
+Trabaja sobre tablas TEMP, así que no toca los datos reales.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.db_config as db_config
+from utils.db_config import ConnectionWrapper
+from utils import timestamps
+import strava_client
+from strava_client import ACTIVITY_COLUMNS, SPLIT_COLUMNS, LAP_COLUMNS, activity_row, split_rows, lap_rows
+
+TEMP_TABLES = """
+    CREATE TEMP TABLE activities (
+        id BIGINT PRIMARY KEY, name TEXT, description TEXT, private_note TEXT, start_date_local TEXT,
+        distance REAL, moving_time INTEGER, elapsed_time INTEGER, average_speed REAL,
+        average_heartrate REAL, total_elevation_gain REAL, type TEXT, sport_type TEXT, summary_hash TEXT,
+        athlete_id BIGINT, start_at {start_at_type}, week_key TEXT
+    );
+    CREATE TEMP TABLE splits (
+        activity_id BIGINT, split INTEGER, distance REAL, elapsed_time INTEGER,
+        elevation_difference REAL, average_speed REAL, UNIQUE (activity_id, split)
+    );
+    CREATE TEMP TABLE laps (
+        activity_id BIGINT NOT NULL, lap_id BIGINT, lap_index INTEGER, name TEXT, split INTEGER,
+        start_date_local TEXT, elapsed_time INTEGER, moving_time INTEGER, distance REAL,
+        average_speed REAL, max_speed REAL, start_index INTEGER, end_index INTEGER,
+        total_elevation_gain REAL, pace_zone INTEGER, PRIMARY KEY (activity_id, lap_index)
+    );
+    CREATE TEMP TABLE sync_meta (key TEXT PRIMARY KEY, value BIGINT NOT NULL DEFAULT 0);
+    CREATE TEMP TABLE weekly_rollup (
+        week_key TEXT PRIMARY KEY, runs INTEGER NOT NULL, distance_km REAL NOT NULL, moving_time BIGINT NOT NULL,
+        elevation_gain REAL, avg_pace REAL, avg_hr REAL, long_runs INTEGER NOT NULL, updated_at TEXT
+    );
+    CREATE TEMP TABLE monthly_rollup (
+        month_key TEXT PRIMARY KEY, runs INTEGER NOT NULL, distance_km REAL NOT NULL, moving_time BIGINT NOT NULL,
+        elevation_gain REAL, avg_pace REAL, avg_hr REAL, long_runs INTEGER NOT NULL, updated_at TEXT
+    )
+"""
+
+
+def fake_bundle(activity_id: int, n_splits: int = 12, n_laps: int = 12):
+    detail = {
+        "id": activity_id, "name": f"Run {activity_id}", "description": None, "private_note": None,
+        "start_date_local": "2025-01-01T07:00:00Z", "distance": 12000.0, "moving_time": 3600,
+        "elapsed_time": 3700, "average_speed": 3.33, "average_heartrate": 145.0,
+        "total_elevation_gain": 80.0, "type": "Run", "sport_type": "Run",
+        "splits_metric": [
+            {"split": i, "distance": 1000.0, "elapsed_time": 300, "elevation_difference": 1.5, "average_speed": 3.33}
+            for i in range(1, n_splits + 1)
+        ],
+    }
+    laps = [
+        {"id": activity_id * 100 + i, "lap_index": i, "name": f"Lap {i}", "split": i,
+         "start_date_local": "2025-01-01T07:00:00Z", "elapsed_time": 300, "moving_time": 300,
+         "distance": 1000.0, "average_speed": 3.33, "max_speed": 4.0, "start_index": 0,
+         "end_index": 300, "total_elevation_gain": 5.0, "pace_zone": 2}
+        for i in range(1, n_laps + 1)
+    ]
+    return detail, laps
+
+
+def store_row_by_row(cur, bundles):
+    """Camino antiguo: DELETE + INSERT por actividad y un INSERT por split y por lap."""
+    def insert(table, columns, row):
+        placeholders = ", ".join("?" for _ in columns)
+        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", row)
+
+    for detail, laps in bundles:
+        cur.execute("DELETE FROM activities WHERE id = ?", (detail["id"],))
+        insert("activities", ACTIVITY_COLUMNS, activity_row(detail))
+        cur.execute("DELETE FROM splits WHERE activity_id = ?", (detail["id"],))
+        for row in split_rows(detail):
+            insert("splits", SPLIT_COLUMNS, row)
+        cur.execute("DELETE FROM laps WHERE activity_id = ?", (detail["id"],))
+        for row in lap_rows(detail["id"], laps):
+            insert("laps", LAP_COLUMNS, row)
+
+
+def store_bulk(cur, bundles):
+    """Camino actual, sin el archivo de respuestas crudas (el antiguo tampoco lo tenía)."""
+    strava_client._store_activities(cur, bundles, archive=False)
+
+
+def run(conn, label: str, n_activities: int, page_size: int, rounds: int):
+    cur = conn.cursor()
+    for statement in TEMP_TABLES.format(start_at_type=timestamps.start_at_type(conn.is_postgres)).split(";"):
+        cur.execute(statement)
+    conn.commit()
+
+    pages = [
+        [fake_bundle(page * page_size + i + 1) for i in range(page_size)]
+        for page in range(n_activities // page_size)
+    ]
+
+    print(f"\n== {label}: {n_activities} actividades, páginas de {page_size}, {rounds} rondas ==")
+    for name, writer in (("fila a fila", store_row_by_row), ("upsert bloque", store_bulk)):
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for bundles in pages:
+                writer(cur, bundles)
+                conn.commit()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"  {name:14s} {best * 1000 / n_activities:8.3f} ms/actividad  (total {best:.3f}s)")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--activities", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        run(ConnectionWrapper(sqlite_conn, is_postgres=False), "SQLite",
+            args.activities, args.page_size, args.rounds)
+
+    if args.postgres_url:
+        import psycopg2
+        # activity_row() calcula start_at según la BD configurada (TIMESTAMP en PostgreSQL)
+        os.environ["DATABASE_URL"] = args.postgres_url
+        db_config.reload_db_config()
+        run(ConnectionWrapper(psycopg2.connect(args.postgres_url), is_postgres=True), "PostgreSQL",
+            args.activities, args.page_size, args.rounds)
+    else:
+        print("\n(PostgreSQL omitido: pasa --postgres-url o BENCH_DATABASE_URL)")
+
+
+if __name__ == "__main__":
+    main()
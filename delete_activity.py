@@ -4,15 +4,14 @@
 
 import sys
 from utils.db_config import get_connection
+from strava_client import delete_activities
 
 def delete_activity_by_id(activity_id: int):
     conn = get_connection()
     cur = conn.cursor()
 
-    # Eliminar splits primero (por FK)
-    cur.execute("DELETE FROM splits WHERE activity_id = ?", (activity_id,))
-    # Eliminar actividad principal
-    cur.execute("DELETE FROM activities WHERE id = ?", (activity_id,))
+    # Elimina splits, laps, streams y respuestas archivadas, y después la actividad
+    delete_activities(cur, [activity_id])
     conn.commit()
     conn.close()
 
@@ -27,6 +27,7 @@ Utilitza el menú de l'esquerra per navegar!""",
     "sidebar_options": "Opcions",
     "refresh_activities": "🔄 Actualitzar activitats",
     "syncing_activities": "Sincronitzant noves activitats des de Strava...",
+    "syncing_activities_progress": "⏳ Sincronitzant en segon pla... pàgina {page}, {processed} activitats desades",
     "activities_updated": "✅ Activitats actualitzades!",
     "sync_error": "No s'ha pogut sincronitzar: {error}",
 
@@ -12,12 +12,32 @@ from dotenv import load_dotenv
 # Añadir src al path
 sys.path.insert(0, 'src')
 from utils.db_config import get_connection, is_postgres
+from strava_client import ACTIVITY_COLUMNS, SPLIT_COLUMNS, LAP_COLUMNS
+from utils import rollups, timestamps
 
 load_dotenv()
 
+# Filas por lote (un INSERT ... ON CONFLICT multi-fila + commit por lote)
+BATCH_SIZE = 500
+
 # IDs a excluir (últimas 2 actividades)
 EXCLUDE_IDS = [16473993143, 16435421117]
 
+
+def unique_rows(rows, key_indexes):
+    """
+    Quita las filas repetidas en la clave de conflicto (se queda la primera, como init_db).
+
+    Un SQLite antiguo puede tener splits o laps duplicados, y PostgreSQL rechaza un
+    INSERT ... ON CONFLICT DO UPDATE que toca dos veces la misma fila.
+    """
+    unique = {}
+    for row in rows:
+        unique.setdefault(tuple(row[i] for i in key_indexes), row)
+    if len(unique) < len(rows):
+        print(f"   ⚠️  {len(rows) - len(unique)} filas duplicadas omitidas")
+    return list(unique.values())
+
 def migrate_data():
     """Migra datos de SQLite a PostgreSQL"""
 
@@ -55,33 +75,22 @@ def migrate_data():
     cur_sqlite.execute("""
         SELECT id, name, description, private_note, start_date_local,
                distance, moving_time, elapsed_time, average_speed,
-               average_heartrate, total_elevation_gain, type, sport_type
+               average_heartrate, total_elevation_gain, type, sport_type, athlete_id
         FROM activities
         WHERE id NOT IN ({})
         ORDER BY start_date_local ASC
     """.format(','.join(map(str, EXCLUDE_IDS))))
 
-    activities = cur_sqlite.fetchall()
+    # start_at/week_key se recalculan: en SQLite start_at es un epoch y en PostgreSQL un TIMESTAMP
+    activities = [row + timestamps.start_columns(row[4]) for row in cur_sqlite.fetchall()]
     count = 0
-    for act in activities:
-        # Borrar si existe (por si acaso)
-        cur_pg.execute("DELETE FROM activities WHERE id = %s", (act[0],))
-
-        # Insertar
-        cur_pg.execute("""
-            INSERT INTO activities (
-                id, name, description, private_note, start_date_local,
-                distance, moving_time, elapsed_time, average_speed,
-                average_heartrate, total_elevation_gain, type, sport_type
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, act)
-
-        count += 1
-        if count % 10 == 0:
-            conn_pg.commit()
-            print(f"   ✓ {count}/{total_activities} actividades...")
+    for start in range(0, len(activities), BATCH_SIZE):
+        batch = activities[start:start + BATCH_SIZE]
+        cur_pg.upsert_many("activities", ACTIVITY_COLUMNS, batch, conflict_columns=("id",))
+        conn_pg.commit()
+        count += len(batch)
+        print(f"   ✓ {count}/{total_activities} actividades...")
 
-    conn_pg.commit()
     print(f"   ✅ {count} actividades migradas")
 
     # 2. MIGRAR SPLITS
@@ -91,31 +100,19 @@ def migrate_data():
                elevation_difference, average_speed
         FROM splits
         WHERE activity_id NOT IN ({})
+        ORDER BY rowid
     """.format(','.join(map(str, EXCLUDE_IDS))))
 
-    splits = cur_sqlite.fetchall()
+    splits = unique_rows(cur_sqlite.fetchall(), (0, 1))  # (activity_id, split)
     if splits:
-        # Limpiar splits de actividades migradas
-        cur_pg.execute("""
-            DELETE FROM splits
-            WHERE activity_id NOT IN (%s, %s)
-        """, EXCLUDE_IDS)
-
         count = 0
-        for split in splits:
-            cur_pg.execute("""
-                INSERT INTO splits (
-                    activity_id, split, distance, elapsed_time,
-                    elevation_difference, average_speed
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-            """, split)
-            count += 1
-
-            if count % 100 == 0:
-                conn_pg.commit()
-                print(f"   ✓ {count}/{len(splits)} splits...")
+        for start in range(0, len(splits), BATCH_SIZE):
+            batch = splits[start:start + BATCH_SIZE]
+            cur_pg.upsert_many("splits", SPLIT_COLUMNS, batch, conflict_columns=("activity_id", "split"))
+            conn_pg.commit()
+            count += len(batch)
+            print(f"   ✓ {count}/{len(splits)} splits...")
 
-        conn_pg.commit()
         print(f"   ✅ {count} splits migrados")
     else:
         print(f"   ⚠️  No hay splits para migrar")
@@ -128,46 +125,19 @@ def migrate_data():
                start_index, end_index, total_elevation_gain, pace_zone
         FROM laps
         WHERE activity_id NOT IN ({})
+        ORDER BY rowid
     """.format(','.join(map(str, EXCLUDE_IDS))))
 
-    laps = cur_sqlite.fetchall()
+    laps = unique_rows(cur_sqlite.fetchall(), (0, 2))  # (activity_id, lap_index)
     if laps:
-        # Limpiar laps de actividades migradas
-        cur_pg.execute("""
-            DELETE FROM laps
-            WHERE activity_id NOT IN (%s, %s)
-        """, EXCLUDE_IDS)
-
         count = 0
-        for lap in laps:
-            cur_pg.execute("""
-                INSERT INTO laps (
-                    activity_id, lap_id, lap_index, name, split, start_date_local,
-                    elapsed_time, moving_time, distance, average_speed, max_speed,
-                    start_index, end_index, total_elevation_gain, pace_zone
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (activity_id, lap_index) DO UPDATE SET
-                    lap_id = EXCLUDED.lap_id,
-                    name = EXCLUDED.name,
-                    split = EXCLUDED.split,
-                    start_date_local = EXCLUDED.start_date_local,
-                    elapsed_time = EXCLUDED.elapsed_time,
-                    moving_time = EXCLUDED.moving_time,
-                    distance = EXCLUDED.distance,
-                    average_speed = EXCLUDED.average_speed,
-                    max_speed = EXCLUDED.max_speed,
-                    start_index = EXCLUDED.start_index,
-                    end_index = EXCLUDED.end_index,
-                    total_elevation_gain = EXCLUDED.total_elevation_gain,
-                    pace_zone = EXCLUDED.pace_zone
-            """, lap)
-            count += 1
-
-            if count % 100 == 0:
-                conn_pg.commit()
-                print(f"   ✓ {count}/{len(laps)} laps...")
+        for start in range(0, len(laps), BATCH_SIZE):
+            batch = laps[start:start + BATCH_SIZE]
+            cur_pg.upsert_many("laps", LAP_COLUMNS, batch, conflict_columns=("activity_id", "lap_index"))
+            conn_pg.commit()
+            count += len(batch)
+            print(f"   ✓ {count}/{len(laps)} laps...")
 
-        conn_pg.commit()
         print(f"   ✅ {count} laps migrados")
     else:
         print(f"   ⚠️  No hay laps para migrar")
@@ -178,19 +148,10 @@ def migrate_data():
     plans = cur_sqlite.fetchall()
 
     if plans:
-        for plan in plans:
-            plan_id = plan[0]
-            # Comprobar si existe
-            cur_pg.execute("SELECT id FROM training_plans WHERE id = %s", (plan_id,))
-            exists = cur_pg.fetchone()
-
-            if not exists:
-                cur_pg.execute("""
-                    INSERT INTO training_plans (
-                        id, week_start_date, week_number, goal, notes, created_at, status
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, plan)
-
+        # Solo insertar los que no existan (ON CONFLICT DO NOTHING)
+        cur_pg.upsert_many("training_plans", (
+            "id", "week_start_date", "week_number", "goal", "notes", "created_at", "status"
+        ), plans, conflict_columns=("id",), update_columns=())
         conn_pg.commit()
         print(f"   ✅ {len(plans)} planes migrados")
     else:
@@ -202,19 +163,10 @@ def migrate_data():
     workouts = cur_sqlite.fetchall()
 
     if workouts:
-        for workout in workouts:
-            workout_id = workout[0]
-            cur_pg.execute("SELECT id FROM planned_workouts WHERE id = %s", (workout_id,))
-            exists = cur_pg.fetchone()
-
-            if not exists:
-                cur_pg.execute("""
-                    INSERT INTO planned_workouts (
-                        id, plan_id, date, workout_type, distance_km, description,
-                        pace_objective, notes, status, linked_activity_id, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, workout)
-
+        cur_pg.upsert_many("planned_workouts", (
+            "id", "plan_id", "date", "workout_type", "distance_km", "description",
+            "pace_objective", "notes", "status", "linked_activity_id", "created_at"
+        ), workouts, conflict_columns=("id",), update_columns=())
         conn_pg.commit()
         print(f"   ✅ {len(workouts)} entrenamientos planificados migrados")
     else:
@@ -226,15 +178,14 @@ def migrate_data():
     profile = cur_sqlite.fetchone()
 
     if profile:
-        cur_pg.execute("DELETE FROM runner_profile")
-        cur_pg.execute("""
-            INSERT INTO runner_profile (
-                id, name, height_cm, weight_kg, age, vo2max_estimate,
-                threshold_pace, easy_pace_min, easy_pace_max, training_philosophy,
-                current_goal, goal_race_date, goal_race_distance,
-                pr_5k, pr_10k, pr_half, pr_marathon, created_at, updated_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, profile)
+        cur_pg.upsert_many("runner_profile", (
+            "id", "name", "height_cm", "weight_kg", "age", "vo2max_estimate",
+            "threshold_pace", "easy_pace_min", "easy_pace_max", "training_philosophy",
+            "current_goal", "goal_race_date", "goal_race_distance",
+            "pr_5k", "pr_10k", "pr_half", "pr_marathon", "created_at", "updated_at"
+        ), [profile], conflict_columns=("id",))
+        # Un único perfil: eliminar cualquier otro que hubiera en destino
+        cur_pg.execute("DELETE FROM runner_profile WHERE id != ?", (profile[0],))
 
         conn_pg.commit()
         print(f"   ✅ Perfil migrado")
@@ -247,23 +198,20 @@ def migrate_data():
     chats = cur_sqlite.fetchall()
 
     if chats:
-        for chat in chats:
-            chat_id = chat[0]
-            cur_pg.execute("SELECT id FROM chat_history WHERE id = %s", (chat_id,))
-            exists = cur_pg.fetchone()
-
-            if not exists:
-                cur_pg.execute("""
-                    INSERT INTO chat_history (
-                        id, role, content, timestamp, context_summary
-                    ) VALUES (%s, %s, %s, %s, %s)
-                """, chat)
-
+        cur_pg.upsert_many("chat_history", (
+            "id", "role", "content", "timestamp", "context_summary"
+        ), chats, conflict_columns=("id",), update_columns=())
         conn_pg.commit()
         print(f"   ✅ {len(chats)} mensajes del chat migrados")
     else:
         print(f"   ⚠️  No hay historial de chat para migrar")
 
+    # Las actividades se han copiado sin pasar por _store_activities: recalcular los agregados
+    print(f"\n📊 Recalculando agregados semanales y mensuales...")
+    weeks, months = rollups.rebuild(cur_pg)
+    conn_pg.commit()
+    print(f"   ✅ {weeks} semanas y {months} meses")
+
     # Cerrar conexiones
     conn_sqlite.close()
     conn_pg.close()
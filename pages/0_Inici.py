@@ -3,6 +3,8 @@ import streamlit as st
 import os
 from strava_client import sync_new_activities
 from utils.db_config import get_database_url, is_postgres
+from utils.data_processing import refresh_data
+from utils.sync_worker import STATUS_DONE, get_job, is_active, latest_job, start_sync_job
 from i18n import t
 from auth import check_password, add_logout_button
 
@@ -30,17 +32,44 @@ st.markdown(t("app_description"))
 # --- BARRA LATERAL (SIDEBAR) ---
 st.sidebar.title(t("sidebar_options"))
 
-# Botó per refrescar activitats
-if st.sidebar.button(t("refresh_activities")):
-    with st.spinner(t("syncing_activities")):
-        try:
-            sync_new_activities('data/strava_activities.db')
-            st.success(t("activities_updated"))
-            # Netegem la caché de dades per forçar la recàrrega
-            st.cache_data.clear()
-            st.rerun()
-        except Exception as e:
-            st.error(t("sync_error", error=str(e)))
+# Botó per refrescar activitats: la sincronització corre en segon pla (utils/sync_worker.py),
+# així la pàgina no es bloqueja i refrescar el navegador no llança una segona sincronització
+current_job = latest_job("sync")
+if is_active(current_job):
+    st.session_state["sync_job_id"] = current_job["id"]
+
+if st.sidebar.button(t("refresh_activities"), disabled=is_active(current_job)):
+    current_job = start_sync_job(sync_new_activities, db_path='data/strava_activities.db')
+    st.session_state["sync_job_id"] = current_job["id"]
+
+
+# Mentre el treball està actiu, el fragment es torna a executar sol cada 2 segons
+@st.fragment(run_every=2 if is_active(current_job) else None)
+def sync_status():
+    job = get_job(st.session_state["sync_job_id"])
+    if job is None:
+        return
+    if is_active(job):
+        st.info(t("syncing_activities_progress", page=job["page"] or 1, processed=job["processed"]))
+        return
+
+    if st.session_state.get("sync_job_seen") != job["id"]:
+        st.session_state["sync_job_seen"] = job["id"]
+        if job["status"] == STATUS_DONE:
+            # Afegim a la caché només les activitats sincronitzades (sense recarregar tot l'historial)
+            refresh_data(job["result"] or [])
+        # Rerun complet: atura el polling i torna a pintar la pàgina amb les dades noves
+        st.rerun()
+
+    if job["status"] == STATUS_DONE:
+        st.success(t("activities_updated"))
+    else:
+        st.error(t("sync_error", error=job["error"]))
+
+
+if "sync_job_id" in st.session_state:
+    with st.sidebar:
+        sync_status()
 
 # DEBUG: Mostrar info de base de datos
 db_url = get_database_url()
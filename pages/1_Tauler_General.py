@@ -6,7 +6,7 @@ import plotly.express as px
 from datetime import datetime, timedelta
 
 # Importar utilitats
-from utils.data_processing import load_data, get_timezone_aware_datetime
+from utils.data_processing import load_data, load_period_volume, get_timezone_aware_datetime
 from utils.formatting import format_time, format_pace
 from i18n import t, DAY_NAMES_ES_TO_CA, DAY_NAMES_SHORT, TRAINING_ZONES_CA
 from auth import check_password, add_logout_button
@@ -51,9 +51,14 @@ long_run_km = st.sidebar.slider(t("long_run_definition"), 8.0, 35.0, 16.0, 1.0,
 show_coach_tips = st.sidebar.checkbox(t("show_coach_tips"), value=True, key="dash_show_tips")
 
 # Aplicar filtros
+period_start = period_end = None
 if len(date_range) == 2:
     start_date = get_timezone_aware_datetime(datetime.combine(date_range[0], datetime.min.time()))
     end_date = get_timezone_aware_datetime(datetime.combine(date_range[1], datetime.max.time()))
+    # Amb tot l'històric seleccionat, els agregats setmanals/mensuals surten de les taules de rollup
+    if tuple(date_range) != (min_date, max_date):
+        period_start = datetime.combine(date_range[0], datetime.min.time())
+        period_end = datetime.combine(date_range[1], datetime.max.time())
     mask = (
         (activities['start_date_local'] >= start_date) &
         (activities['start_date_local'] <= end_date) &
@@ -69,18 +74,13 @@ if filtered_activities.empty:
 
 # ---------- ENRIQUECER DATA Y HELPERS ----------
 filtered_activities['start_hour'] = filtered_activities['start_date_local'].dt.hour
-# Semana que empieza el lunes; convertimos Period->Timestamp con .start_time
-filtered_activities['week'] = filtered_activities['start_date_local'].dt.to_period('W-MON').apply(lambda r: r.start_time)
 filtered_activities['is_long_run'] = filtered_activities['distance_km'] >= long_run_km
 
-def compute_weekly(df: pd.DataFrame) -> pd.DataFrame:
-    weekly = df.groupby('week').agg(
-        distance_km=('distance_km', 'sum'),
-        runs=('id', 'count'),
-        moving_time=('moving_time', 'sum'),
-        avg_pace=('pace_min_km', 'mean'),
-        long_runs=('is_long_run', 'sum'),
-    ).reset_index().sort_values('week')
+def compute_weekly() -> pd.DataFrame:
+    """Volum setmanal (setmanes de dilluns) agregat a la BD amb els mateixos filtres."""
+    weekly = load_period_volume("week", period_start, period_end, min_distance, long_run_km)
+    weekly = weekly.rename(columns={'bucket': 'week'})
+    weekly['week'] = pd.to_datetime(weekly['week'])
     weekly['km_4w_avg'] = weekly['distance_km'].rolling(4, min_periods=1).mean()
     return weekly
 
@@ -112,7 +112,7 @@ def compute_pr(df: pd.DataFrame, target_km: float, tol: float = 0.03):
     pace_min_km = (best['est_time_s'] / 60) / target_km
     return int(best['est_time_s']), pace_min_km, best
 
-weekly = compute_weekly(filtered_activities)
+weekly = compute_weekly()
 last4 = weekly.tail(4)
 prev4 = weekly.iloc[-8:-4] if len(weekly) >= 8 else pd.DataFrame(columns=weekly.columns)
 vol_change = None
@@ -185,9 +185,8 @@ with colg1:
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.subheader("Evolució de la distància mensual")
-        monthly_data = filtered_activities.groupby('month_year').agg(
-            distance_km=('distance_km', 'sum')
-        ).reset_index()
+        monthly_data = load_period_volume("month", period_start, period_end, min_distance, long_run_km)
+        monthly_data = monthly_data.rename(columns={'bucket': 'month_year'})
         fig = px.bar(monthly_data, x='month_year', y='distance_km',
                      labels={'distance_km': t('distance_km'), 'month_year': 'Mes'})
         st.plotly_chart(fig, use_container_width=True)
@@ -274,11 +273,8 @@ else:
 
 # --- QUALITAT DE RITME: Estabilitat per splits ---
 st.subheader("Estabilitat de ritme per cursa (variació en splits)")
-# Asegura que pace_min_km es numérico
-split_source = splits.copy()
-split_source['pace_min_km'] = pd.to_numeric(split_source['pace_min_km'], errors='coerce')
-
-split_stats = split_source.groupby('activity_id').agg(
+# pace_min_km ja és float32 (NaN si no hi ha dades) des de load_data()
+split_stats = splits.groupby('activity_id').agg(
     mean_pace=('pace_min_km', 'mean'),
     std_pace=('pace_min_km', 'std'),
     n_splits=('pace_min_km', 'count')
@@ -181,19 +181,8 @@ if not activity_splits.empty:
 
     x = _get_split_no(activity_splits)
 
-    dist_m = pd.to_numeric(activity_splits.get('distance', pd.Series(index=activity_splits.index)), errors='coerce')
-    elap_s  = pd.to_numeric(activity_splits.get('elapsed_time', pd.Series(index=activity_splits.index)), errors='coerce')
-    avg_v  = pd.to_numeric(activity_splits.get('average_speed', pd.Series(index=activity_splits.index)), errors='coerce')
-
-    def _pace_min_km(distance_m, elapsed_time_s, avg_speed_mps):
-        # Prioriza velocidad media si está disponible; si no, calcula por distancia/tiempo.
-        if pd.notnull(avg_speed_mps) and avg_speed_mps > 0:
-            return 16.6666667 / float(avg_speed_mps)  # (1000/60) / m/s
-        if pd.notnull(distance_m) and pd.notnull(elapsed_time_s) and distance_m > 0 and elapsed_time_s > 0:
-            return (float(elapsed_time_s) / float(distance_m)) * (1000.0 / 60.0)
-        return None
-
-    pace = [ _pace_min_km(dm, et, spd) for dm, et, spd in zip(dist_m, elap_s, avg_v) ]
+    # Prioritza el ritme per velocitat mitjana; si no n'hi ha, el de distància/temps (ja calculats a load_data)
+    pace = activity_splits['pace_from_speed'].fillna(activity_splits['pace_min_km'])
 
     # IMPORTANT: Crear perfil d'elevació acumulat (com Strava)
     has_elev = 'elevation_difference' in activity_splits.columns
@@ -236,14 +225,14 @@ if not activity_splits.empty:
             line=dict(width=2, dash="dot"),
             marker=dict(size=6),
             hovertemplate="Km: %{x}<br>Ritme: %{text}<extra></extra>",
-            text=[format_pace(p) if p is not None else t("not_available") for p in pace],
+            text=[format_pace(p) for p in pace],
             connectgaps=False
         ),
         secondary_y=True
     )
 
     # Línia mitjana de ritme (sobre y2) si hi ha dades vàlides
-    pace_series = pd.Series([p for p in pace if p is not None])
+    pace_series = pace.dropna()
     if not pace_series.empty:
         avg_pace = float(pace_series.mean())
         fig.add_shape(
@@ -155,7 +155,7 @@ def save_chat_to_db(role: str, content: str):
 
 def load_chat_history(limit: int = 50):
     """Carrega l'historial de xat des de la BD."""
-    conn = get_connection()
+    conn = get_connection(read_only=True)
     cur = conn.cursor()
     cur.execute("""
         SELECT role, content, timestamp
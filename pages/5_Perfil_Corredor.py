@@ -27,7 +27,7 @@ st.markdown(t("profile_description"))
 
 def get_current_profile():
     """Obté el perfil actual de la base de dades."""
-    conn = get_connection()
+    conn = get_connection(read_only=True)
     cur = conn.cursor()
     cur.execute("SELECT * FROM runner_profile ORDER BY updated_at DESC LIMIT 1")
     row = cur.fetchone()
@@ -0,0 +1,9 @@
+# rebuild_from_archive.py
+# como usar: python rebuild_from_archive.py
+# Regenera activities/splits/laps desde las respuestas de Strava archivadas (tabla raw_archive),
+# sin llamar a la API. Funciona con SQLite local o PostgreSQL (Supabase)
+
+from strava_client import rebuild_from_archive
+
+if __name__ == "__main__":
+    rebuild_from_archive()
@@ -0,0 +1,9 @@
+# rebuild_rollups.py
+# como usar: python rebuild_rollups.py
+# Recalcula desde cero los agregados semanales y mensuales (weekly_rollup / monthly_rollup)
+# a partir de activities. Funciona con SQLite local o PostgreSQL (Supabase)
+
+from strava_client import rebuild_rollups
+
+if __name__ == "__main__":
+    rebuild_rollups()
@@ -1,13 +1,34 @@
+from contextlib import contextmanager
+import contextvars
 from datetime import datetime
+import hashlib
+import json
 import os
-import requests
+import ssl
+import threading
+import httpx
 from dotenv import load_dotenv
-from time import sleep
+from time import sleep, monotonic
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
 import sys
 
 # Añadir directorio actual al path para imports
 sys.path.insert(0, os.path.dirname(__file__))
 from utils.db_config import get_connection, is_postgres
+from utils.rate_limit import RateLimitScheduler, RETRYABLE_STATUS
+from utils.analytics_cache import bump_sync_generation
+from utils import sync_state
+from utils import oauth_tokens
+from utils import sync_worker
+from utils import raw_archive
+from utils import streams
+from utils import activity_jobs
+from utils import athletes
+from utils import migrations
+from utils import timestamps
+from utils import rollups
 
 load_dotenv(override=True)
 
@@ -29,18 +50,244 @@ REFRESH_TOKEN = get_secret("STRAVA_REFRESH_TOKEN")
 PROXY_CERT_PATH = os.path.expanduser("~/Credentials/rootcaCert.pem")
 PROXY_CERT = PROXY_CERT_PATH if os.path.exists(PROXY_CERT_PATH) else True
 
+# Timeouts de las peticiones HTTP (segundos): sin ellos un socket colgado bloquea la sync para siempre
+HTTP_CONNECT_TIMEOUT = float(os.getenv("STRAVA_HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("STRAVA_HTTP_READ_TIMEOUT", 30))
 
-def get_access_token():
-    url = "https://www.strava.com/api/v3/oauth/token"
+# HTTP/2 solo si está instalado el extra 'h2' (pip install httpx[http2]) y no se ha desactivado
+HTTP2_ENABLED = os.getenv("STRAVA_HTTP2", "1").lower() not in ("0", "false", "no")
+
+# Configurable para poder apuntar a un servidor Strava falso en pruebas locales
+STRAVA_API_URL = os.getenv("STRAVA_API_URL", "https://www.strava.com/api/v3")
+
+# Límites iniciales de Strava (por aplicación): se corrigen con las cabeceras X-RateLimit-*
+RATE_LIMIT_15MIN = int(os.getenv("STRAVA_RATE_LIMIT_15MIN", 100))
+RATE_LIMIT_DAILY = int(os.getenv("STRAVA_RATE_LIMIT_DAILY", 1000))
+
+# Número de descargas de detalle/laps en paralelo durante la sincronización
+MAX_WORKERS = int(os.getenv("STRAVA_SYNC_WORKERS", 4))
+
+# Actividades por commit: lo máximo que se pierde (y se vuelve a descargar) si la sync se corta
+SYNC_BATCH_SIZE = int(os.getenv("STRAVA_SYNC_BATCH_SIZE", 20))
+
+# Errores de Strava que no se arreglan reintentando: actividad privada (403) o borrada (404)
+PERMANENT_STATUS = {403, 404}
+
+# Sincronización de varios atletas (club): atletas en paralelo y descargas en paralelo por atleta
+ATHLETE_WORKERS = int(os.getenv("STRAVA_ATHLETE_WORKERS", 4))
+ATHLETE_FETCH_WORKERS = int(os.getenv("STRAVA_ATHLETE_FETCH_WORKERS", 2))
+
+# Peticiones diarias que los backfills dejan libres para las sincronizaciones de la app
+BACKFILL_DAILY_RESERVE = int(os.getenv("STRAVA_BACKFILL_DAILY_RESERVE", 100))
+
+# Descargar también los streams (FC, ritmo, altitud... muestra a muestra) de cada actividad sincronizada
+SYNC_STREAMS = os.getenv("STRAVA_SYNC_STREAMS", "1").lower() not in ("0", "false", "no")
+
+# Planificador compartido por todas las llamadas a Strava (todos los hilos)
+scheduler = RateLimitScheduler(RATE_LIMIT_15MIN, RATE_LIMIT_DAILY)
+
+# Presupuesto propio del atleta que se está sincronizando (None con un solo atleta)
+_athlete_budget = contextvars.ContextVar("athlete_budget", default=None)
+_athlete_budgets = {}
+_athlete_budgets_lock = threading.Lock()
+
+
+def athlete_budget(athlete_id: int) -> RateLimitScheduler:
+    """
+    Parte del presupuesto de la aplicación reservada a un atleta.
+
+    Los límites de Strava son por aplicación: cada atleta recibe 1/ATHLETE_WORKERS de cada
+    ventana, así que una cuenta con mucho historial no puede gastar el presupuesto del resto.
+    """
+    with _athlete_budgets_lock:
+        if athlete_id not in _athlete_budgets:
+            _athlete_budgets[athlete_id] = RateLimitScheduler(
+                max(1, RATE_LIMIT_15MIN // ATHLETE_WORKERS), max(1, RATE_LIMIT_DAILY // ATHLETE_WORKERS))
+        return _athlete_budgets[athlete_id]
+
+
+@contextmanager
+def athlete_scope(athlete_id):
+    """Las peticiones a Strava dentro del bloque cuentan contra el presupuesto del atleta."""
+    token = _athlete_budget.set(athlete_budget(athlete_id) if athlete_id is not None else None)
+    try:
+        yield
+    finally:
+        _athlete_budget.reset(token)
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Cliente HTTP compartido por todas las llamadas a Strava (todos los hilos).
+
+    Mantiene las conexiones abiertas (keep-alive) y las reutiliza entre peticiones, así que
+    cada actividad no paga un handshake TCP+TLS nuevo contra el proxy.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                verify = ssl.create_default_context(cafile=PROXY_CERT) if PROXY_CERT is not True else True
+                pool_size = max(MAX_WORKERS, ATHLETE_WORKERS * ATHLETE_FETCH_WORKERS) * 2
+                _http_client = httpx.Client(
+                    verify=verify,
+                    http2=HTTP2_ENABLED and _http2_available(),
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                )
+    return _http_client
+
+
+def close_http_client():
+    """Cierra las conexiones abiertas (el siguiente get_http_client() crea un cliente nuevo)."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def strava_request(method: str, url: str, **kwargs):
+    """
+    Ejecuta una petición a Strava a través del planificador de rate limit.
+
+    - Espera turno según el presupuesto restante (cabeceras X-RateLimit-*) y, dentro de
+      athlete_scope(), según la parte del presupuesto del atleta.
+    - En un 429 espera al reinicio de la ventana (o Retry-After) y reintenta.
+    - Reintenta con backoff exponencial los 5xx transitorios y los errores de red
+      (incluidos los timeouts de conexión y lectura).
+    - En un 401 con cabeceras AuthHeaders renueva el access token y reintenta una vez.
+    Devuelve la respuesta ya validada con raise_for_status().
+    """
+    attempt = 0
+    renewed = False
+    budget = _athlete_budget.get()
+    while True:
+        if budget is not None:
+            budget.acquire()
+        scheduler.acquire()
+        try:
+            resp = get_http_client().request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt >= scheduler.max_retries:
+                raise
+            delay = scheduler.backoff_delay(attempt)
+            print(f"⚠️  Error de red con Strava ({e}), reintentando en {delay:.1f}s...")
+            sleep(delay)
+            attempt += 1
+            continue
+
+        scheduler.update_from_headers(resp.headers)
+
+        headers = kwargs.get("headers")
+        if resp.status_code == 401 and isinstance(headers, AuthHeaders) and not renewed:
+            print("🔑 Strava ha rechazado el access token (401), renovándolo...")
+            headers.renew(resp.request.headers.get("Authorization"))
+            renewed = True
+            continue
+
+        if resp.status_code == 429 and attempt < scheduler.max_retries:
+            wait = scheduler.on_throttled(resp.headers.get("Retry-After"))
+            print("⏳ Strava ha devuelto 429, esperando al reinicio de la ventana...")
+            sleep(wait)
+            attempt += 1
+            continue
+
+        if resp.status_code in RETRYABLE_STATUS and attempt < scheduler.max_retries:
+            delay = scheduler.backoff_delay(attempt)
+            print(f"⚠️  Strava ha devuelto {resp.status_code}, reintentando en {delay:.1f}s...")
+            sleep(delay)
+            attempt += 1
+            continue
+
+        resp.raise_for_status()
+        return resp
+
+
+def refresh_access_token(refresh_token: str):
+    """Pide a Strava un access token nuevo. Devuelve el JSON (access_token, refresh_token, expires_at)."""
+    url = f"{STRAVA_API_URL}/oauth/token"
     payload = {
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET,
-        "refresh_token": REFRESH_TOKEN,
+        "refresh_token": refresh_token,
         "grant_type": "refresh_token",
     }
-    response = requests.post(url, data=payload, verify=PROXY_CERT)
-    response.raise_for_status()
-    return response.json()["access_token"]
+    response = strava_request("POST", url, data=payload)
+    return response.json()
+
+
+def get_access_token(athlete_id=None):
+    """
+    Access token vigente: de la caché (memoria / tabla oauth_tokens) o renovado si está por caducar.
+
+    Sin athlete_id se usa STRAVA_REFRESH_TOKEN; con athlete_id, el refresh token del atleta en
+    la tabla athletes (cada atleta tiene su propia entrada en oauth_tokens).
+    """
+    if athlete_id is None:
+        return oauth_tokens.get_access_token(_token_client_id(None), REFRESH_TOKEN, refresh_access_token)
+
+    conn = get_connection()
+    try:
+        refresh_token = athletes.get_refresh_token(conn.cursor(), athlete_id)
+    finally:
+        conn.close()
+    if refresh_token is None:
+        raise RuntimeError(f"El atleta {athlete_id} no está registrado en la tabla athletes")
+    return oauth_tokens.get_access_token(_token_client_id(athlete_id), refresh_token, refresh_access_token)
+
+
+def _token_client_id(athlete_id=None) -> str:
+    """Clave del token en oauth_tokens."""
+    return CLIENT_ID if athlete_id is None else f"{CLIENT_ID}:athlete:{athlete_id}"
+
+
+class AuthHeaders(dict):
+    """
+    Cabeceras con el access token de un atleta (o de STRAVA_REFRESH_TOKEN sin athlete_id).
+
+    Es el mismo dict para todos los hilos de un lote: si Strava rechaza el token con un 401
+    (revocado, o renovado por otro proceso), strava_request() llama a renew() y reintenta.
+    """
+
+    def __init__(self, athlete_id=None):
+        super().__init__(Authorization=f"Bearer {get_access_token(athlete_id)}")
+        self.athlete_id = athlete_id
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Vuelve a pedir el token vigente (de la caché; se renueva si está por caducar)."""
+        with self._lock:
+            self["Authorization"] = f"Bearer {get_access_token(self.athlete_id)}"
+
+    def renew(self, rejected: str):
+        """Sustituye el token rechazado ('Bearer ...'), salvo que otro hilo ya lo haya hecho."""
+        with self._lock:
+            if self.get("Authorization") != rejected:
+                return
+            oauth_tokens.invalidate(_token_client_id(self.athlete_id), rejected.removeprefix("Bearer "))
+            self["Authorization"] = f"Bearer {get_access_token(self.athlete_id)}"
+
+
+def _auth_headers(athlete_id=None) -> AuthHeaders:
+    return AuthHeaders(athlete_id)
+
+
+def _table_columns(cur, table: str):
+    """Columnas existentes de una tabla (para las migraciones "suaves")."""
+    return migrations.table_columns(cur, table, is_postgres())
 
 
 def init_db(db_path: str):
@@ -65,7 +312,9 @@ def init_db(db_path: str):
             average_heartrate REAL,
             total_elevation_gain REAL,
             type TEXT,
-            sport_type TEXT
+            sport_type TEXT,
+            summary_hash TEXT,
+            athlete_id BIGINT
         )
     """)
 
@@ -182,323 +431,887 @@ def init_db(db_path: str):
         )
     """)
 
-    # Migración "suave": añade columnas si la tabla ya existía
-    if is_postgres():
-        # PostgreSQL: usar information_schema
-        cur.execute("""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_name = 'activities'
-        """)
-        cols = [row[0] for row in cur.fetchall()]
-    else:
-        # SQLite: usar PRAGMA
-        cur.execute("PRAGMA table_info(activities)")
-        cols = [row[1] for row in cur.fetchall()]
+    # Registro de progreso de las sincronizaciones (reanudables)
+    sync_state.create_tables(cur)
 
+    # Caché del access token de Strava
+    oauth_tokens.create_table(cur)
+
+    # Trabajos de sincronización en segundo plano lanzados desde la app
+    sync_worker.create_table(cur)
+
+    # Respuestas crudas de Strava (comprimidas) para poder regenerar las tablas sin la API
+    raw_archive.create_table(cur, is_postgres())
+
+    # Streams por actividad, un array binario por tipo
+    streams.create_table(cur, is_postgres())
+
+    # Cola de actividades a descargar/borrar, alimentada por el webhook de Strava
+    activity_jobs.create_table(cur)
+
+    # Atletas sincronizados (club); vacía con un solo atleta
+    athletes.create_table(cur)
+
+    # Agregados semanales y mensuales, mantenidos en cada escritura de activities
+    rollups.create_tables(cur)
+
+    # Contadores internos (p.ej. la generación de datos que invalida el snapshot Parquet)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_meta (
+            key TEXT PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Migración "suave": añade columnas si la tabla ya existía
+    cols = _table_columns(cur, "activities")
     if "description" not in cols:
         cur.execute("ALTER TABLE activities ADD COLUMN description TEXT")
     if "private_note" not in cols:
         cur.execute("ALTER TABLE activities ADD COLUMN private_note TEXT")
+    if "summary_hash" not in cols:
+        cur.execute("ALTER TABLE activities ADD COLUMN summary_hash TEXT")
+    if "athlete_id" not in cols:
+        cur.execute("ALTER TABLE activities ADD COLUMN athlete_id BIGINT")
+    if "athlete_id" not in _table_columns(cur, "activity_jobs"):
+        cur.execute("ALTER TABLE activity_jobs ADD COLUMN athlete_id BIGINT")
+
+    # Clave única de splits para poder hacer upsert (ON CONFLICT necesita un índice único).
+    # La primera vez se eliminan posibles duplicados de bases de datos antiguas.
+    if is_postgres():
+        cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'idx_splits_activity_split'")
+    else:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_splits_activity_split'")
+    if not cur.fetchone():
+        if is_postgres():
+            cur.execute("""
+                DELETE FROM splits a USING splits b
+                WHERE a.ctid > b.ctid AND a.activity_id = b.activity_id AND a.split = b.split
+            """)
+        else:
+            cur.execute("""
+                DELETE FROM splits
+                WHERE rowid NOT IN (SELECT MIN(rowid) FROM splits GROUP BY activity_id, split)
+            """)
+        cur.execute("CREATE UNIQUE INDEX idx_splits_activity_split ON splits (activity_id, split)")
 
     conn.commit()
-    conn.close()
+
+    # Migraciones versionadas (índices de los caminos calientes, etc.)
+    try:
+        migrations.run_migrations(conn)
+    finally:
+        conn.close()
+
+def strava_get(url: str, headers: dict, params: dict = None):
+    """GET a la API de Strava (pasa por el planificador) y devuelve el JSON."""
+    return strava_request("GET", url, headers=headers, params=params).json()
+
+
+def fetch_activity_detail(headers, activity_id: int):
+    return strava_get(f"{STRAVA_API_URL}/activities/{activity_id}", headers)
+
 
 def fetch_laps(headers, activity_id: int):
-    url = f"https://www.strava.com/api/v3/activities/{activity_id}/laps"
-    resp = requests.get(url, headers=headers, verify=PROXY_CERT)
-    resp.raise_for_status()
-    return resp.json()  # lista de Laps
+    return strava_get(f"{STRAVA_API_URL}/activities/{activity_id}/laps", headers)  # lista de Laps
 
-def download_and_store_runs(db_path="data/strava_activities.db", max_pages=50):
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
 
-    init_db(db_path)
-    conn = get_connection()
-    cur = conn.cursor()
+def fetch_streams(headers, activity_id: int):
+    """Streams de la actividad, indexados por tipo ({'time': {'data': [...]}, ...})."""
+    params = {"keys": ",".join(streams.STREAM_TYPES), "key_by_type": "true"}
+    return strava_get(f"{STRAVA_API_URL}/activities/{activity_id}/streams", headers, params=params)
+
+
+def fetch_activity_bundle(headers, activity_id: int):
+    """Descarga detalle y laps de una actividad. Devuelve (activity_id, detail, laps)."""
+    detail = fetch_activity_detail(headers, activity_id)
+    laps = fetch_laps(headers, activity_id)
+    return activity_id, detail, laps
+
+
+def _is_permanent_error(exc: Exception) -> bool:
+    """
+    Errores que no se arreglan reintentando: actividad privada (403) o borrada (404).
+
+    Un 401 (token caducado o revocado) o un error de red es transitorio: se propaga y el
+    lote se reintenta sin avanzar el progreso.
+    """
+    response = getattr(exc, "response", None)
+    return (isinstance(exc, httpx.HTTPStatusError) and response is not None
+            and response.status_code in PERMANENT_STATUS)
+
+
+def _fetch_or_error(fetch, headers, activity_id: int):
+    """Ejecuta fetch(headers, activity_id) y devuelve (resultado, None), o (None, error) si el error es permanente."""
+    try:
+        return fetch(headers, activity_id), None
+    except httpx.HTTPStatusError as e:
+        if _is_permanent_error(e):
+            return None, e
+        raise
+
+
+def _fetch_parallel(fetch, headers, activity_ids, max_workers: int = MAX_WORKERS):
+    """
+    Ejecuta fetch(headers, activity_id) en paralelo con un pool acotado de hilos.
+
+    Devuelve (activity_id, resultado, error) en el mismo orden que 'activity_ids', de
+    modo que la escritura en BD (siempre desde el hilo llamante) mantiene el orden original.
+    Los errores permanentes (404, 403...) se devuelven en 'error' para poder seguir con el
+    resto; los transitorios que agotan los reintentos se propagan al iterar.
+    """
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return
+    workers = max(1, min(max_workers, len(activity_ids)))
+    # Cada tarea hereda el contexto del llamante (p.ej. el presupuesto del atleta de athlete_scope())
+    contexts = [contextvars.copy_context() for _ in activity_ids]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda act_id, ctx: ctx.run(_fetch_or_error, fetch, headers, act_id),
+                               activity_ids, contexts)
+        for act_id, (result, error) in zip(activity_ids, results):
+            yield act_id, result, error
+
+
+def fetch_activity_bundles(headers, activity_ids, max_workers: int = MAX_WORKERS):
+    """
+    Descarga detalle y laps de varias actividades en paralelo (ver _fetch_parallel).
+
+    Devuelve ((activity_id, detail, laps), error); con error, detail y laps son None.
+    """
+    for act_id, bundle, error in _fetch_parallel(fetch_activity_bundle, headers, activity_ids, max_workers):
+        yield (bundle or (act_id, None, None)), error
+
+
+def _fetch_streams(headers, activity_ids, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Descarga en paralelo (sin tocar la BD) los streams de las actividades indicadas.
+
+    Las que dan un error permanente (p.ej. actividades manuales sin streams) se avisan y se omiten.
+
+    Returns:
+        {activity_id: payload}, para streams.store_streams()
+    """
+    fetched = {}
+    for act_id, payload, error in _fetch_parallel(fetch_streams, headers, activity_ids, max_workers):
+        if error is not None:
+            print(f"⚠️  Streams de {act_id} no disponibles: {error}")
+        else:
+            fetched[act_id] = payload
+    return fetched
+
+
+def list_activities(headers, page: int, per_page: int = 100, after: int = None):
+    params = {"per_page": per_page, "page": page}
+    if after is not None:
+        params["after"] = after
+    return strava_get(f"{STRAVA_API_URL}/athlete/activities", headers, params=params)
+
+
+ACTIVITY_COLUMNS = (
+    "id", "name", "description", "private_note", "start_date_local", "distance", "moving_time",
+    "elapsed_time", "average_speed", "average_heartrate", "total_elevation_gain", "type", "sport_type", "athlete_id",
+    "start_at", "week_key",
+)
+SPLIT_COLUMNS = ("activity_id", "split", "distance", "elapsed_time", "elevation_difference", "average_speed")
+LAP_COLUMNS = (
+    "activity_id", "lap_id", "lap_index", "name", "split", "start_date_local", "elapsed_time", "moving_time",
+    "distance", "average_speed", "max_speed", "start_index", "end_index", "total_elevation_gain", "pace_zone",
+)
+
+
+def activity_row(detail):
+    return (
+        detail["id"],
+        detail["name"],
+        detail.get("description"),
+        detail.get("private_note"),
+        detail["start_date_local"],
+        detail["distance"],
+        detail["moving_time"],
+        detail["elapsed_time"],
+        detail.get("average_speed"),
+        detail.get("average_heartrate"),
+        detail.get("total_elevation_gain"),
+        detail["type"],
+        detail["sport_type"],
+        (detail.get("athlete") or {}).get("id"),
+    ) + timestamps.start_columns(detail["start_date_local"])
+
+
+def split_rows(detail):
+    return [
+        (
+            detail["id"],
+            split["split"],
+            split["distance"],
+            split["elapsed_time"],
+            split.get("elevation_difference"),
+            split["average_speed"],
+        )
+        for split in detail.get("splits_metric", [])
+    ]
+
+
+def lap_rows(activity_id: int, laps):
+    return [
+        (
+            activity_id,
+            lap.get("id"),
+            lap.get("lap_index"),
+            lap.get("name"),
+            lap.get("split"),
+            lap.get("start_date_local"),
+            lap.get("elapsed_time"),
+            lap.get("moving_time"),
+            lap.get("distance"),
+            lap.get("average_speed"),
+            lap.get("max_speed"),
+            lap.get("start_index"),
+            lap.get("end_index"),
+            lap.get("total_elevation_gain"),
+            lap.get("pace_zone"),
+        )
+        for lap in laps
+    ]
+
+
+# Campos del resumen de /athlete/activities que cambian cuando se edita la actividad.
+# (description y private_note no vienen en el resumen: solo se detectan con force=True)
+SUMMARY_HASH_FIELDS = (
+    "name", "type", "sport_type", "start_date_local", "distance", "moving_time", "elapsed_time",
+    "total_elevation_gain", "average_speed", "max_speed", "average_heartrate", "workout_type",
+    "private", "upload_id", "updated_at",
+)
+
+
+def summary_hash(summary) -> str:
+    """Huella del resumen de una actividad, para saber si hace falta volver a pedir detalle y laps."""
+    fields = {key: summary.get(key) for key in SUMMARY_HASH_FIELDS}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
 
-    page = 1
-    total_inserted = 0
 
-    while page <= max_pages:
+def _stored_hashes(cur, activity_ids):
+    """{activity_id: summary_hash} de las actividades ya guardadas."""
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in activity_ids)
+    cur.execute(f"SELECT id, summary_hash FROM activities WHERE id IN ({placeholders})", activity_ids)
+    return dict(cur.fetchall())
+
+
+def _trim_children(cur, table: str, index_column: str, rows_by_activity):
+    """
+    Borra las filas hijas sobrantes (p.ej. si una actividad pasa de 12 a 10 laps).
+
+    Como los índices de split/lap empiezan en 1, con máximo 0 se borran todas.
+    """
+    cur.executemany(
+        f"DELETE FROM {table} WHERE activity_id = ? AND {index_column} > ?",
+        [(act_id, max((row[0] for row in indexes), default=0)) for act_id, indexes in rows_by_activity.items()],
+    )
+
+
+def _store_laps(cur, laps_by_activity, archive=True):
+    """
+    Upsert en bloque de los laps de varias actividades. 'laps_by_activity' es {activity_id: laps}.
+
+    Con archive=True también se guarda la respuesta cruda en raw_archive.
+    """
+    if not laps_by_activity:
+        return
+    if archive:
+        raw_archive.archive(cur, raw_archive.KIND_LAPS, laps_by_activity.items())
+    rows_by_activity = {act_id: lap_rows(act_id, laps) for act_id, laps in laps_by_activity.items()}
+    cur.upsert_many("laps", LAP_COLUMNS, [row for rows in rows_by_activity.values() for row in rows],
+                    conflict_columns=("activity_id", "lap_index"))
+    _trim_children(cur, "laps", "lap_index",
+                   {act_id: [(row[2],) for row in rows] for act_id, rows in rows_by_activity.items()})
+    bump_sync_generation(cur)
+
+
+def _store_activities(cur, bundles, summary_hashes=None, archive=True):
+    """
+    Upsert en bloque de un lote de actividades con sus splits y laps.
+
+    'bundles' es una lista de (detail, laps) (laps=None deja los laps guardados como están);
+    'summary_hashes' ({activity_id: hash}) guarda la huella del resumen con la que se detectan
+    cambios. Con archive=True el detalle y los laps crudos se añaden a raw_archive. Se usa INSERT ... ON CONFLICT DO UPDATE
+    (SQLite y PostgreSQL) en vez de DELETE + INSERT, de modo que las filas que
+    referencian la actividad (p.ej. planned_workouts) no se rompen y cada fila se
+    escribe una sola vez.
+    """
+    if not bundles:
+        return
+
+    summary_hashes = summary_hashes or {}
+    if archive:
+        raw_archive.archive(cur, raw_archive.KIND_DETAIL, [(detail["id"], detail) for detail, _ in bundles])
+    # Semanas/meses de los agregados a recalcular: donde estaban (si cambia la fecha) y donde quedan
+    weeks, months = rollups.affected_buckets(cur, [detail["id"] for detail, _ in bundles])
+    new_weeks, new_months = rollups.buckets_of(detail for detail, _ in bundles)
+    cur.upsert_many("activities", ACTIVITY_COLUMNS + ("summary_hash",),
+                    [activity_row(detail) + (summary_hashes.get(detail["id"]),) for detail, _ in bundles],
+                    conflict_columns=("id",))
+    rollups.refresh(cur, weeks | new_weeks, months | new_months)
+
+    splits_by_activity = {detail["id"]: split_rows(detail) for detail, _ in bundles}
+    cur.upsert_many("splits", SPLIT_COLUMNS, [row for rows in splits_by_activity.values() for row in rows],
+                    conflict_columns=("activity_id", "split"))
+    _trim_children(cur, "splits", "split",
+                   {act_id: [(row[1],) for row in rows] for act_id, rows in splits_by_activity.items()})
+
+    laps_by_activity = {detail["id"]: laps for detail, laps in bundles if laps is not None}
+    if laps_by_activity:
+        _store_laps(cur, laps_by_activity, archive=archive)
+    else:
+        bump_sync_generation(cur)
+
+
+def delete_activities(cur, activity_ids):
+    """
+    Borra actividades con sus splits, laps, streams y respuestas archivadas (sin commit),
+    y recalcula los agregados de sus semanas y meses.
+
+    Los entrenos planificados y el feedback que las referencian se desvinculan en lugar de borrarse.
+    """
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return
+    placeholders = ", ".join("?" for _ in activity_ids)
+    cur.execute(f"UPDATE planned_workouts SET linked_activity_id = NULL WHERE linked_activity_id IN ({placeholders})",
+                activity_ids)
+    cur.execute(f"UPDATE workout_feedback SET activity_id = NULL WHERE activity_id IN ({placeholders})", activity_ids)
+    for table in ("splits", "laps", "activity_streams", "raw_archive"):
+        cur.execute(f"DELETE FROM {table} WHERE activity_id IN ({placeholders})", activity_ids)
+    weeks, months = rollups.affected_buckets(cur, activity_ids)
+    cur.execute(f"DELETE FROM activities WHERE id IN ({placeholders})", activity_ids)
+    rollups.refresh(cur, weeks, months)
+    bump_sync_generation(cur)
+
+
+def _batches(items, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _sync_pages(conn, cur, headers, job: str, after=None, max_pages=None,
+                max_workers=MAX_WORKERS, batch_size=SYNC_BATCH_SIZE, label="Actividad", force=False,
+                progress=None, with_streams=SYNC_STREAMS):
+    """
+    Recorre /athlete/activities y guarda las carreras, confirmando cada 'batch_size' actividades.
+
+    Solo se piden detalle y laps de las actividades nuevas o cuyo resumen ha cambiado
+    (summary_hash distinto del guardado); con force=True se piden todas.
+
+    Con with_streams=True también se descargan y guardan los streams de cada actividad guardada.
+
+    'progress' (opcional) se llama tras cada commit con progress(page=..., processed=...),
+    p.ej. para que el trabajo en segundo plano de la app muestre por dónde va.
+
+    El progreso (página, after, última actividad y estado por actividad) se guarda en
+    sync_state en la misma transacción que los datos. Si el trabajo 'job' quedó a medias,
+    continúa en la misma página con el mismo 'after' y salta las actividades ya guardadas.
+
+    Returns:
+        IDs de las actividades guardadas en esta ejecución
+    """
+    state = sync_state.start_job(cur, job, after_ts=after)
+    conn.commit()
+    page, after = state["page"], state["after_ts"]
+    last_id = state["last_activity_id"]
+    if state["resumed"]:
+        print(f"⏯️  Reanudando '{job}' en la página {page} (última actividad {last_id})")
+
+    stored_ids = []
+    while max_pages is None or page <= max_pages:
         print(f"🔄 Descargando página {page}...")
-        url = "https://www.strava.com/api/v3/athlete/activities"
-        params = {"per_page": 100, "page": page}
-        response = requests.get(url, headers=headers, params=params, verify=PROXY_CERT)
-        response.raise_for_status()
-        activities = response.json()
+        activities = list_activities(headers, page, after=after)
 
         if not activities:
             break
 
-        for activity in activities:
-            if activity["type"] != "Run":
-                continue
+        hashes = {activity["id"]: summary_hash(activity) for activity in activities if activity["type"] == "Run"}
+        done = sync_state.activity_statuses(cur, job, hashes)
+        pending = [act_id for act_id in hashes if act_id not in done]
 
-            act_id = activity["id"]
-            print(f"➡️  Actividad {act_id} - {activity['name']}")
+        unchanged = set()
+        if not force:
+            known = _stored_hashes(cur, pending)
+            unchanged = {act_id for act_id in pending if known.get(act_id) == hashes[act_id]}
+            if unchanged:
+                print(f"⏭️  {len(unchanged)} actividades sin cambios en la página {page}")
+                pending = [act_id for act_id in pending if act_id not in unchanged]
 
-            # Detalle de la actividad
-            detail_url = f"https://www.strava.com/api/v3/activities/{act_id}"
-            detail_resp = requests.get(detail_url, headers=headers, verify=PROXY_CERT)
-            detail_resp.raise_for_status()
-            detail = detail_resp.json()
+        # Por lote, primero toda la red (detalle + laps + streams, en paralelo) y después la
+        # escritura en bloque: la transacción no retiene el bloqueo de escritura de la BD
+        # durante las peticiones ni las esperas del scheduler
+        for batch in _batches(pending, batch_size):
+            bundles, failed = [], {}
+            for (act_id, detail, laps), error in fetch_activity_bundles(headers, batch, max_workers):
+                if error is not None:
+                    print(f"⚠️  {label} {act_id} omitida: {error}")
+                    failed[act_id] = error
+                    continue
+                print(f"➡️  {label} {act_id} - {detail['name']}")
+                bundles.append((detail, laps))
+            stored = [detail["id"] for detail, _ in bundles]
+            fetched_streams = _fetch_streams(headers, stored, max_workers) if with_streams else {}
 
-            # Insertar/actualizar actividad (compatible con SQLite y PostgreSQL)
-            # Primero intentar borrar si existe
-            cur.execute("DELETE FROM activities WHERE id = ?", (detail["id"],))
-
-            # Luego insertar
-            cur.execute("""
-                INSERT INTO activities (
-                    id, name, description, private_note, start_date_local, distance, moving_time, elapsed_time, average_speed, average_heartrate, total_elevation_gain, type, sport_type
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                detail["id"],
-                detail["name"],
-                detail.get("description"),
-                detail.get("private_note"),
-                detail["start_date_local"],
-                detail["distance"],
-                detail["moving_time"],
-                detail["elapsed_time"],
-                detail.get("average_speed"),
-                detail.get("average_heartrate"),
-                detail.get("total_elevation_gain"),
-                detail["type"],
-                detail["sport_type"]
-            ))
-
-            # --- SPLITS (kilómetro automático) ---
-            cur.execute("DELETE FROM splits WHERE activity_id = ?", (detail["id"],))
-            for split in detail.get("splits_metric", []):
-                cur.execute("""
-                    INSERT INTO splits (activity_id, split, distance, elapsed_time, elevation_difference, average_speed)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    detail["id"],
-                    split["split"],
-                    split["distance"],
-                    split["elapsed_time"],
-                    split.get("elevation_difference"),
-                    split["average_speed"]
-                ))
-
-            # --- LAPS (parciales/intervalos) ---
-            laps = fetch_laps(headers, detail["id"])
-            cur.execute("DELETE FROM laps WHERE activity_id = ?", (detail["id"],))
-            for lap in laps:
-                cur.execute("""
-                    INSERT INTO laps (
-                        activity_id, lap_id, lap_index, name, split, start_date_local, elapsed_time, moving_time,
-                        distance, average_speed, max_speed, start_index, end_index, total_elevation_gain, pace_zone
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    detail["id"],
-                    lap.get("id"),
-                    lap.get("lap_index"),
-                    lap.get("name"),
-                    lap.get("split"),
-                    lap.get("start_date_local"),
-                    lap.get("elapsed_time"),
-                    lap.get("moving_time"),
-                    lap.get("distance"),
-                    lap.get("average_speed"),
-                    lap.get("max_speed"),
-                    lap.get("start_index"),
-                    lap.get("end_index"),
-                    lap.get("total_elevation_gain"),
-                    lap.get("pace_zone"),
-                ))
-
-            total_inserted += 1
-            sleep(0.2)  # evitar rate limit
+            for act_id, error in failed.items():
+                sync_state.mark_activities(cur, job, [act_id], sync_state.STATUS_FAILED, str(error))
+            _store_activities(cur, bundles, hashes)
+            streams.store_streams(cur, fetched_streams)
+            sync_state.mark_activities(cur, job, stored)
+            last_id = batch[-1]
+            sync_state.save_state(cur, job, page=page, after_ts=after, last_activity_id=last_id)
+            conn.commit()
+            stored_ids.extend(stored)
+            if progress is not None:
+                progress(page=page, processed=len(stored_ids))
 
+        if unchanged:
+            sync_state.mark_activities(cur, job, unchanged)
         page += 1
+        sync_state.save_state(cur, job, page=page, after_ts=after, last_activity_id=last_id)
+        conn.commit()
+        if progress is not None:
+            progress(page=page, processed=len(stored_ids))
 
+    sync_state.finish_job(cur, job, page=page, after_ts=after, last_activity_id=last_id)
     conn.commit()
+    return stored_ids
+
+
+def _job_name(job: str, athlete_id=None) -> str:
+    """Nombre del trabajo en sync_state: uno por atleta."""
+    return job if athlete_id is None else f"{job}:{athlete_id}"
+
+
+def download_and_store_runs(db_path="data/strava_activities.db", max_pages=50, max_workers=MAX_WORKERS, force=False,
+                            progress=None, athlete_id=None):
+    headers = _auth_headers(athlete_id)
+
+    init_db(db_path)
+    conn = get_connection()
+    cur = conn.cursor()
+
+    stored_ids = _sync_pages(conn, cur, headers, _job_name("download", athlete_id), max_pages=max_pages,
+                             max_workers=max_workers, force=force, progress=progress)
+
     conn.close()
-    print(f"✅ Proceso completo. Actividades almacenadas: {total_inserted}")
-    
+    print(f"✅ Proceso completo. Actividades almacenadas: {len(stored_ids)}")
 
-def sync_new_activities(db_path="data/strava_activities.db"):
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
+
+def sync_new_activities(db_path="data/strava_activities.db", max_workers=MAX_WORKERS, force=False, progress=None,
+                        athlete_id=None):
+    headers = _auth_headers(athlete_id)
     init_db(db_path)
     conn = get_connection()
     cur = conn.cursor()
-    # Obtener fecha de última actividad
-    cur.execute("SELECT MAX(start_date_local) FROM activities")
+    # Obtener fecha de última actividad (si la sync anterior quedó a medias, se reutiliza su 'after')
+    if athlete_id is None:
+        cur.execute(f"SELECT MAX(start_date_local) FROM activities WHERE {athletes.owner_filter()}")
+    else:
+        cur.execute("SELECT MAX(start_date_local) FROM activities WHERE athlete_id = ?", (athlete_id,))
     result = cur.fetchone()
     last_date = result[0] if result[0] else "1970-01-01T00:00:00Z"
     after_timestamp = int(datetime.fromisoformat(last_date.replace("Z", "+00:00")).timestamp())
 
-    page = 1
-    total_new = 0
+    # Si la sync anterior dejó actividades fallidas, 'after' no pasa de ellas (pueden ser más
+    # antiguas que la última guardada): se vuelve a listar desde el 'after' de entonces
+    job = _job_name("sync", athlete_id)
+    previous = sync_state.load_state(cur, job)
+    if (previous is not None and previous["after_ts"] is not None
+            and sync_state.failed_activities(cur, job)):
+        after_timestamp = min(after_timestamp, previous["after_ts"])
 
-    while True:
-        url = "https://www.strava.com/api/v3/athlete/activities"
-        params = {
-            "per_page": 100,
-            "page": page,
-            "after": after_timestamp
-        }
-        response = requests.get(url, headers=headers, params=params, verify=PROXY_CERT)
-        response.raise_for_status()
-        activities = response.json()
+    synced_ids = _sync_pages(conn, cur, headers, job, after=after_timestamp,
+                             max_workers=max_workers, label="Nueva actividad", force=force, progress=progress)
 
-        if not activities:
-            break
+    conn.close()
+    print(f"✅ Sincronización completa. Nuevas actividades insertadas: {len(synced_ids)}")
+    # IDs insertados/actualizados, para refrescar solo esas actividades en la caché de la app
+    return synced_ids
 
-        for activity in activities:
-            if activity["type"] != "Run":
-                continue
 
-            act_id = activity["id"]
-            print(f"➡️  Nueva actividad {act_id} - {activity['name']}")
+def _sync_athlete(db_path: str, athlete_id: int, force: bool):
+    with athlete_scope(athlete_id):
+        return sync_new_activities(db_path, max_workers=ATHLETE_FETCH_WORKERS, force=force, athlete_id=athlete_id)
 
-            detail_url = f"https://www.strava.com/api/v3/activities/{act_id}"
-            detail_resp = requests.get(detail_url, headers=headers, verify=PROXY_CERT)
-            detail_resp.raise_for_status()
-            detail = detail_resp.json()
 
-            # Insertar/actualizar actividad (compatible con SQLite y PostgreSQL)
-            # Primero intentar borrar si existe
-            cur.execute("DELETE FROM activities WHERE id = ?", (detail["id"],))
+def sync_all_athletes(db_path="data/strava_activities.db", max_workers=ATHLETE_WORKERS, force=False, progress=None):
+    """
+    Sincroniza todos los atletas activos de la tabla athletes con un pool de 'max_workers' hilos.
 
-            # Luego insertar
-            cur.execute("""
-                INSERT INTO activities (
-                    id, name, description, private_note, start_date_local, distance, moving_time, elapsed_time, average_speed,
-                    average_heartrate, total_elevation_gain, type, sport_type
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                detail["id"],
-                detail["name"],
-                detail.get("description"),
-                detail.get("private_note"),
-                detail["start_date_local"],
-                detail["distance"],
-                detail["moving_time"],
-                detail["elapsed_time"],
-                detail.get("average_speed"),
-                detail.get("average_heartrate"),
-                detail.get("total_elevation_gain"),
-                detail["type"],
-                detail["sport_type"]
-            ))
-
-            # --- SPLITS (kilómetro automático) ---
-            cur.execute("DELETE FROM splits WHERE activity_id = ?", (detail["id"],))
-            for split in detail.get("splits_metric", []):
-                cur.execute("""
-                    INSERT INTO splits (activity_id, split, distance, elapsed_time, elevation_difference, average_speed)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    detail["id"],
-                    split["split"],
-                    split["distance"],
-                    split["elapsed_time"],
-                    split.get("elevation_difference"),
-                    split["average_speed"]
-                ))
-
-            # --- LAPS (parciales/intervalos) ---
-            laps = fetch_laps(headers, detail["id"])
-            cur.execute("DELETE FROM laps WHERE activity_id = ?", (detail["id"],))
-            for lap in laps:
-                cur.execute("""
-                    INSERT INTO laps (
-                        activity_id, lap_id, lap_index, name, split, start_date_local, elapsed_time, moving_time,
-                        distance, average_speed, max_speed, start_index, end_index, total_elevation_gain, pace_zone
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    detail["id"],
-                    lap.get("id"),
-                    lap.get("lap_index"),
-                    lap.get("name"),
-                    lap.get("split"),
-                    lap.get("start_date_local"),
-                    lap.get("elapsed_time"),
-                    lap.get("moving_time"),
-                    lap.get("distance"),
-                    lap.get("average_speed"),
-                    lap.get("max_speed"),
-                    lap.get("start_index"),
-                    lap.get("end_index"),
-                    lap.get("total_elevation_gain"),
-                    lap.get("pace_zone"),
-                ))
-
-            total_new += 1
-            sleep(0.2)
+    Cada atleta usa su propio token y su parte del presupuesto de la API (athlete_budget),
+    y los que hace más tiempo que no se sincronizan van primero. El error de un atleta
+    (token revocado, errores de red...) se registra en athletes.last_error sin parar al resto.
+    Sin atletas registrados equivale a sync_new_activities() con STRAVA_REFRESH_TOKEN.
 
-        page += 1
+    Returns:
+        IDs de las actividades guardadas (de todos los atletas)
+    """
+    init_db(db_path)
+    conn = get_connection()
+    cur = conn.cursor()
+    athlete_ids = athletes.active_athletes(cur)
+    if not athlete_ids:
+        conn.close()
+        return sync_new_activities(db_path, force=force, progress=progress)
+
+    print(f"👥 Sincronizando {len(athlete_ids)} atletas ({max_workers} en paralelo)")
+    synced_ids = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(athlete_ids)))) as executor:
+        futures = {athlete_id: executor.submit(_sync_athlete, db_path, athlete_id, force) for athlete_id in athlete_ids}
+        for done, (athlete_id, future) in enumerate(futures.items(), start=1):
+            try:
+                synced_ids.extend(future.result())
+                athletes.record_sync(cur, athlete_id)
+            except Exception as e:
+                print(f"❌ Error sincronizando el atleta {athlete_id}: {e}")
+                athletes.record_sync(cur, athlete_id, error=str(e))
+            conn.commit()
+            if progress is not None:
+                progress(processed=len(synced_ids), message=f"{done}/{len(athlete_ids)} atletas")
 
-    conn.commit()
     conn.close()
-    print(f"✅ Sincronización completa. Nuevas actividades insertadas: {total_new}")
-    
-    
-def backfill_missing_laps(db_path="data/strava_activities.db", limit=None):
+    print(f"✅ Atletas sincronizados. Actividades nuevas: {len(synced_ids)}")
+    return synced_ids
+
+
+def _store_splits(cur, details_by_activity):
+    """Guarda los splits (y el resto del detalle) conservando el summary_hash y los laps guardados."""
+    hashes = _stored_hashes(cur, details_by_activity)
+    _store_activities(cur, [(detail, None) for detail in details_by_activity.values()], hashes)
+
+
+@dataclass(frozen=True)
+class Artefact:
+    """Dato por actividad que se puede rellenar con un backfill: tabla hija, cómo descargarlo y cómo guardarlo."""
+    name: str
+    table: str
+    fetch: Callable  # fetch(headers, activity_id)
+    store: Callable  # store(cur, {activity_id: respuesta}) sin commit
+
+
+ARTEFACTS = {
+    "laps": Artefact("laps", "laps", fetch_laps, _store_laps),
+    "splits": Artefact("splits", "splits", fetch_activity_detail, _store_splits),
+    "streams": Artefact("streams", "activity_streams", fetch_streams, streams.store_streams),
+}
+
+
+def _format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def backfill_missing(artefact: str, db_path="data/strava_activities.db", limit=None, batch_size=SYNC_BATCH_SIZE,
+                     max_workers=MAX_WORKERS, reserve_daily=BACKFILL_DAILY_RESERVE, progress=None):
     """
-    Rellena la tabla 'laps' para actividades ya presentes en 'activities' que no tengan parciales insertados.
+    Rellena un artefacto ('laps', 'splits' o 'streams') de las actividades guardadas que no lo tienen.
+
+    - Descarga en paralelo (max_workers) a través del planificador de rate limit compartido,
+      y se detiene si el presupuesto diario baja de 'reserve_daily' para no dejar sin
+      peticiones a la sincronización de la app.
+    - Confirma cada 'batch_size' actividades con el registro del trabajo 'backfill_<artefacto>':
+      si se corta, la siguiente ejecución no vuelve a pedir las ya procesadas ni las que
+      dieron un error permanente (403/404, 'unavailable'). Las que fallaron por otro motivo
+      (p.ej. un 401 de un token caducado, marcadas 'failed' por versiones anteriores) se reintentan.
+    - Muestra el progreso con actividades/s y tiempo estimado restante.
+    - Cada actividad se pide con el token (y la parte del presupuesto) de su atleta si está
+      registrado en athletes; las demás, con STRAVA_REFRESH_TOKEN.
     Si 'limit' es un entero, procesa como máximo ese número de actividades (útil para pruebas).
+
+    Returns:
+        Número de actividades procesadas
     """
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
+    spec = ARTEFACTS[artefact]
+    job = f"backfill_{spec.name}"
     init_db(db_path)
     conn = get_connection()
     cur = conn.cursor()
 
-    sql = """
-        SELECT a.id
+    sql = f"""
+        SELECT a.id, a.athlete_id
         FROM activities a
-        LEFT JOIN laps l ON l.activity_id = a.id
-        WHERE l.activity_id IS NULL
-        ORDER BY a.start_date_local DESC
+        WHERE NOT EXISTS (SELECT 1 FROM {spec.table} c WHERE c.activity_id = a.id)
+        AND a.id NOT IN (SELECT activity_id FROM sync_activity_status WHERE job = ? AND status IN (?, ?))
+        ORDER BY a.start_at DESC
     """
+    params = (job, sync_state.STATUS_DONE, sync_state.STATUS_UNAVAILABLE)
     if limit is not None:
-        cur.execute(sql + " LIMIT ?", (limit,))
+        cur.execute(sql + " LIMIT ?", (*params, limit))
     else:
-        cur.execute(sql)
-
+        cur.execute(sql, params)
     rows = cur.fetchall()
-    processed = 0
+    registered = set(athletes.active_athletes(cur))
+    pending_by_athlete = {}
+    total = 0
+    for act_id, athlete_id in rows:
+        owner = athlete_id if athlete_id in registered else None
+        pending_by_athlete.setdefault(owner, []).append(act_id)
+        total += 1
+
+    # El registro por actividad de este trabajo se conserva entre ejecuciones
+    sync_state.save_state(cur, job)
+    conn.commit()
+    print(f"🧩 Backfill de {spec.name}: {total} actividades pendientes")
 
-    for (act_id,) in rows:
+    processed = 0
+    last_id = None
+    skipped = False
+    started = monotonic()
+    for athlete_id, pending in pending_by_athlete.items():
         try:
-            laps = fetch_laps(headers, act_id)
-            cur.execute("DELETE FROM laps WHERE activity_id = ?", (act_id,))
-            for lap in laps:
-                cur.execute("""
-                    INSERT INTO laps (
-                        activity_id, lap_id, lap_index, name, split, start_date_local, elapsed_time, moving_time,
-                        distance, average_speed, max_speed, start_index, end_index, total_elevation_gain, pace_zone
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    act_id,
-                    lap.get("id"),
-                    lap.get("lap_index"),
-                    lap.get("name"),
-                    lap.get("split"),
-                    lap.get("start_date_local"),
-                    lap.get("elapsed_time"),
-                    lap.get("moving_time"),
-                    lap.get("distance"),
-                    lap.get("average_speed"),
-                    lap.get("max_speed"),
-                    lap.get("start_index"),
-                    lap.get("end_index"),
-                    lap.get("total_elevation_gain"),
-                    lap.get("pace_zone"),
-                ))
-            processed += 1
-            sleep(0.2)
+            headers = _auth_headers(athlete_id)
         except Exception as e:
-            print(f"Error al obtener laps de {act_id}: {e}")
+            # Sin marcar las actividades: se reintentarán cuando el atleta tenga token
+            print(f"❌ Sin token para el atleta {athlete_id}: {e}")
+            skipped = True
+            continue
+        with athlete_scope(athlete_id):
+            for batch in _batches(pending, batch_size):
+                if scheduler.remaining_daily() < reserve_daily + len(batch):
+                    print(f"⏸️  Presupuesto diario de Strava por debajo de la reserva ({reserve_daily}): "
+                          "el backfill continuará en la próxima ejecución")
+                    conn.close()
+                    return processed
+
+                # Un backfill puede durar horas: token vigente en cada lote (renovado si caduca)
+                headers.refresh()
+                results = {}
+                for act_id, result, error in _fetch_parallel(spec.fetch, headers, batch, max_workers):
+                    if error is not None:
+                        print(f"⚠️  {spec.name} de {act_id} no disponibles: {error}")
+                        sync_state.mark_activities(cur, job, [act_id], sync_state.STATUS_UNAVAILABLE, str(error))
+                    else:
+                        results[act_id] = result
+
+                spec.store(cur, results)
+                sync_state.mark_activities(cur, job, results)
+                last_id = batch[-1]
+                sync_state.save_state(cur, job, last_activity_id=last_id)
+                conn.commit()
+
+                processed += len(batch)
+                elapsed = monotonic() - started
+                rate = processed / elapsed if elapsed > 0 else 0.0
+                eta = _format_eta((total - processed) / rate) if rate > 0 else "?"
+                print(f"📈 {spec.name}: {processed}/{total} actividades · {rate:.1f} act/s · ETA {eta}")
+                if progress is not None:
+                    progress(processed=processed, message=f"{rate:.1f} act/s · ETA {eta}")
+
+    if skipped:
+        print(f"⚠️  Backfill de {spec.name} incompleto (atletas sin token). Actividades procesadas: {processed}")
+    else:
+        sync_state.finish_job(cur, job, page=1, last_activity_id=last_id)
+        conn.commit()
+        print(f"✅ Backfill de {spec.name} completado. Actividades procesadas: {processed}")
+
+    conn.close()
+    return processed
+
+
+def backfill_missing_laps(db_path="data/strava_activities.db", limit=None, batch_size=SYNC_BATCH_SIZE):
+    """Rellena la tabla 'laps' para actividades ya presentes en 'activities' que no tengan parciales insertados."""
+    return backfill_missing("laps", db_path, limit=limit, batch_size=batch_size)
+
+
+def rebuild_from_archive(db_path="data/strava_activities.db", batch_size=200):
+    """
+    Regenera activities, splits y laps a partir de raw_archive, sin llamar a la API de Strava.
+
+    Útil tras añadir una columna derivada: se vuelve a ejecutar activity_row()/split_rows()/
+    lap_rows() sobre la última versión archivada de cada respuesta. Se conserva el
+    summary_hash guardado y se confirma cada 'batch_size' actividades.
+
+    Returns:
+        Número de actividades regeneradas
+    """
+    init_db(db_path)
+    conn = get_connection()
+    cur = conn.cursor()
+    read_cur = conn.cursor()
+
+    rebuilt = 0
+    for latest in raw_archive.iter_latest(read_cur, batch_size=batch_size):
+        bundles = [(payloads[raw_archive.KIND_DETAIL], payloads.get(raw_archive.KIND_LAPS))
+                   for payloads in latest.values() if raw_archive.KIND_DETAIL in payloads]
+        # Laps archivados sin detalle (p.ej. del backfill de laps)
+        orphan_laps = {act_id: payloads[raw_archive.KIND_LAPS] for act_id, payloads in latest.items()
+                       if raw_archive.KIND_DETAIL not in payloads and raw_archive.KIND_LAPS in payloads}
+
+        _store_activities(cur, bundles, _stored_hashes(cur, [detail["id"] for detail, _ in bundles]),
+                          archive=False)
+        _store_laps(cur, orphan_laps, archive=False)
+        conn.commit()
+        rebuilt += len(bundles)
+        print(f"♻️  Regeneradas {rebuilt} actividades desde el archivo")
 
+    conn.close()
+    print(f"✅ Regeneración completa. Actividades: {rebuilt}")
+    return rebuilt
+
+
+def rebuild_rollups(db_path="data/strava_activities.db"):
+    """Recalcula desde cero weekly_rollup y monthly_rollup. Devuelve (semanas, meses)."""
+    init_db(db_path)
+    conn = get_connection()
+    try:
+        weeks, months = rollups.rebuild(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Agregados recalculados: {weeks} semanas, {months} meses")
+    return weeks, months
+
+
+def _process_delete_batch(conn, cur, headers, batch, max_workers: int):
+    """Comprueba y aplica un lote de trabajos delete de activity_jobs. Devuelve los IDs borrados."""
+    jobs_by_id = {job["activity_id"]: job for job in batch}
+    placeholders = ", ".join("?" for _ in jobs_by_id)
+    cur.execute(f"SELECT id, athlete_id FROM activities WHERE id IN ({placeholders})", list(jobs_by_id))
+    stored = dict(cur.fetchall())
+
+    to_check = []
+    for act_id, job in jobs_by_id.items():
+        if act_id not in stored:
+            activity_jobs.mark_done(cur, job)  # nada que borrar
+        elif stored[act_id] is not None and stored[act_id] != job["athlete_id"]:
+            print(f"⚠️  Borrado de {act_id} ignorado: la actividad no es del atleta {job['athlete_id']}")
+            activity_jobs.mark_error(cur, job, f"owner_id {job['athlete_id']} no coincide con {stored[act_id]}",
+                                     permanent=True)
+        else:
+            to_check.append(act_id)
+    conn.commit()
+
+    # Red antes de escribir, como en _process_job_batch
+    confirmed, kept = [], {}
+    try:
+        for act_id, _, error in _fetch_parallel(fetch_activity_detail, headers, to_check, max_workers):
+            if error is not None and error.response.status_code == 404:
+                confirmed.append(act_id)
+            else:
+                kept[act_id] = error or "la actividad sigue en Strava"
+    except Exception as e:
+        print(f"⚠️  Error comprobando borrados en Strava: {e}")
+        for act_id in to_check:
+            activity_jobs.mark_error(cur, jobs_by_id[act_id], e)
+        conn.commit()
+        return []
+
+    for act_id, reason in kept.items():
+        print(f"⚠️  Borrado de {act_id} ignorado: {reason}")
+        activity_jobs.mark_error(cur, jobs_by_id[act_id], reason, permanent=True)
+    delete_activities(cur, confirmed)
+    for act_id in confirmed:
+        activity_jobs.mark_done(cur, jobs_by_id[act_id])
+    conn.commit()
+    if confirmed:
+        print(f"🗑️  {len(confirmed)} actividades borradas")
+    return confirmed
+
+
+def _process_job_batch(conn, cur, headers, batch, max_workers: int, with_streams: bool):
+    """Descarga y guarda un lote de trabajos create/update de activity_jobs. Devuelve los IDs cambiados."""
+    jobs_by_id = {job["activity_id"]: job for job in batch}
+    known = _stored_hashes(cur, jobs_by_id)
+    details_only = [act_id for act_id, job in jobs_by_id.items()
+                    if job["aspect"] == activity_jobs.ASPECT_UPDATE and act_id in known]
+    full = [act_id for act_id in jobs_by_id if act_id not in details_only]
+
+    # Toda la red (detalle, laps y streams) antes de escribir nada: ver _sync_pages
+    results = {}
+    try:
+        for (act_id, detail, laps), error in fetch_activity_bundles(headers, full, max_workers):
+            results[act_id] = (detail, laps, error)
+        for act_id, detail, error in _fetch_parallel(fetch_activity_detail, headers, details_only, max_workers):
+            results[act_id] = (detail, None, error)
+        new_runs = [act_id for act_id, (detail, laps, error) in results.items()
+                    if error is None and laps is not None and detail["type"] == "Run"]
+        fetched_streams = _fetch_streams(headers, new_runs, max_workers) if with_streams else {}
+    except Exception as e:
+        # Error transitorio que ha agotado los reintentos: el lote se reintentará más tarde
+        print(f"⚠️  Error descargando actividades de la cola: {e}")
+        for job in batch:
+            activity_jobs.mark_error(cur, job, e)
+        conn.commit()
+        return []
+
+    bundles, not_runs = [], []
+    for act_id, (detail, laps, error) in results.items():
+        if error is not None:
+            print(f"⚠️  Actividad {act_id} omitida: {error}")
+            activity_jobs.mark_error(cur, jobs_by_id[act_id], error, permanent=True)
+            continue
+        if detail["type"] != "Run":
+            not_runs.append(act_id)
+        else:
+            print(f"➡️  Actividad {act_id} - {detail['name']}")
+            bundles.append((detail, laps))
+        activity_jobs.mark_done(cur, jobs_by_id[act_id])
+
+    removed = [act_id for act_id in not_runs if act_id in known]
+    delete_activities(cur, removed)
+    _store_activities(cur, bundles, {detail["id"]: summary_hash(detail) for detail, _ in bundles})
+    streams.store_streams(cur, fetched_streams)
     conn.commit()
+    return [detail["id"] for detail, _ in bundles] + removed
+
+
+def process_activity_jobs(db_path="data/strava_activities.db", limit=None, max_workers=MAX_WORKERS,
+                          batch_size=SYNC_BATCH_SIZE, with_streams=SYNC_STREAMS):
+    """
+    Procesa la cola activity_jobs (eventos del webhook de Strava), una petición por actividad cambiada.
+
+    - create: detalle + laps (+ streams), como en la sincronización.
+    - update (título, tipo o privacidad): solo el detalle; laps y streams no cambian.
+      Si la actividad no estaba guardada (p.ej. pasa de 'Ride' a 'Run') se trata como create.
+    - delete: se borra de la BD solo si la guardada es del owner_id del evento y Strava
+      confirma (404 con el token de ese atleta) que ya no existe: los eventos del webhook
+      no van firmados y un evento falso no debe poder borrar nada.
+    Las actividades que dejan de ser 'Run' se borran. Se confirma cada 'batch_size' trabajos.
+    Cada atleta registrado en athletes usa su token y su presupuesto; el resto, STRAVA_REFRESH_TOKEN.
+
+    Returns:
+        IDs de las actividades guardadas o borradas
+    """
+    init_db(db_path)
+    conn = get_connection()
+    cur = conn.cursor()
+    jobs = activity_jobs.pending_jobs(cur, limit)
+    if not jobs:
+        conn.close()
+        return []
+
+    changed_ids = []
+    registered = set(athletes.active_athletes(cur))
+    jobs_by_athlete = {}
+    for job in jobs:
+        owner = job["athlete_id"] if job["athlete_id"] in registered else None
+        jobs_by_athlete.setdefault(owner, []).append(job)
+
+    for athlete_id, athlete_jobs in jobs_by_athlete.items():
+        try:
+            headers = _auth_headers(athlete_id)
+        except Exception as e:
+            print(f"❌ Sin token para el atleta {athlete_id}: {e}")
+            for job in athlete_jobs:
+                activity_jobs.mark_error(cur, job, e)
+            conn.commit()
+            continue
+        deletes = [job for job in athlete_jobs if job["aspect"] == activity_jobs.ASPECT_DELETE]
+        others = [job for job in athlete_jobs if job["aspect"] != activity_jobs.ASPECT_DELETE]
+        with athlete_scope(athlete_id):
+            for batch in _batches(deletes, batch_size):
+                changed_ids.extend(_process_delete_batch(conn, cur, headers, batch, max_workers))
+            for batch in _batches(others, batch_size):
+                changed_ids.extend(_process_job_batch(conn, cur, headers, batch, max_workers, with_streams))
+
     conn.close()
-    print(f"Backfill de laps completado. Actividades procesadas: {processed}")
\ No newline at end of file
+    print(f"✅ Cola de actividades procesada. Actividades actualizadas: {len(changed_ids)}")
+    return changed_ids
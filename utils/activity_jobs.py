@@ -0,0 +1,102 @@
+# utils/activity_jobs.py
+"""
+Cola de trabajos por actividad (tabla activity_jobs) alimentada por el webhook de Strava.
+
+Cada evento create/update/delete de una actividad deja una fila pendiente con su
+activity_id como clave, así que varios eventos seguidos de la misma actividad se
+agrupan en un solo trabajo (un 'update' sobre un 'create' aún pendiente sigue siendo
+'create'). strava_client.process_activity_jobs() los consume.
+
+Cada encolado incrementa 'version': un trabajo solo se marca como hecho si no ha
+llegado otro evento mientras se procesaba.
+"""
+
+from datetime import datetime, timezone
+from typing import List, Optional
+
+ASPECT_CREATE = "create"
+ASPECT_UPDATE = "update"
+ASPECT_DELETE = "delete"
+ASPECTS = (ASPECT_CREATE, ASPECT_UPDATE, ASPECT_DELETE)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Intentos antes de dar un trabajo por fallido (errores transitorios de Strava)
+MAX_ATTEMPTS = 5
+
+JOB_COLUMNS = ("activity_id", "athlete_id", "aspect", "status", "version", "attempts", "error", "event_time",
+               "updated_at")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_table(cur):
+    """Crea la tabla de la cola (se llama desde init_db)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activity_jobs (
+            activity_id BIGINT PRIMARY KEY,
+            athlete_id BIGINT,
+            aspect TEXT NOT NULL,
+            status TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            event_time BIGINT,
+            updated_at TEXT
+        )
+    """)
+
+
+def enqueue(cur, activity_id: int, aspect: str, event_time: Optional[int] = None, athlete_id: Optional[int] = None):
+    """Encola (o reabre) el trabajo de una actividad ('athlete_id' es el owner_id del evento)."""
+    if aspect not in ASPECTS:
+        raise ValueError(f"aspect_type desconocido: {aspect}")
+    cur.execute("""
+        INSERT INTO activity_jobs (activity_id, athlete_id, aspect, status, version, attempts, event_time, updated_at)
+        VALUES (?, ?, ?, ?, 1, 0, ?, ?)
+        ON CONFLICT (activity_id) DO UPDATE SET
+            athlete_id = excluded.athlete_id,
+            aspect = CASE
+                WHEN activity_jobs.status = ? AND activity_jobs.aspect = ? AND excluded.aspect = ?
+                THEN activity_jobs.aspect ELSE excluded.aspect END,
+            status = excluded.status,
+            version = activity_jobs.version + 1,
+            attempts = 0,
+            error = NULL,
+            event_time = excluded.event_time,
+            updated_at = excluded.updated_at
+    """, (activity_id, athlete_id, aspect, STATUS_PENDING, event_time, _now(),
+          STATUS_PENDING, ASPECT_CREATE, ASPECT_UPDATE))
+
+
+def pending_jobs(cur, limit: Optional[int] = None) -> List[dict]:
+    """Trabajos pendientes, los más antiguos primero."""
+    sql = ("SELECT activity_id, athlete_id, aspect, version, attempts FROM activity_jobs WHERE status = ? "
+           "ORDER BY event_time, activity_id")
+    params = [STATUS_PENDING]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cur.execute(sql, params)
+    return [{"activity_id": row[0], "athlete_id": row[1], "aspect": row[2], "version": row[3], "attempts": row[4]}
+            for row in cur.fetchall()]
+
+
+def mark_done(cur, job: dict):
+    """Marca el trabajo como hecho, salvo que haya llegado otro evento mientras se procesaba."""
+    cur.execute("UPDATE activity_jobs SET status = ?, error = NULL, updated_at = ? "
+                "WHERE activity_id = ? AND version = ?",
+                (STATUS_DONE, _now(), job["activity_id"], job["version"]))
+
+
+def mark_error(cur, job: dict, error: Exception, permanent: bool = False):
+    """Registra un error: el trabajo sigue pendiente hasta MAX_ATTEMPTS, salvo que sea permanente."""
+    attempts = job["attempts"] + 1
+    status = STATUS_FAILED if permanent or attempts >= MAX_ATTEMPTS else STATUS_PENDING
+    cur.execute("UPDATE activity_jobs SET status = ?, attempts = ?, error = ?, updated_at = ? "
+                "WHERE activity_id = ? AND version = ?",
+                (status, attempts, str(error), _now(), job["activity_id"], job["version"]))
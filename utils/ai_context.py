@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List
 from . import ai_functions
 from .db_config import get_connection
+from .timestamps import db_timestamp
+from .athletes import owner_filter
 
 
 def generate_initial_context() -> str:
@@ -147,10 +149,10 @@ def get_recent_private_notes_summary(days: int = 7) -> str:
     Returns:
         String amb resum de les notes privades o None si no n'hi ha
     """
-    conn = get_connection()
-    cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+    conn = get_connection(read_only=True)
+    cutoff_date = db_timestamp(datetime.now() - timedelta(days=days))
 
-    query = """
+    query = f"""
         SELECT
             name,
             start_date_local,
@@ -158,10 +160,10 @@ def get_recent_private_notes_summary(days: int = 7) -> str:
             private_note,
             description
         FROM activities
-        WHERE type = 'Run'
-        AND start_date_local >= ?
+        WHERE type = 'Run' AND {owner_filter()}
+        AND start_at >= ?
         AND (private_note IS NOT NULL AND private_note != '' OR description IS NOT NULL AND description != '')
-        ORDER BY start_date_local DESC
+        ORDER BY start_at DESC
         LIMIT 2
     """
 
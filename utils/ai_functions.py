@@ -7,7 +7,10 @@ Estas funciones están diseñadas para ser usadas con Gemini Function Calling.
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List
-from .db_config import get_connection
+from .db_config import get_connection, PreparedQuery
+from .timestamps import db_timestamp, week_key
+from .sql_dialect import string_agg
+from .athletes import owner_filter
 
 
 def get_recent_activities(days: int = 7) -> dict:
@@ -20,10 +23,10 @@ def get_recent_activities(days: int = 7) -> dict:
     Returns:
         Un diccionario con las actividades recientes y sus estadísticas
     """
-    conn = get_connection()
-    cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+    conn = get_connection(read_only=True)
+    cutoff_date = db_timestamp(datetime.now() - timedelta(days=days))
 
-    query = """
+    query = PreparedQuery(f"""
         SELECT
             id, name, start_date_local,
             distance/1000 as distance_km,
@@ -33,10 +36,10 @@ def get_recent_activities(days: int = 7) -> dict:
             total_elevation_gain,
             description, private_note
         FROM activities
-        WHERE type = 'Run'
-        AND start_date_local >= ?
-        ORDER BY start_date_local DESC
-    """
+        WHERE type = 'Run' AND {owner_filter()}
+        AND start_at >= ?
+        ORDER BY start_at DESC
+    """)
     df = pd.read_sql_query(query, conn, params=(cutoff_date,))
     conn.close()
 
@@ -66,23 +69,22 @@ def get_weekly_stats(weeks: int = 4) -> dict:
     Returns:
         Diccionario con estadísticas semanales
     """
-    conn = get_connection()
-    cutoff_date = (datetime.now() - timedelta(weeks=weeks)).isoformat()
+    conn = get_connection(read_only=True)
+    # Semanas completas (de lunes) desde la que contiene la fecha de corte, de weekly_rollup
+    since = week_key(datetime.now() - timedelta(weeks=weeks))
 
-    query = """
+    query = PreparedQuery("""
         SELECT
-            strftime('%Y-%W', start_date_local) as week,
-            COUNT(*) as num_runs,
-            SUM(distance)/1000 as total_km,
-            AVG((moving_time/60)/(distance/1000)) as avg_pace_min_km,
-            AVG(average_heartrate) as avg_hr
-        FROM activities
-        WHERE type = 'Run'
-        AND start_date_local >= ?
-        GROUP BY week
-        ORDER BY week DESC
-    """
-    df = pd.read_sql_query(query, conn, params=(cutoff_date,))
+            week_key as week,
+            runs as num_runs,
+            distance_km as total_km,
+            avg_pace as avg_pace_min_km,
+            avg_hr
+        FROM weekly_rollup
+        WHERE week_key >= ?
+        ORDER BY week_key DESC
+    """)
+    df = pd.read_sql_query(query, conn, params=(since,))
     conn.close()
 
     if df.empty:
@@ -113,10 +115,10 @@ def get_activity_details(activity_id) -> dict:
         except ValueError:
             return {"error": f"ID inválido: {activity_id}"}
 
-    conn = get_connection()
+    conn = get_connection(read_only=True)
 
     # Información de la actividad
-    activity_query = """
+    activity_query = PreparedQuery(f"""
         SELECT
             id, name, start_date_local,
             distance/1000 as distance_km,
@@ -125,8 +127,8 @@ def get_activity_details(activity_id) -> dict:
             total_elevation_gain,
             description, private_note
         FROM activities
-        WHERE id = ?
-    """
+        WHERE id = ? AND {owner_filter()}
+    """)
     activity_df = pd.read_sql_query(activity_query, conn, params=(activity_id,))
 
     if activity_df.empty:
@@ -134,7 +136,7 @@ def get_activity_details(activity_id) -> dict:
         return {"error": f"Activity {activity_id} not found"}
 
     # Splits de la actividad (km automáticos con elevation_difference con signo)
-    splits_query = """
+    splits_query = PreparedQuery("""
         SELECT
             split,
             distance/1000 as distance_km,
@@ -144,11 +146,11 @@ def get_activity_details(activity_id) -> dict:
         FROM splits
         WHERE activity_id = ?
         ORDER BY split
-    """
+    """)
     splits_df = pd.read_sql_query(splits_query, conn, params=(activity_id,))
 
     # Laps de la actividad (parciales/intervalos con total_elevation_gain)
-    laps_query = """
+    laps_query = PreparedQuery("""
         SELECT
             lap_index, name,
             distance/1000 as distance_km,
@@ -158,7 +160,7 @@ def get_activity_details(activity_id) -> dict:
         FROM laps
         WHERE activity_id = ?
         ORDER BY lap_index
-    """
+    """)
     laps_df = pd.read_sql_query(laps_query, conn, params=(activity_id,))
     conn.close()
 
@@ -185,7 +187,7 @@ def get_current_plan() -> dict:
     Returns:
         Diccionario con el plan actual y sus entrenamientos planificados
     """
-    conn = get_connection()
+    conn = get_connection(read_only=True)
 
     # Plan activo
     plan_query = """
@@ -204,7 +206,7 @@ def get_current_plan() -> dict:
     plan_id = int(plan_df.iloc[0]['id'])
 
     # Entrenamientos del plan
-    workouts_query = """
+    workouts_query = PreparedQuery("""
         SELECT
             pw.id, pw.date, pw.workout_type, pw.distance_km,
             pw.description, pw.pace_objective, pw.notes,
@@ -214,7 +216,7 @@ def get_current_plan() -> dict:
         LEFT JOIN activities a ON pw.linked_activity_id = a.id
         WHERE pw.plan_id = ?
         ORDER BY pw.date
-    """
+    """)
     workouts_df = pd.read_sql_query(workouts_query, conn, params=(plan_id,))
     conn.close()
 
@@ -395,7 +397,7 @@ def get_runner_profile() -> dict:
     Returns:
         Diccionario con toda la información del perfil del corredor
     """
-    conn = get_connection()
+    conn = get_connection(read_only=True)
 
     query = """
         SELECT * FROM runner_profile
@@ -432,11 +434,11 @@ def analyze_performance_trends(weeks: int = 4) -> dict:
     Returns:
         Diccionario con análisis de tendencias y recomendaciones
     """
-    conn = get_connection()
-    cutoff_date = (datetime.now() - timedelta(weeks=weeks)).isoformat()
+    conn = get_connection(read_only=True)
+    cutoff_date = db_timestamp(datetime.now() - timedelta(weeks=weeks))
 
     # Obtener actividades recientes con FC
-    query = """
+    query = PreparedQuery(f"""
         SELECT
             start_date_local,
             distance/1000 as distance_km,
@@ -446,12 +448,12 @@ def analyze_performance_trends(weeks: int = 4) -> dict:
             description,
             private_note
         FROM activities
-        WHERE type = 'Run'
-        AND start_date_local >= ?
+        WHERE type = 'Run' AND {owner_filter()}
+        AND start_at >= ?
         AND average_heartrate IS NOT NULL
         AND distance > 3000
-        ORDER BY start_date_local ASC
-    """
+        ORDER BY start_at ASC
+    """)
     df = pd.read_sql_query(query, conn, params=(cutoff_date,))
     conn.close()
 
@@ -610,28 +612,37 @@ def analyze_training_load_advanced() -> dict:
     Returns:
         Diccionario con análisis detallado de carga y recomendaciones
     """
-    conn = get_connection()
+    conn = get_connection(read_only=True)
 
-    # Últimas 6 semanas de datos
-    cutoff_date = (datetime.now() - timedelta(weeks=6)).isoformat()
+    # Últimas 6 semanas de datos: totales de weekly_rollup y notas de las actividades
+    since = week_key(datetime.now() - timedelta(weeks=6))
 
-    query = """
+    query = PreparedQuery("""
+        SELECT
+            week_key as week,
+            runs as num_runs,
+            distance_km as total_km,
+            avg_hr,
+            avg_pace
+        FROM weekly_rollup
+        WHERE week_key >= ?
+        ORDER BY week_key ASC
+    """)
+    notes_query = PreparedQuery(f"""
         SELECT
-            strftime('%Y-%W', start_date_local) as week,
-            COUNT(*) as num_runs,
-            SUM(distance)/1000 as total_km,
-            AVG(average_heartrate) as avg_hr,
-            AVG((moving_time/60)/(distance/1000)) as avg_pace,
-            GROUP_CONCAT(private_note, ' | ') as notes
+            week_key as week,
+            {string_agg('private_note', ' | ')} as notes
         FROM activities
-        WHERE type = 'Run'
-        AND start_date_local >= ?
-        GROUP BY week
-        ORDER BY week ASC
-    """
+        WHERE type = 'Run' AND {owner_filter()}
+        AND start_at >= ?
+        AND private_note IS NOT NULL AND private_note != ''
+        GROUP BY week_key
+    """)
 
-    df = pd.read_sql_query(query, conn, params=(cutoff_date,))
+    df = pd.read_sql_query(query, conn, params=(since,))
+    notes = pd.read_sql_query(notes_query, conn, params=(db_timestamp(since),))
     conn.close()
+    df = df.merge(notes, on='week', how='left')
 
     if df.empty or len(df) < 2:
         return {
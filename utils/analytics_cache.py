@@ -0,0 +1,110 @@
+# utils/analytics_cache.py
+"""
+Snapshot local en Parquet de los DataFrames procesados de load_data().
+
+Cada escritura en activities/splits/laps incrementa un contador de generación en la
+tabla sync_meta. El snapshot guarda la generación con la que se construyó: si coincide
+con la de la BD se lee el fichero local (un arranque en frío en Streamlit Cloud no
+tiene que traerse todas las filas de Supabase); si no, se descarta y se reconstruye.
+También guarda FORMAT_VERSION: un snapshot de una versión anterior del código (otras
+columnas derivadas o dtypes) tampoco es válido aunque los datos no hayan cambiado.
+"""
+
+import hashlib
+import json
+import os
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (motor de pandas.read_parquet / to_parquet)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+from .db_config import get_db_config
+
+SNAPSHOT_DIR = os.getenv("DATA_CACHE_DIR", "data/cache")
+SNAPSHOT_TABLES = ("activities", "splits", "laps")
+SYNC_GENERATION_KEY = "sync_generation"
+# Subir cada vez que cambie cómo data_processing construye los DataFrames (columnas, dtypes...)
+FORMAT_VERSION = 2
+
+
+def bump_sync_generation(cur):
+    """Incrementa el contador de generación (llamar en la misma transacción que la escritura)."""
+    cur.execute("""
+        INSERT INTO sync_meta (key, value) VALUES (?, 1)
+        ON CONFLICT (key) DO UPDATE SET value = sync_meta.value + 1
+    """, (SYNC_GENERATION_KEY,))
+
+
+def get_sync_generation(conn) -> Optional[int]:
+    """Generación actual de los datos, o None si la tabla sync_meta aún no existe."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT value FROM sync_meta WHERE key = ?", (SYNC_GENERATION_KEY,))
+        row = cur.fetchone()
+    except Exception:
+        # En PostgreSQL el error deja la transacción abortada
+        conn.rollback()
+        return None
+    return int(row[0]) if row else 0
+
+
+def _source_id() -> str:
+    """Identifica la BD de origen, para no reutilizar un snapshot de otra BD."""
+    config = get_db_config()
+    source = config.url if config.is_postgres else os.path.abspath(config.sqlite_path)
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def _meta_path() -> str:
+    return os.path.join(SNAPSHOT_DIR, "meta.json")
+
+
+def read_snapshot(generation: Optional[int]):
+    """
+    Lee el snapshot si se construyó con 'generation', con la BD actual y con este FORMAT_VERSION.
+
+    Returns:
+        (activities, splits, laps, high_water) o None si no hay snapshot válido
+    """
+    if not PARQUET_AVAILABLE or generation is None:
+        return None
+    if not os.path.exists(_meta_path()):
+        return None
+    try:
+        with open(_meta_path()) as f:
+            meta = json.load(f)
+        if (meta.get("generation") != generation or meta.get("source") != _source_id()
+                or meta.get("format_version") != FORMAT_VERSION):
+            return None
+        frames = [pd.read_parquet(os.path.join(SNAPSHOT_DIR, f"{table}.parquet")) for table in SNAPSHOT_TABLES]
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️ Snapshot Parquet no disponible: {e}")
+        return None
+    return (*frames, meta.get("high_water"))
+
+
+def write_snapshot(activities, splits, laps, high_water, generation: Optional[int]):
+    """Guarda los DataFrames procesados; meta.json se escribe al final para que un snapshot a medias no sea válido."""
+    if not PARQUET_AVAILABLE or generation is None:
+        return
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        if os.path.exists(_meta_path()):
+            os.remove(_meta_path())
+        for table, frame in zip(SNAPSHOT_TABLES, (activities, splits, laps)):
+            path = os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+            frame.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+        tmp = _meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": generation, "source": _source_id(), "format_version": FORMAT_VERSION,
+                       "high_water": high_water}, f)
+        os.replace(tmp, _meta_path())
+    except (OSError, ValueError, TypeError) as e:
+        # El snapshot es solo una caché: si no se puede escribir, se sigue sin él
+        print(f"⚠️ No se pudo guardar el snapshot Parquet: {e}")
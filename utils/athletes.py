@@ -0,0 +1,81 @@
+# utils/athletes.py
+"""
+Atletas sincronizados por la aplicación (tabla athletes).
+
+Con un solo atleta (el caso de siempre) la tabla puede estar vacía: se usa
+STRAVA_REFRESH_TOKEN de secrets. Para un club, cada atleta autoriza la aplicación y
+se registra aquí con su refresh token; strava_client.sync_all_athletes() los reparte
+entre un pool de hilos, cada uno con su token y su parte del presupuesto de la API.
+
+El tablero, los agregados (weekly_rollup/monthly_rollup) y las herramientas del coach son
+de un solo atleta: el dueño de STRAVA_REFRESH_TOKEN. Leen solo sus actividades, las que no
+son de un atleta registrado aquí (owner_filter()), para no mezclar el volumen del club.
+"""
+
+from datetime import datetime, timezone
+from typing import List, Optional
+
+ATHLETE_COLUMNS = ("athlete_id", "name", "refresh_token", "active", "created_at")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_table(cur):
+    """Crea la tabla de atletas (se llama desde init_db)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS athletes (
+            athlete_id BIGINT PRIMARY KEY,
+            name TEXT,
+            refresh_token TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT,
+            last_synced_at TEXT,
+            last_error TEXT
+        )
+    """)
+
+
+def owner_filter(alias: Optional[str] = None) -> str:
+    """
+    Condición SQL de las actividades del dueño de la aplicación (sin atleta o de un atleta
+    no registrado en athletes). 'alias' es el alias de activities en la consulta, si lo tiene.
+    """
+    column = f"{alias}.athlete_id" if alias else "athlete_id"
+    return f"({column} IS NULL OR {column} NOT IN (SELECT athlete_id FROM athletes))"
+
+
+def add_athlete(cur, athlete_id: int, refresh_token: str, name: Optional[str] = None):
+    """Registra (o reactiva) un atleta con el refresh token obtenido al autorizar la aplicación."""
+    cur.upsert_many("athletes", ATHLETE_COLUMNS, [(athlete_id, name, refresh_token, 1, _now())],
+                    conflict_columns=("athlete_id",), update_columns=("name", "refresh_token", "active"))
+
+
+def deactivate_athlete(cur, athlete_id: int):
+    """Deja de sincronizar un atleta (p.ej. ha revocado el acceso); sus datos se conservan."""
+    cur.execute("UPDATE athletes SET active = 0 WHERE athlete_id = ?", (athlete_id,))
+
+
+def get_refresh_token(cur, athlete_id: int) -> Optional[str]:
+    cur.execute("SELECT refresh_token FROM athletes WHERE athlete_id = ?", (athlete_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def active_athletes(cur) -> List[int]:
+    """Atletas activos, primero los que hace más tiempo que no se sincronizan."""
+    cur.execute("""
+        SELECT athlete_id FROM athletes WHERE active = 1
+        ORDER BY CASE WHEN last_synced_at IS NULL THEN 0 ELSE 1 END, last_synced_at, athlete_id
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+def record_sync(cur, athlete_id: int, error: Optional[str] = None):
+    """Guarda el resultado de la última sincronización del atleta."""
+    if error is None:
+        cur.execute("UPDATE athletes SET last_synced_at = ?, last_error = NULL WHERE athlete_id = ?",
+                    (_now(), athlete_id))
+    else:
+        cur.execute("UPDATE athletes SET last_error = ? WHERE athlete_id = ?", (error, athlete_id))
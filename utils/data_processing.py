@@ -2,73 +2,340 @@
 import streamlit as st
 import pandas as pd
 import pytz
+import threading
 from datetime import datetime
-from .db_config import get_connection
+from .db_config import get_connection, get_db_config
+from .analytics_cache import get_sync_generation, read_snapshot, write_snapshot
+from .timestamps import db_timestamp, from_epoch
+from .sql_dialect import period_bucket
+from .athletes import owner_filter
+from . import rollups
+
+# Solo las carreras del dueño de la aplicación: el tablero no mezcla las de los atletas del club
+ACTIVITIES_WHERE = f"type = 'Run' AND {owner_filter()}"
+ACTIVITIES_QUERY = f"SELECT * FROM activities WHERE {ACTIVITIES_WHERE}"
+
+
+# Columnas que no se reducen: los IDs de Strava no caben en 32 bits
+_ID_COLUMNS = ('id', 'activity_id', 'lap_id', 'plan_id', 'linked_activity_id',
+               'athlete_id')
+
+
+def pace_from_time(seconds: pd.Series, meters: pd.Series) -> pd.Series:
+    """Ritmo (min/km) a partir de tiempo y distancia; NaN si alguno es 0 o nulo."""
+    seconds = seconds.astype('float32')
+    meters = meters.astype('float32')
+    valid = (seconds > 0) & (meters > 0)
+    return ((seconds / 60) / (meters / 1000)).where(valid).astype('float32')
+
+
+def pace_from_speed(speed_mps: pd.Series) -> pd.Series:
+    """Ritmo (min/km) a partir de la velocidad media (m/s); NaN si no es positiva."""
+    speed_mps = speed_mps.astype('float32')
+    return ((1000 / speed_mps) / 60).where(speed_mps > 0).astype('float32')
+
+
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce los numéricos a float32 / int32 (menos memoria, filtros más rápidos).
+
+    Los enteros no bajan de int32: tiempos en segundos multiplicados o acumulados
+    desbordarían un int16.
+    """
+    for column in df.columns:
+        if column in _ID_COLUMNS:
+            continue
+        dtype = df[column].dtype
+        if pd.api.types.is_float_dtype(dtype):
+            df[column] = df[column].astype('float32')
+        elif pd.api.types.is_integer_dtype(dtype) and df[column].abs().max() < 2 ** 31:
+            df[column] = df[column].astype('int32')
+    return df
+
+
+def _start_datetimes(activities: pd.DataFrame) -> pd.Series:
+    """
+    start_date_local como datetime (UTC, como hasta ahora) a partir de start_at, sin
+    parsear texto: epoch en SQLite, datetime64 ya convertido por el driver en PostgreSQL.
+    """
+    start_at = activities['start_at']
+    if pd.api.types.is_numeric_dtype(start_at):
+        start = pd.to_datetime(start_at, unit='s', utc=True)
+    else:
+        start = pd.to_datetime(start_at, utc=True)
+    missing = start.isna() & activities['start_date_local'].notna()
+    if missing.any():
+        # Filas escritas por código anterior a la migración 2
+        start[missing] = pd.to_datetime(activities.loc[missing, 'start_date_local'], utc=True)
+    return start
+
+
+def _high_water(activities: pd.DataFrame):
+    """MAX(start_at) como epoch (serializable en el meta.json del snapshot)."""
+    if activities.empty or activities['start_date_local'].isna().all():
+        return None
+    return int(activities['start_date_local'].max().timestamp())
+
+
+def _process_activities(activities: pd.DataFrame) -> pd.DataFrame:
+    activities['start_date_local'] = _start_datetimes(activities)
+    activities = activities.drop(columns='start_at')
+    activities = downcast(activities)
+    activities['distance_km'] = (activities['distance'] / 1000).astype('float32')
+    activities['pace_min_km'] = pace_from_time(activities['moving_time'], activities['distance'])
+    activities['moving_time_min'] = (activities['moving_time'] / 60).astype('float32')
+    activities['day_of_week'] = activities['start_date_local'].dt.day_name()
+    activities['hour'] = activities['start_date_local'].dt.hour.astype('int8')
+    return activities
+
+
+def _process_splits(splits: pd.DataFrame) -> pd.DataFrame:
+    """Procesa SPLITS (km automáticos con elevation_difference con signo)"""
+    splits = downcast(splits)
+    splits['distance_km'] = (splits['distance'] / 1000).astype('float32')
+    splits['elapsed_time_min'] = (splits['elapsed_time'] / 60).astype('float32')
+    splits['pace_min_km'] = pace_from_time(splits['elapsed_time'], splits['distance'])
+    splits['pace_from_speed'] = pace_from_speed(splits['average_speed'])
+    return splits
+
+
+def _process_laps(laps: pd.DataFrame) -> pd.DataFrame:
+    """Procesa LAPS (parciales/intervalos con total_elevation_gain)"""
+    laps = downcast(laps)
+    laps['distance_km'] = (laps['distance'] / 1000).astype('float32')
+    laps['moving_time_min'] = (laps['moving_time'] / 60).astype('float32')
+    laps['pace_min_km'] = pace_from_time(laps['moving_time'], laps['distance'])
+    laps['pace_from_speed'] = pace_from_speed(laps['average_speed'])
+    return laps
+
+
+def _append(frame: pd.DataFrame, delta: pd.DataFrame, key: str, ids) -> pd.DataFrame:
+    """Sustituye en 'frame' las filas de los IDs tocados por las de 'delta'."""
+    if frame.empty:
+        return delta
+    frame = frame[~frame[key].isin(ids)]
+    if delta.empty:
+        return frame
+    return pd.concat([frame, delta], ignore_index=True)
+
+
+class DataStore:
+    """
+    DataFrames ya procesados compartidos por todas las sesiones del proceso.
+
+    La primera carga lee las tres tablas completas; después, refresh() solo lee las
+    actividades nuevas (start_at por encima del high-water mark) o las que indique
+    la sincronización, y las añade a los frames en memoria. Así el coste de refrescar
+    depende del tamaño del cambio y no del histórico.
+
+    Los frames guardan la generación de sync_meta que reflejan: ensure_current() la
+    compara con la de la BD y recarga si otro proceso (webhook_server.py, backfill.py,
+    una sync por CLI) ha escrito desde entonces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.activities = None
+        self.splits = None
+        self.laps = None
+        self.high_water = None  # MAX(start_at) en segundos desde epoch
+        self.generation = None  # generación de sync_meta que reflejan los frames
+
+    @property
+    def loaded(self) -> bool:
+        return self.activities is not None
+
+    def _read(self, where: str = "", params=()):
+        """Lee y procesa actividades (+ sus splits y laps) que cumplen 'where'."""
+        conn = get_connection(read_only=True)
+        try:
+            activities = pd.read_sql_query(f"{ACTIVITIES_QUERY} {where}", conn, params=params)
+            children = f"WHERE activity_id IN (SELECT id FROM activities WHERE {ACTIVITIES_WHERE} {where})"
+            splits = pd.read_sql_query(f"SELECT * FROM splits {children}", conn, params=params)
+            laps = pd.read_sql_query(f"SELECT * FROM laps {children}", conn, params=params)
+        finally:
+            conn.close()
+
+        activities = _process_activities(activities)
+        return activities, _process_splits(splits), _process_laps(laps), _high_water(activities)
+
+    def _sort(self):
+        self.activities = self.activities.sort_values('start_date_local', ascending=False, ignore_index=True)
+
+    def _generation(self):
+        conn = get_connection(read_only=True)
+        try:
+            return get_sync_generation(conn)
+        finally:
+            conn.close()
+
+    def _save_snapshot(self, generation):
+        write_snapshot(self.activities, self.splits, self.laps, self.high_water, generation)
+
+    def load(self):
+        """Carga completa (primera vez o tras invalidate()): del snapshot Parquet si está al día, si no de la BD."""
+        with self._lock:
+            # La generación se lee antes que los datos: si una sync escribe mientras tanto,
+            # el snapshot queda marcado con la generación anterior y se descartará
+            generation = self._generation()
+            if self.loaded and generation == self.generation:
+                return  # otra sesión acaba de recargar
+            snapshot = read_snapshot(generation)
+            if snapshot is not None:
+                self.activities, self.splits, self.laps, self.high_water = snapshot
+            else:
+                self.activities, self.splits, self.laps, self.high_water = self._read()
+                self._sort()
+                self._save_snapshot(generation)
+            self.generation = generation
+
+    def ensure_current(self):
+        """
+        Carga los frames o, si la generación de la BD ha cambiado desde la última carga, los recarga.
+
+        Un SELECT de una fila por llamada. Los cambios de otros procesos no dicen qué
+        actividades han tocado (pueden ser altas, cambios o borrados), así que se recarga
+        todo; los de la propia app llegan antes por refresh() y no provocan recarga.
+        """
+        if not self.loaded or self._generation() != self.generation:
+            self.load()
+
+    def refresh(self, activity_ids=None) -> int:
+        """
+        Aplica a los frames en memoria los cambios desde la última carga.
+
+        Args:
+            activity_ids: IDs insertados o modificados por la sincronización. Si es None,
+                se leen las actividades con start_at posterior al high-water mark.
+
+        Returns:
+            Número de actividades leídas
+        """
+        if not self.loaded:
+            self.load()
+            return len(self.activities)
+
+        with self._lock:
+            generation = self._generation()
+            if activity_ids is not None:
+                ids = [int(i) for i in activity_ids]
+                if not ids:
+                    return 0
+                placeholders = ', '.join('?' for _ in ids)
+                activities, splits, laps, high_water = self._read(f"AND id IN ({placeholders})", tuple(ids))
+            elif self.high_water is not None:
+                activities, splits, laps, high_water = self._read(
+                    "AND start_at > ?", (db_timestamp(from_epoch(self.high_water)),))
+                ids = activities['id'].tolist()
+            else:
+                activities, splits, laps, high_water = self._read()
+                ids = activities['id'].tolist()
+
+            # Con IDs explícitos se quitan también los que ya no están en la BD (borrados)
+            if activities.empty and activity_ids is None:
+                self.generation = generation
+                return 0
+
+            self.activities = _append(self.activities, activities, 'id', ids)
+            self.splits = _append(self.splits, splits, 'activity_id', ids)
+            self.laps = _append(self.laps, laps, 'activity_id', ids)
+            if high_water is not None and (self.high_water is None or high_water > self.high_water):
+                self.high_water = high_water
+            self._sort()
+            self._save_snapshot(generation)
+            self.generation = generation
+            return len(activities)
+
+    def invalidate(self):
+        """Descarta los frames; la siguiente lectura hará una carga completa."""
+        with self._lock:
+            self.activities = self.splits = self.laps = self.high_water = self.generation = None
+
+
+@st.cache_resource
+def ensure_schema():
+    """Crea las tablas y aplica las migraciones pendientes, una vez por proceso."""
+    from strava_client import init_db
+    init_db(get_db_config().sqlite_path)
+
+
+@st.cache_resource
+def get_data_store() -> DataStore:
+    ensure_schema()
+    return DataStore()
+
 
-# La decoración de caché se queda con la función
-@st.cache_data
 def load_data():
     """Carga y procesa los datos desde la base de datos (SQLite o PostgreSQL)"""
     try:
-        conn = get_connection()
+        store = get_data_store()
+        store.ensure_current()
+        # Copias: las páginas pueden modificar los DataFrames sin tocar los de la caché
+        return store.activities.copy(), store.splits.copy(), store.laps.copy()  # Retornar TOTS TRES
+
+    except Exception as e:
+        st.error(f"Error cargando datos: {e}")
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+
+def load_period_volume(period: str, start=None, end=None, min_distance_km: float = 0.0,
+                       long_run_km: float = 16.0) -> pd.DataFrame:
+    """
+    Volumen de carrera por semana ('week') o mes ('month'), agregado en la BD.
 
-        # Cargar actividades
-        activities_query = "SELECT * FROM activities WHERE type = 'Run' ORDER BY start_date_local DESC"
-        activities = pd.read_sql_query(activities_query, conn)
+    Solo viajan las filas agrupadas. 'start'/'end' son fechas u horas locales (incluidas).
+    Sin filtros (todo el histórico, tirada larga por defecto) se leen de los agregados
+    precalculados (utils/rollups.py); con filtros se agrega al vuelo.
 
-        # Cargar SPLITS (km automáticos con elevation_difference con signo)
-        splits_query = "SELECT * FROM splits"
-        splits = pd.read_sql_query(splits_query, conn)
+    Returns:
+        DataFrame ordenado con bucket ('YYYY-MM-DD' del lunes o 'YYYY-MM'), distance_km,
+        runs, moving_time, avg_pace (media del ritmo de cada carrera) y long_runs
+    """
+    if start is None and end is None and min_distance_km <= 0 and long_run_km == rollups.LONG_RUN_KM:
+        return rollups.load_rollup(period)
 
-        # Cargar LAPS (parciales/intervalos con total_elevation_gain)
-        laps_query = "SELECT * FROM laps"
-        laps = pd.read_sql_query(laps_query, conn)
+    bucket = period_bucket(period)
+    where, params = [ACTIVITIES_WHERE, "distance >= ?"], [long_run_km * 1000, min_distance_km * 1000]
+    if start is not None:
+        where.append("start_at >= ?")
+        params.append(db_timestamp(start))
+    if end is not None:
+        where.append("start_at <= ?")
+        params.append(db_timestamp(end))
 
+    query = f"""
+        SELECT
+            {bucket} AS bucket,
+            SUM(distance) / 1000.0 AS distance_km,
+            COUNT(*) AS runs,
+            SUM(moving_time) AS moving_time,
+            AVG(CASE WHEN distance > 0 AND moving_time > 0
+                THEN (moving_time / 60.0) / (distance / 1000.0) END) AS avg_pace,
+            SUM(CASE WHEN distance >= ? THEN 1 ELSE 0 END) AS long_runs
+        FROM activities
+        WHERE {' AND '.join(where)}
+        GROUP BY {bucket}
+        ORDER BY bucket
+    """
+    conn = get_connection(read_only=True)
+    try:
+        return pd.read_sql_query(query, conn, params=tuple(params))
+    finally:
         conn.close()
 
-        # Procesamiento de datos
-        activities['start_date_local'] = pd.to_datetime(activities['start_date_local'], utc=True)
-        activities['distance_km'] = activities['distance'] / 1000
-        activities['pace_min_km'] = (activities['moving_time'] / 60) / activities['distance_km']
-        activities['moving_time_min'] = activities['moving_time'] / 60
-        activities['month_year'] = activities['start_date_local'].dt.to_period('M').astype(str)
-        activities['week_year'] = activities['start_date_local'].dt.to_period('W').astype(str)
-        activities['day_of_week'] = activities['start_date_local'].dt.day_name()
-        activities['hour'] = activities['start_date_local'].dt.hour
-
-        # Procesar SPLITS (km automáticos)
-        if not splits.empty:
-            splits['distance_km'] = splits['distance'] / 1000
-            splits['elapsed_time_min'] = splits['elapsed_time'] / 60
-
-            # Calcular ritmo (min/km) solo para splits con distancia > 0
-            splits['pace_min_km'] = None
-            mask = (splits['distance'] > 0) & (splits['elapsed_time'] > 0)
-            splits.loc[mask, 'pace_min_km'] = (splits.loc[mask, 'elapsed_time'] / 60) / (splits.loc[mask, 'distance'] / 1000)
-
-            # También podemos usar average_speed si está disponible
-            speed_mask = splits['average_speed'] > 0
-            splits.loc[speed_mask, 'pace_from_speed'] = (1000 / splits.loc[speed_mask, 'average_speed']) / 60
-
-        # Procesar LAPS (parciales/intervalos)
-        if not laps.empty:
-            laps['distance_km'] = laps['distance'] / 1000
-            laps['moving_time_min'] = laps['moving_time'] / 60
-
-            # Calcular ritmo (min/km) solo para laps con distancia > 0
-            laps['pace_min_km'] = None
-            mask = (laps['distance'] > 0) & (laps['moving_time'] > 0)
-            laps.loc[mask, 'pace_min_km'] = (laps.loc[mask, 'moving_time'] / 60) / (laps.loc[mask, 'distance'] / 1000)
-
-            # También podemos usar average_speed si está disponible
-            speed_mask = laps['average_speed'] > 0
-            laps.loc[speed_mask, 'pace_from_speed'] = (1000 / laps.loc[speed_mask, 'average_speed']) / 60
-
-        return activities, splits, laps  # Retornar TOTS TRES
 
-    except Exception as e:
-        st.error(f"Error cargando datos: {e}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+def refresh_data(activity_ids=None) -> int:
+    """
+    Actualiza la caché de load_data() con las actividades nuevas o modificadas.
+
+    Args:
+        activity_ids: IDs tocados por la última sincronización (None → por high-water mark)
+
+    Returns:
+        Número de actividades leídas de la BD
+    """
+    return get_data_store().refresh(activity_ids)
+
 
 # Puedes mover get_timezone_aware_datetime aquí también si quieres
 def get_timezone_aware_datetime(dt):
@@ -4,22 +4,31 @@ Capa de abstracción para base de datos.
 Soporta SQLite (desarrollo local) y PostgreSQL (producción en Streamlit Cloud).
 """
 
+import hashlib
 import os
+import re
 import sqlite3
+import threading
+import time
+import urllib.parse
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Optional
 
 # Intentar importar psycopg2 (solo necesario en producción)
 try:
     import psycopg2
     import psycopg2.extras
+    import psycopg2.pool
     POSTGRES_AVAILABLE = True
 except ImportError:
     POSTGRES_AVAILABLE = False
 
 
-def get_database_url() -> Optional[str]:
+def _resolve_database_url() -> Optional[str]:
     """
-    Obtiene la URL de la base de datos desde variables de entorno o secrets de Streamlit.
+    Resuelve la URL de la base de datos desde variables de entorno o secrets de Streamlit.
 
     Returns:
         URL de la base de datos o None si no está configurada (usa SQLite por defecto)
@@ -51,6 +60,69 @@ def get_database_url() -> Optional[str]:
     return None
 
 
+@dataclass(frozen=True)
+class DatabaseConfig:
+    """Configuración de BD resuelta una sola vez por proceso (inmutable)."""
+    url: Optional[str]
+    is_postgres: bool
+    sqlite_path: str = 'data/strava_activities.db'
+    # PREPARE/EXECUTE en el servidor para las PreparedQuery (solo PostgreSQL).
+    # Desactivado por defecto: el pooler de Supabase en modo transacción (puerto 6543) no lo soporta.
+    prepared_statements: bool = False
+
+    @property
+    def db_type(self) -> str:
+        return 'postgresql' if self.is_postgres else 'sqlite'
+
+
+_config: Optional[DatabaseConfig] = None
+_config_lock = threading.Lock()
+
+
+def get_db_config() -> DatabaseConfig:
+    """
+    Devuelve la configuración de BD, resolviéndola (entorno / st.secrets) solo la primera vez.
+
+    Las llamadas siguientes no leen el entorno, no importan streamlit ni escriben logs,
+    así que is_postgres(), adapt_query() y get_connection() no cuestan nada en el hot path.
+    """
+    global _config
+    config = _config
+    if config is None:
+        with _config_lock:
+            if _config is None:
+                url = _resolve_database_url()
+                _config = DatabaseConfig(
+                    url=url,
+                    is_postgres=url is not None and POSTGRES_AVAILABLE,
+                    prepared_statements=os.getenv("DB_PREPARED_STATEMENTS", "").lower() in ("1", "true", "yes"),
+                )
+            config = _config
+    return config
+
+
+def reload_db_config() -> DatabaseConfig:
+    """
+    Vuelve a resolver la configuración (p.ej. tras cambiar DATABASE_URL o los secrets)
+    y cierra las conexiones del pool anterior.
+    """
+    global _config
+    with _config_lock:
+        _config = None
+    close_pool()
+    return get_db_config()
+
+
+def get_database_url() -> Optional[str]:
+    """
+    Obtiene la URL de la base de datos desde variables de entorno o secrets de Streamlit.
+
+    Returns:
+        URL de la base de datos o None si no está configurada (usa SQLite por defecto)
+    """
+    return get_db_config().url
+
+
 def is_postgres() -> bool:
     """
     Determina si estamos usando PostgreSQL o SQLite.
@@ -58,22 +130,130 @@ def is_postgres() -> bool:
     Returns:
         True si estamos usando PostgreSQL, False si SQLite
     """
-    return get_database_url() is not None and POSTGRES_AVAILABLE
+    return get_db_config().is_postgres
+
+
+def _upsert_parts(table: str, columns, conflict_columns, update_columns=None):
+    """Devuelve (prefijo INSERT ... VALUES, sufijo ON CONFLICT ...) para un upsert."""
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in conflict_columns]
+
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES"
+    target = ', '.join(conflict_columns)
+    if update_columns:
+        assignments = ', '.join(f"{c} = excluded.{c}" for c in update_columns)
+        suffix = f"ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+    else:
+        suffix = f"ON CONFLICT ({target}) DO NOTHING"
+    return prefix, suffix
+
+
+def build_upsert_query(table: str, columns, conflict_columns, update_columns=None) -> str:
+    """
+    Construye un upsert de una fila con placeholders '?' (válido en SQLite y PostgreSQL).
+
+    Args:
+        table: Tabla destino
+        columns: Columnas a insertar
+        conflict_columns: Columnas de la clave única (PRIMARY KEY o UNIQUE INDEX)
+        update_columns: Columnas a actualizar si ya existe la fila.
+            None → todas las que no son clave; [] → DO NOTHING (solo insertar si no existe)
+
+    Returns:
+        Query INSERT ... ON CONFLICT (...) DO UPDATE/NOTHING
+    """
+    prefix, suffix = _upsert_parts(table, columns, conflict_columns, update_columns)
+    placeholders = ', '.join('?' for _ in columns)
+    return f"{prefix} ({placeholders}) {suffix}"
+
+
+class PreparedQuery(str):
+    """
+    Marca una query como candidata a prepared statement en el servidor.
+
+    Se usa como un str normal; en PostgreSQL con DB_PREPARED_STATEMENTS activo, CursorWrapper
+    la ejecuta con PREPARE/EXECUTE y el servidor se ahorra el parse/plan en llamadas repetidas.
+    En SQLite (o con la opción desactivada) se ejecuta como cualquier otra query.
+    """
+    __slots__ = ()
+
+
+# Literales, identificadores entre comillas, dollar quotes y comentarios: su contenido no se toca
+_SQL_TOKENS = re.compile(
+    r"""
+      '(?:[^']|'')*'          # 'literal' (con '' escapado)
+    | "(?:[^"]|"")*"          # "identificador"
+    | \$(\w*)\$.*?\$\1\$      # $$dollar quote$$
+    | --[^\n]*                # comentario de línea
+    | /\*.*?\*/               # comentario de bloque
+    | (?P<placeholder>\?)
+    | %
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+
+
+@lru_cache(maxsize=512)
+def _translate_placeholders(query: str, numbered: bool = False, escape_percent: bool = False):
+    """
+    Convierte los placeholders '?' de SQLite al estilo de PostgreSQL.
+
+    Recorre la query por tokens, así que un '?' dentro de un literal ('¿qué tal?') o de un
+    comentario no se toma por placeholder. El resultado se cachea por texto de la query.
+
+    Args:
+        query: Query con placeholders '?'
+        numbered: False → '%s' (psycopg2); True → '$1', '$2'... (PREPARE)
+        escape_percent: Duplicar los '%' (psycopg2 los interpreta cuando recibe parámetros,
+            también dentro de literales, p.ej. strftime('%Y', ...))
+
+    Returns:
+        (query traducida, número de placeholders)
+    """
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        if match.group('placeholder'):
+            count += 1
+            return f"${count}" if numbered else "%s"
+        token = match.group(0)
+        return token.replace('%', '%%') if escape_percent else token
+
+    return _SQL_TOKENS.sub(replace, query), count
+
+
+# Nombres de los prepared statements ya creados en cada conexión física de PostgreSQL
+_prepared_statements = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+# Límite por conexión, por si se marcan queries generadas dinámicamente
+DB_PREPARED_MAX = int(os.getenv("DB_PREPARED_MAX", 100))
+
+
+def _prepared_names(connection) -> set:
+    with _prepared_lock:
+        names = _prepared_statements.get(connection)
+        if names is None:
+            names = _prepared_statements[connection] = set()
+        return names
 
 
 class CursorWrapper:
     """
     Wrapper para cursor que convierte placeholders ? a %s automáticamente en PostgreSQL.
     """
-    def __init__(self, cursor, is_postgres: bool):
+    def __init__(self, cursor, is_postgres: bool, prepared: Optional[set] = None):
         self.cursor = cursor
         self.is_postgres = is_postgres
+        # Prepared statements ya creados en la conexión (None → no usar PREPARE)
+        self._prepared = prepared
 
     def execute(self, query: str, params=None):
         """Ejecuta query adaptando placeholders si es necesario."""
-        if self.is_postgres and '?' in query:
-            # Convertir ? a %s para PostgreSQL
-            query = query.replace('?', '%s')
+        if self.is_postgres:
+            if self._prepared is not None and isinstance(query, PreparedQuery):
+                return self._execute_prepared(query, params)
+            query, _ = _translate_placeholders(query, escape_percent=bool(params))
 
         if params:
             return self.cursor.execute(query, params)
@@ -81,10 +261,55 @@ class CursorWrapper:
 
     def executemany(self, query: str, params_list):
         """Ejecuta query múltiples veces adaptando placeholders."""
-        if self.is_postgres and '?' in query:
-            query = query.replace('?', '%s')
+        if self.is_postgres:
+            query, _ = _translate_placeholders(query, escape_percent=True)
         return self.cursor.executemany(query, params_list)
 
+    def _execute_prepared(self, query: PreparedQuery, params=None):
+        """Ejecuta la query con EXECUTE, preparándola la primera vez que se usa en esta conexión."""
+        name = "ps_" + hashlib.md5(query.encode()).hexdigest()[:16]
+        if name not in self._prepared:
+            if len(self._prepared) >= DB_PREPARED_MAX:
+                return self.execute(str(query), params)
+            statement, _ = _translate_placeholders(query, numbered=True)
+            self.cursor.execute(f"PREPARE {name} AS {statement}")
+            self._prepared.add(name)
+
+        if params:
+            placeholders = ', '.join('%s' for _ in params)
+            return self.cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        return self.cursor.execute(f"EXECUTE {name}")
+
+    def insert_many(self, table: str, columns, rows, page_size: int = 500):
+        """
+        Inserta muchas filas de golpe.
+
+        - PostgreSQL: psycopg2.extras.execute_values (un INSERT multi-fila por página,
+          un solo round trip en lugar de uno por fila).
+        - SQLite: executemany.
+        """
+        self._bulk_insert(f"INSERT INTO {table} ({', '.join(columns)}) VALUES", "", len(columns), rows, page_size)
+
+    def upsert_many(self, table: str, columns, rows, conflict_columns, update_columns=None,
+                    page_size: int = 500):
+        """
+        Inserta o actualiza muchas filas de golpe con INSERT ... ON CONFLICT.
+
+        Funciona igual en SQLite (>= 3.24) y PostgreSQL. Ver build_upsert_query().
+        """
+        prefix, suffix = _upsert_parts(table, columns, conflict_columns, update_columns)
+        self._bulk_insert(prefix, suffix, len(columns), rows, page_size)
+
+    def _bulk_insert(self, prefix: str, suffix: str, n_columns: int, rows, page_size: int):
+        rows = list(rows)
+        if not rows:
+            return
+        if self.is_postgres:
+            psycopg2.extras.execute_values(self.cursor, f"{prefix} %s {suffix}", rows, page_size=page_size)
+        else:
+            placeholders = ', '.join('?' for _ in range(n_columns))
+            self.cursor.executemany(f"{prefix} ({placeholders}) {suffix}", rows)
+
     def fetchone(self):
         return self.cursor.fetchone()
 
@@ -131,14 +356,20 @@ class CursorWrapper:
 class ConnectionWrapper:
     """
     Wrapper para conexión que devuelve CursorWrapper en lugar de cursor normal.
+
+    Si se crea con 'release', close() no cierra la conexión física sino que la devuelve
+    al pool (o a la caché por hilo de SQLite) para reutilizarla.
     """
-    def __init__(self, connection, is_postgres: bool):
+    def __init__(self, connection, is_postgres: bool, release=None, prepared_statements: bool = False):
         self.connection = connection
         self.is_postgres = is_postgres
+        self._release = release
+        self._closed = False
+        self._prepared = _prepared_names(connection) if is_postgres and prepared_statements else None
 
     def cursor(self):
         """Devuelve un cursor wrapeado que adapta placeholders."""
-        return CursorWrapper(self.connection.cursor(), self.is_postgres)
+        return CursorWrapper(self.connection.cursor(), self.is_postgres, self._prepared)
 
     def commit(self):
         return self.connection.commit()
@@ -147,6 +378,11 @@ class ConnectionWrapper:
         return self.connection.rollback()
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._release is not None:
+            return self._release(self.connection)
         return self.connection.close()
 
     def __enter__(self):
@@ -155,39 +391,290 @@ class ConnectionWrapper:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def __del__(self):
+        # Si alguien olvida close(), la conexión vuelve igualmente al pool
+        try:
+            self.close()
+        except Exception:
+            pass
 
-def get_connection():
+
+# Configuración del pool de PostgreSQL
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+# Conexiones que llevan más de estos segundos sin usarse se validan con SELECT 1 antes de reutilizarlas
+DB_POOL_HEALTH_CHECK_IDLE = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", 30))
+
+
+class PostgresPool:
+    """
+    Pool de conexiones PostgreSQL compartido por todo el proceso.
+
+    Basado en psycopg2.pool.ThreadedConnectionPool, con dos añadidos:
+    - Un semáforo de tamaño DB_POOL_MAX: si el pool está lleno, getconn() espera en lugar
+      de lanzar PoolError.
+    - Health check: las conexiones cerradas se descartan y las que llevan un rato
+      inactivas se validan con SELECT 1 (Supabase corta conexiones ociosas).
+    """
+
+    def __init__(self, dsn: str, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 health_check_idle: float = DB_POOL_HEALTH_CHECK_IDLE):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        # psycopg2 solo conserva 'minconn' conexiones ociosas y cierra el resto al devolverlas.
+        # Se abren 'minconn' al arrancar, pero se conservan hasta 'maxconn' para reutilizarlas.
+        self._pool.minconn = maxconn
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._health_check_idle = health_check_idle
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle < self._health_check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            while True:
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                print("[DB_CONFIG] Discarding broken pooled PostgreSQL connection")
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                return
+            try:
+                # Igual que al cerrar una conexión: lo no confirmado se descarta
+                conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+            except psycopg2.Error:
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+# Pragmas de SQLite. En modo WAL las lecturas de las páginas no esperan a la sync que
+# escribe (leen el último estado confirmado) y busy_timeout hace que dos escritores se
+# esperen en lugar de fallar con "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 32768))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Conexiones libres que guarda cada hilo; las que sobran (conexiones anidadas) se cierran
+SQLITE_MAX_IDLE_PER_THREAD = int(os.getenv("SQLITE_MAX_IDLE_PER_THREAD", 2))
+
+
+def configure_sqlite(conn, read_only: bool = False):
+    """
+    Aplica los pragmas de rendimiento a una conexión SQLite.
+
+    journal_mode=WAL queda guardado en el fichero, así que solo hace falta que lo pida
+    una conexión de escritura; synchronous=NORMAL es seguro en WAL (una caída puede
+    perder la última transacción, pero no corrompe la BD).
     """
-    Crea y devuelve una conexión a la base de datos apropiada.
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    if not read_only:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def _discard_sqlite(conn, owners: dict):
+    """Cierra una conexión de SQLiteConnectionCache que no vuelve a ninguna lista libre."""
+    owners.pop(id(conn), None)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
 
-    - Si DATABASE_URL está configurada → PostgreSQL (Supabase)
-    - Si no → SQLite local (desarrollo)
+
+def _discard_all_sqlite(conns: list, owners: dict):
+    for conn in conns:
+        _discard_sqlite(conn, owners)
+    conns.clear()
+
+
+class _FreeList:
+    """Conexiones libres de un hilo; se cierran al liberarse su threading.local (fin del hilo o de la caché)."""
+
+    def __init__(self, owners: dict):
+        self.conns = []
+        # Sin referencia a la caché: close_pool() la suelta y el recolector cierra sus conexiones
+        weakref.finalize(self, _discard_all_sqlite, self.conns, owners)
+
+
+class SQLiteConnectionCache:
+    """
+    Reutiliza conexiones SQLite por hilo (sqlite3 no permite compartirlas entre hilos).
+
+    close() sobre el wrapper no cierra el fichero: deshace lo no confirmado y deja la
+    conexión en la lista libre del hilo para la siguiente llamada a get_connection().
+    Si un mismo hilo anida conexiones, cada una es distinta (igual que antes); al
+    devolverlas solo se guardan SQLITE_MAX_IDLE_PER_THREAD y el resto se cierra. Las
+    devueltas desde otro hilo, y las libres de un hilo que termina, también se cierran.
+
+    Con read_only=True las conexiones se abren con una URI mode=ro: cualquier escritura
+    falla en lugar de bloquear la BD. Hay una caché de cada tipo (ver get_connection).
+    """
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self._local = threading.local()
+        self._owners = {}
+
+    def _connect(self):
+        timeout = SQLITE_BUSY_TIMEOUT_MS / 1000
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # check_same_thread=False solo para poder cerrarlas desde otro hilo (putconn, fin del hilo):
+        # cada conexión se usa únicamente en el hilo que la abrió (ver _owners)
+        if not self.read_only:
+            return sqlite3.connect(self.db_path, timeout=timeout, check_same_thread=False)
+        if not os.path.exists(self.db_path):
+            # mode=ro no crea el fichero: se crea antes (ya en WAL) con una conexión de escritura
+            conn = sqlite3.connect(self.db_path, timeout=timeout)
+            configure_sqlite(conn)
+            conn.close()
+        uri = f"file:{urllib.parse.quote(os.path.abspath(self.db_path))}?mode=ro"
+        return sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False)
+
+    def _free(self) -> list:
+        free = getattr(self._local, "free", None)
+        if free is None:
+            free = self._local.free = _FreeList(self._owners)
+        return free.conns
+
+    def getconn(self):
+        free = self._free()
+        if free:
+            return free.pop()
+        conn = self._connect()
+        configure_sqlite(conn, self.read_only)
+        self._owners[id(conn)] = threading.get_ident()
+        return conn
+
+    def putconn(self, conn):
+        if self._owners.get(id(conn)) != threading.get_ident():
+            # Devuelta desde otro hilo (p.ej. el recolector de basura): no es reutilizable aquí
+            _discard_sqlite(conn, self._owners)
+            return
+        free = self._free()
+        if len(free) >= SQLITE_MAX_IDLE_PER_THREAD:
+            _discard_sqlite(conn, self._owners)
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        free.append(conn)
+
+
+_pool_lock = threading.Lock()
+_pg_pool: Optional[PostgresPool] = None
+_sqlite_cache: Optional[SQLiteConnectionCache] = None
+_sqlite_read_cache: Optional[SQLiteConnectionCache] = None
+
+
+def _postgres_dsn(db_url: str) -> str:
+    # IMPORTANTE: Forzar SSL si la URL no lo especifica
+    # Supabase requiere SSL para conexiones externas
+    if '?' not in db_url:
+        # No hay query params, añadir sslmode=require
+        return f"{db_url}?sslmode=require"
+    if 'sslmode' not in db_url:
+        # Hay query params pero no sslmode, añadirlo
+        return f"{db_url}&sslmode=require"
+    return db_url
+
+
+def _get_pg_pool(db_url: str) -> PostgresPool:
+    global _pg_pool
+    if _pg_pool is None:
+        with _pool_lock:
+            if _pg_pool is None:
+                dsn = _postgres_dsn(db_url)
+                print(f"[DB_CONFIG] Creating PostgreSQL pool with SSL (max {DB_POOL_MAX} connections)")
+                _pg_pool = PostgresPool(dsn)
+    return _pg_pool
+
+
+def _get_sqlite_cache(read_only: bool = False) -> SQLiteConnectionCache:
+    global _sqlite_cache, _sqlite_read_cache
+    cache = _sqlite_read_cache if read_only else _sqlite_cache
+    if cache is None:
+        with _pool_lock:
+            if read_only:
+                if _sqlite_read_cache is None:
+                    _sqlite_read_cache = SQLiteConnectionCache(get_db_config().sqlite_path, read_only=True)
+                cache = _sqlite_read_cache
+            else:
+                if _sqlite_cache is None:
+                    _sqlite_cache = SQLiteConnectionCache(get_db_config().sqlite_path)
+                cache = _sqlite_cache
+    return cache
+
+
+def close_pool():
+    """Cierra todas las conexiones del pool de PostgreSQL (p.ej. al cambiar de BD)."""
+    global _pg_pool, _sqlite_cache, _sqlite_read_cache
+    with _pool_lock:
+        if _pg_pool is not None:
+            _pg_pool.closeall()
+        _pg_pool = None
+        _sqlite_cache = None
+        _sqlite_read_cache = None
+
+
+def get_connection(read_only: bool = False):
+    """
+    Devuelve una conexión a la base de datos apropiada, reutilizada de un pool.
+
+    - Si DATABASE_URL está configurada → PostgreSQL (Supabase), desde un pool compartido
+      por el proceso (evita un handshake TLS por consulta)
+    - Si no → SQLite local (desarrollo), una conexión reutilizada por hilo, en modo WAL
+
+    Los llamantes siguen usando conn.close(): devuelve la conexión al pool.
+
+    Args:
+        read_only: Solo lecturas (páginas, herramientas de consulta del coach). En SQLite
+            sale de una caché aparte de conexiones mode=ro, que no compiten con la de
+            escritura de la sync; en PostgreSQL no cambia nada (MVCC: leer no bloquea)
 
     Returns:
         ConnectionWrapper que adapta placeholders automáticamente
     """
-    db_url = get_database_url()
+    config = get_db_config()
 
-    if db_url and POSTGRES_AVAILABLE:
+    if config.is_postgres:
         # Producción: PostgreSQL (Supabase)
-        # IMPORTANTE: Forzar SSL si la URL no lo especifica
-        # Supabase requiere SSL para conexiones externas
-        if '?' not in db_url:
-            # No hay query params, añadir sslmode=require
-            db_url = f"{db_url}?sslmode=require"
-        elif 'sslmode' not in db_url:
-            # Hay query params pero no sslmode, añadirlo
-            db_url = f"{db_url}&sslmode=require"
-
-        print(f"[DB_CONFIG] Connecting to PostgreSQL with SSL (URL length: {len(db_url)})")
-        conn = psycopg2.connect(db_url)
-        return ConnectionWrapper(conn, is_postgres=True)
+        pool = _get_pg_pool(config.url)
+        return ConnectionWrapper(pool.getconn(), is_postgres=True, release=pool.putconn,
+                                 prepared_statements=config.prepared_statements)
     else:
         # Desarrollo: SQLite local
-        db_path = 'data/strava_activities.db'
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        conn = sqlite3.connect(db_path)
-        return ConnectionWrapper(conn, is_postgres=False)
+        cache = _get_sqlite_cache(read_only)
+        return ConnectionWrapper(cache.getconn(), is_postgres=False, release=cache.putconn)
 
 
 def adapt_query(query: str) -> str:
@@ -204,8 +691,8 @@ def adapt_query(query: str) -> str:
         Query adaptada según la BD activa
     """
     if is_postgres():
-        # Convertir ? a %s para PostgreSQL
-        return query.replace('?', '%s')
+        # Convertir ? a %s para PostgreSQL (los '?' dentro de literales se respetan)
+        return _translate_placeholders(query)[0]
     return query
 
 
@@ -224,12 +711,11 @@ def execute_query(query: str, params: tuple = None, fetch: str = None) -> Any:
     conn = get_connection()
     cur = conn.cursor()
 
-    adapted_query = adapt_query(query)
-
+    # CursorWrapper ya adapta los placeholders
     if params:
-        cur.execute(adapted_query, params)
+        cur.execute(query, params)
     else:
-        cur.execute(adapted_query)
+        cur.execute(query)
 
     result = None
     if fetch == 'one':
@@ -263,7 +749,7 @@ def get_db_type() -> str:
     Returns:
         'postgresql' o 'sqlite'
     """
-    return 'postgresql' if is_postgres() else 'sqlite'
+    return get_db_config().db_type
 
 
 # Información de debugging
@@ -0,0 +1,199 @@
+# utils/migrations.py
+"""
+Migraciones versionadas del esquema (tabla schema_migrations).
+
+init_db() crea las tablas con CREATE TABLE IF NOT EXISTS y después llama a
+run_migrations(), que aplica en orden las migraciones aún no registradas. Cada
+migración se ejecuta en su propia transacción junto con su fila en schema_migrations,
+bajo un bloqueo (advisory lock en PostgreSQL, BEGIN IMMEDIATE en SQLite) para que dos
+procesos arrancando a la vez no la apliquen dos veces.
+
+Para añadir una migración: una función (cur, is_postgres) decorada con
+@migration(<siguiente versión>, "<nombre>"). Nunca se modifica una ya publicada.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple
+
+from . import rollups, timestamps
+from .analytics_cache import bump_sync_generation
+
+# Clave del advisory lock de PostgreSQL (arbitraria, fija para toda la aplicación)
+MIGRATION_LOCK_KEY = 7_271_017_021
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Registra una migración. Las versiones deben ser consecutivas."""
+    def register(fn):
+        if MIGRATIONS and version != MIGRATIONS[-1].version + 1:
+            raise ValueError(f"Migración {version} fuera de orden (última: {MIGRATIONS[-1].version})")
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+    return register
+
+
+def create_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def table_columns(cur, table: str, is_postgres: bool) -> List[str]:
+    """Columnas existentes de una tabla."""
+    if is_postgres:
+        cur.execute("SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = ?", (table,))
+        return [row[0] for row in cur.fetchall()]
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+def applied_versions(cur) -> set:
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _lock(conn, cur):
+    """Bloqueo exclusivo hasta el commit/rollback de la transacción actual."""
+    if conn.is_postgres:
+        cur.execute("SELECT pg_advisory_xact_lock(?)", (MIGRATION_LOCK_KEY,))
+    else:
+        if conn.connection.in_transaction:
+            conn.commit()
+        cur.execute("BEGIN IMMEDIATE")
+
+
+def run_migrations(conn) -> List[int]:
+    """
+    Aplica las migraciones pendientes sobre 'conn' (sin cerrarla).
+
+    Returns:
+        Versiones aplicadas en esta llamada
+    """
+    cur = conn.cursor()
+    create_table(cur)
+    conn.commit()
+    if set(m.version for m in MIGRATIONS) <= applied_versions(cur):
+        return []
+
+    applied = []
+    for m in MIGRATIONS:
+        try:
+            _lock(conn, cur)
+            # Otro proceso puede haberla aplicado mientras esperábamos el bloqueo
+            if m.version in applied_versions(cur):
+                conn.commit()
+                continue
+            m.apply(cur, conn.is_postgres)
+            cur.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                        (m.version, m.name, datetime.now(timezone.utc).isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"🗄️  Migración {m.version} aplicada: {m.name}")
+        applied.append(m.version)
+    return applied
+
+
+# --- Migraciones -------------------------------------------------------------
+
+# Índices de los caminos calientes: (nombre, tabla, columnas clave, columnas incluidas).
+# Las incluidas hacen el índice "covering" para las agregaciones semanales (volumen, ritmo,
+# FC): en PostgreSQL van en INCLUDE y en SQLite se añaden al final de la clave.
+HOT_PATH_INDEXES = (
+    # Herramientas del coach, ai_context y load_data:
+    # WHERE type = 'Run' AND start_date_local >= ? ORDER BY / GROUP BY fecha
+    ("idx_activities_type_date", "activities", ("type", "start_date_local"),
+     ("distance", "moving_time", "average_heartrate")),
+    # Sincronización por atleta: MAX(start_date_local) WHERE athlete_id = ?
+    ("idx_activities_athlete_date", "activities", ("athlete_id", "start_date_local"), ()),
+    # get_workouts_for_plan / get_current_week_workouts: WHERE plan_id = ? ORDER BY date
+    ("idx_planned_workouts_plan_date", "planned_workouts", ("plan_id", "date"), ()),
+    # get_unlinked_activities: NOT IN (SELECT linked_activity_id ... IS NOT NULL)
+    ("idx_planned_workouts_linked_activity", "planned_workouts", ("linked_activity_id",), ()),
+    # get_active_plan: WHERE status = 'active' ORDER BY week_start_date DESC LIMIT 1
+    ("idx_training_plans_status_week", "training_plans", ("status", "week_start_date"), ()),
+    # load_chat_history: ORDER BY timestamp DESC LIMIT ?
+    ("idx_chat_history_timestamp", "chat_history", ("timestamp",), ()),
+    # Borrado de entrenos: DELETE FROM workout_feedback WHERE planned_workout_id = ?
+    ("idx_workout_feedback_planned_workout", "workout_feedback", ("planned_workout_id",), ()),
+)
+
+
+def index_sql(name: str, table: str, columns, include, is_postgres: bool) -> str:
+    if include and is_postgres:
+        return (f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)}) "
+                f"INCLUDE ({', '.join(include)})")
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(tuple(columns) + tuple(include))})"
+
+
+@migration(1, "hot_path_indexes")
+def _hot_path_indexes(cur, is_postgres: bool):
+    for index in HOT_PATH_INDEXES:
+        cur.execute(index_sql(*index, is_postgres))
+
+
+# Índices sobre las columnas tipadas de la migración 2; sustituyen a idx_activities_type_date
+TYPED_DATE_INDEXES = (
+    # Filtros de rango: WHERE type = 'Run' AND start_at >= ? ORDER BY start_at
+    ("idx_activities_type_start_at", "activities", ("type", "start_at"),
+     ("distance", "moving_time", "average_heartrate")),
+    # Agregados semanales de todo el histórico: WHERE type = 'Run' GROUP BY week_key (sin ordenar)
+    ("idx_activities_type_week", "activities", ("type", "week_key"),
+     ("distance", "moving_time", "average_heartrate")),
+)
+
+
+@migration(2, "typed_start_timestamps")
+def _typed_start_timestamps(cur, is_postgres: bool):
+    """start_at (TIMESTAMP / epoch) y week_key derivados de start_date_local (ver utils/timestamps.py)."""
+    columns = table_columns(cur, "activities", is_postgres)
+    if "start_at" not in columns:
+        cur.execute(f"ALTER TABLE activities ADD COLUMN start_at {timestamps.start_at_type(is_postgres)}")
+    if "week_key" not in columns:
+        cur.execute("ALTER TABLE activities ADD COLUMN week_key TEXT")
+
+    cur.execute("SELECT id, start_date_local FROM activities WHERE start_at IS NULL AND start_date_local IS NOT NULL")
+    rows = [(timestamps.db_value(start, is_postgres), timestamps.week_key(start), act_id)
+            for act_id, start in cur.fetchall()]
+    if rows:
+        cur.executemany("UPDATE activities SET start_at = ?, week_key = ? WHERE id = ?", rows)
+        # Los snapshots Parquet de load_data() no tienen las columnas nuevas
+        bump_sync_generation(cur)
+        print(f"🗓️  start_at/week_key calculados para {len(rows)} actividades")
+
+    cur.execute("DROP INDEX IF EXISTS idx_activities_type_date")
+    for index in TYPED_DATE_INDEXES:
+        cur.execute(index_sql(*index, is_postgres))
+
+
+@migration(3, "weekly_monthly_rollups")
+def _weekly_monthly_rollups(cur, is_postgres: bool):
+    """Primer cálculo de weekly_rollup/monthly_rollup (las tablas las crea init_db)."""
+    weeks, months = rollups.rebuild(cur)
+    print(f"📊 Agregados calculados: {weeks} semanas, {months} meses")
+
+
+@migration(4, "owner_only_rollups")
+def _owner_only_rollups(cur, is_postgres: bool):
+    """Los agregados y el tablero solo cuentan las carreras del dueño (athletes.owner_filter())."""
+    cur.execute("SELECT COUNT(*) FROM athletes")
+    if cur.fetchone()[0]:
+        weeks, months = rollups.rebuild(cur)
+        # Los snapshots Parquet de load_data() incluyen las actividades del club
+        bump_sync_generation(cur)
+        print(f"📊 Agregados recalculados sin los atletas del club: {weeks} semanas, {months} meses")
@@ -0,0 +1,258 @@
+# utils/oauth_tokens.py
+"""
+Caché persistente del access token de Strava (tabla oauth_tokens).
+
+Los access tokens duran 6 horas: en lugar de pedir uno nuevo a /oauth/token en cada
+sincronización, se guarda en la BD junto con su expires_at y se reutiliza hasta que
+esté a punto de caducar.
+
+Si varios procesos o sesiones de Streamlit lo necesitan a la vez, solo uno llama a Strava:
+reclama la renovación en una transacción corta (fila con plazo en oauth_refresh_claims,
+bajo BEGIN IMMEDIATE en SQLite o advisory lock en PostgreSQL), hace la petición fuera de
+cualquier transacción (puede esperar al rate limit sin bloquear la BD) y guarda el token
+en otra transacción corta, solo si nadie ha guardado uno entretanto (compare-and-swap
+sobre expires_at). El resto espera a ese token. Strava puede rotar el refresh token al
+renovar: se guarda también el nuevo.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from .db_config import get_connection
+
+# Se renueva el token si caduca en menos de estos segundos
+TOKEN_REFRESH_MARGIN = int(os.getenv("STRAVA_TOKEN_REFRESH_MARGIN", 300))
+# Plazo de la reclamación: si quien renueva no termina (p.ej. se cae), otro puede reclamarla
+TOKEN_REFRESH_LEASE = int(os.getenv("STRAVA_TOKEN_REFRESH_LEASE", 60))
+# Cada cuántos segundos se mira si el proceso que renueva ya ha guardado el token
+_CLAIM_POLL_INTERVAL = 0.5
+
+TOKEN_COLUMNS = ("client_id", "access_token", "refresh_token", "expires_at", "updated_at")
+
+# Copia en memoria para no ir a la BD en cada llamada dentro del mismo proceso
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def create_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS oauth_tokens (
+            client_id TEXT PRIMARY KEY,
+            access_token TEXT NOT NULL,
+            refresh_token TEXT,
+            expires_at BIGINT NOT NULL,
+            updated_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS oauth_refresh_claims (
+            client_id TEXT PRIMARY KEY,
+            claimed_until BIGINT NOT NULL
+        )
+    """)
+
+
+def _is_fresh(token, margin: int) -> bool:
+    return token is not None and token["expires_at"] - margin > time.time()
+
+
+def _read(cur, client_id: str):
+    cur.execute("SELECT access_token, refresh_token, expires_at FROM oauth_tokens WHERE client_id = ?",
+                (client_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {"access_token": row[0], "refresh_token": row[1], "expires_at": int(row[2])}
+
+
+def _lock(conn, cur, client_id: str):
+    """Bloqueo exclusivo hasta el commit/rollback de la transacción actual."""
+    if conn.is_postgres:
+        key = int.from_bytes(hashlib.sha1(f"oauth:{client_id}".encode()).digest()[:8], "big", signed=True)
+        cur.execute("SELECT pg_advisory_xact_lock(?)", (key,))
+    else:
+        if conn.connection.in_transaction:
+            conn.commit()
+        cur.execute("BEGIN IMMEDIATE")
+
+
+def _claim(client_id: str, margin: int):
+    """
+    Transacción corta: devuelve (token guardado, True si este proceso debe renovarlo).
+
+    Con False, o el token guardado ya es válido o hay otra renovación en curso.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        try:
+            token = _read(cur, client_id)
+        except Exception:
+            # La tabla aún no existe (primera ejecución, antes de init_db)
+            conn.rollback()
+            token = None
+        if _is_fresh(token, margin):
+            return token, False
+
+        _lock(conn, cur, client_id)
+        # Dentro del bloqueo: en PostgreSQL dos CREATE TABLE IF NOT EXISTS simultáneos pueden chocar
+        create_table(cur)
+        # Otro proceso puede haberlo renovado mientras esperábamos el bloqueo
+        token = _read(cur, client_id)
+        if _is_fresh(token, margin):
+            conn.commit()
+            return token, False
+
+        now = int(time.time())
+        cur.execute("SELECT claimed_until FROM oauth_refresh_claims WHERE client_id = ?", (client_id,))
+        row = cur.fetchone()
+        if row is not None and int(row[0]) > now:
+            conn.commit()
+            return token, False
+        cur.upsert_many("oauth_refresh_claims", ("client_id", "claimed_until"),
+                        [(client_id, now + TOKEN_REFRESH_LEASE)], conflict_columns=("client_id",))
+        conn.commit()
+        return token, True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _store(client_id: str, seen, token) -> dict:
+    """
+    Transacción corta: guarda el token renovado y libera la reclamación.
+
+    Compare-and-swap: si el expires_at guardado ya no es el que había al reclamar (otro
+    proceso renovó tras caducar nuestra reclamación), se conserva el suyo.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        _lock(conn, cur, client_id)
+        current = _read(cur, client_id)
+        seen_expires_at = seen["expires_at"] if seen else None
+        current_expires_at = current["expires_at"] if current else None
+        if current_expires_at == seen_expires_at:
+            cur.upsert_many("oauth_tokens", TOKEN_COLUMNS,
+                            [(client_id, token["access_token"], token["refresh_token"], token["expires_at"],
+                              datetime.now(timezone.utc).isoformat())],
+                            conflict_columns=("client_id",))
+            print("🔑 Access token de Strava renovado")
+        else:
+            token = current
+        cur.execute("DELETE FROM oauth_refresh_claims WHERE client_id = ?", (client_id,))
+        conn.commit()
+        return token
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _release(client_id: str):
+    """Libera la reclamación tras un error, para que otro proceso pueda reintentar ya."""
+    conn = get_connection()
+    try:
+        conn.cursor().execute("DELETE FROM oauth_refresh_claims WHERE client_id = ?", (client_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_access_token(client_id: Optional[str], refresh_token: Optional[str],
+                     refresh: Callable[[str], dict], margin: int = TOKEN_REFRESH_MARGIN) -> str:
+    """
+    Devuelve un access token válido, renovándolo solo si está a punto de caducar.
+
+    Args:
+        client_id: CLIENT_ID de la aplicación (clave de la caché)
+        refresh_token: Refresh token configurado (secrets / .env); se usa si no hay uno guardado
+        refresh: Función que llama a /oauth/token con un refresh token y devuelve el JSON
+            ({'access_token', 'refresh_token', 'expires_at', ...})
+        margin: Segundos antes de expires_at a partir de los cuales se renueva
+
+    Returns:
+        access_token
+    """
+    client_id = str(client_id or "default")
+
+    with _memory_lock:
+        token = _memory.get(client_id)
+    if _is_fresh(token, margin):
+        return token["access_token"]
+
+    while True:
+        token, claimed = _claim(client_id, margin)
+        if _is_fresh(token, margin):
+            break
+        if not claimed:
+            # Otro proceso está renovando: su token aparecerá en la tabla (o su reclamación caducará)
+            time.sleep(_CLAIM_POLL_INTERVAL)
+            continue
+        try:
+            fresh = _request_token(token, refresh_token, refresh)
+        except Exception:
+            _release(client_id)
+            raise
+        token = _store(client_id, token, fresh)
+        break
+
+    with _memory_lock:
+        _memory[client_id] = token
+    return token["access_token"]
+
+
+def invalidate(client_id: Optional[str], access_token: str):
+    """
+    Descarta un access token que Strava ha rechazado (401) antes de su expires_at, para que
+    la siguiente get_access_token() lo renueve. Solo si sigue siendo el guardado: si otro
+    proceso ya lo ha renovado, se reutiliza el suyo.
+    """
+    client_id = str(client_id or "default")
+    with _memory_lock:
+        token = _memory.get(client_id)
+        if token is not None and token["access_token"] == access_token:
+            del _memory[client_id]
+
+    conn = get_connection()
+    try:
+        conn.cursor().execute("UPDATE oauth_tokens SET expires_at = 0 WHERE client_id = ? AND access_token = ?",
+                              (client_id, access_token))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _request_token(stored, configured_refresh_token, refresh) -> dict:
+    """Pide un token nuevo a Strava (con el refresh token más reciente), sin tocar la BD."""
+    candidates = [stored["refresh_token"]] if stored and stored["refresh_token"] else []
+    if configured_refresh_token and configured_refresh_token not in candidates:
+        candidates.append(configured_refresh_token)
+    if not candidates:
+        raise RuntimeError("No hay refresh token de Strava configurado (STRAVA_REFRESH_TOKEN)")
+
+    for i, candidate in enumerate(candidates):
+        try:
+            data = refresh(candidate)
+            break
+        except Exception as e:
+            # Si el guardado ya no es válido (p.ej. se revocó el acceso), probar con el configurado
+            if i == len(candidates) - 1:
+                raise
+            print(f"⚠️  Refresh token guardado rechazado ({e}), probando con el configurado...")
+
+    return {
+        "access_token": data["access_token"],
+        "refresh_token": data.get("refresh_token") or candidate,
+        "expires_at": int(data.get("expires_at") or time.time() + int(data.get("expires_in", 21600))),
+    }
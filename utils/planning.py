@@ -2,12 +2,14 @@
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
-from .db_config import get_connection
+from .db_config import get_connection, PreparedQuery
+from .timestamps import db_timestamp
+from .athletes import owner_filter
 
 
 def get_current_plan(db_path='data/strava_activities.db') -> Optional[Dict]:
     """Obtiene el plan de entrenamiento activo actual."""
-    conn = get_connection()
+    conn = get_connection(read_only=True)
     query = """
         SELECT * FROM training_plans
         WHERE status = 'active'
@@ -24,15 +26,17 @@ def get_current_plan(db_path='data/strava_activities.db') -> Optional[Dict]:
 
 def get_planned_workouts(plan_id: int, db_path='data/strava_activities.db') -> pd.DataFrame:
     """Obtiene todos los entrenamientos planificados de un plan."""
-    conn = get_connection()
-    query = """
-        SELECT pw.*, a.name as activity_name, a.distance/1000 as activity_distance_km,
+    conn = get_connection(read_only=True)
+    query = PreparedQuery("""
+        SELECT pw.id, pw.plan_id, pw.date, pw.workout_type, pw.distance_km, pw.description,
+               pw.pace_objective, pw.notes, pw.status, pw.linked_activity_id, pw.created_at,
+               a.name as activity_name, a.distance/1000 as activity_distance_km,
                a.moving_time, a.start_date_local
         FROM planned_workouts pw
         LEFT JOIN activities a ON pw.linked_activity_id = a.id
         WHERE pw.plan_id = ?
         ORDER BY pw.date
-    """
+    """)
     df = pd.read_sql_query(query, conn, params=(plan_id,))
     conn.close()
     return df
@@ -53,7 +57,7 @@ def get_upcoming_workouts(weeks=4, include_past_weeks=0, start_date=None, end_da
     Returns:
         DataFrame con los entrenamientos del plan activo en el rango de fechas
     """
-    conn = get_connection()
+    conn = get_connection(read_only=True)
 
     # Calcular fechas del rango
     if start_date is None:
@@ -62,8 +66,10 @@ def get_upcoming_workouts(weeks=4, include_past_weeks=0, start_date=None, end_da
     if end_date is None:
         end_date = (datetime.now().date() + timedelta(weeks=weeks)).isoformat()
 
-    query = """
-        SELECT pw.*, a.name as activity_name, a.distance/1000 as activity_distance_km,
+    query = PreparedQuery("""
+        SELECT pw.id, pw.plan_id, pw.date, pw.workout_type, pw.distance_km, pw.description,
+               pw.pace_objective, pw.notes, pw.status, pw.linked_activity_id, pw.created_at,
+               a.name as activity_name, a.distance/1000 as activity_distance_km,
                a.moving_time, a.start_date_local
         FROM planned_workouts pw
         JOIN training_plans tp ON pw.plan_id = tp.id
@@ -71,7 +77,7 @@ def get_upcoming_workouts(weeks=4, include_past_weeks=0, start_date=None, end_da
         WHERE tp.status = 'active'
         AND pw.date BETWEEN ? AND ?
         ORDER BY pw.date
-    """
+    """)
     df = pd.read_sql_query(query, conn, params=(start_date, end_date))
     conn.close()
     return df
@@ -138,20 +144,20 @@ def link_activity_to_workout(workout_id: int, activity_id: int,
 
 def get_unlinked_activities(days=7, db_path='data/strava_activities.db') -> pd.DataFrame:
     """Obtiene actividades recientes no vinculadas a ningún plan."""
-    conn = get_connection()
-    cutoff_date = (datetime.now().date() - timedelta(days=days)).isoformat()
+    conn = get_connection(read_only=True)
+    cutoff_date = db_timestamp(datetime.now().date() - timedelta(days=days))
 
-    query = """
+    query = f"""
         SELECT a.*
         FROM activities a
-        WHERE a.type = 'Run'
-        AND DATE(a.start_date_local) >= ?
+        WHERE a.type = 'Run' AND {owner_filter("a")}
+        AND a.start_at >= ?
         AND a.id NOT IN (
             SELECT linked_activity_id
             FROM planned_workouts
             WHERE linked_activity_id IS NOT NULL
         )
-        ORDER BY a.start_date_local DESC
+        ORDER BY a.start_at DESC
     """
     df = pd.read_sql_query(query, conn, params=(cutoff_date,))
     conn.close()
@@ -0,0 +1,173 @@
+# utils/rate_limit.py
+"""
+Planificador de peticiones a la API de Strava guiado por las cabeceras de rate limit.
+
+Strava devuelve en cada respuesta:
+    X-RateLimit-Limit: 200,2000     (límite 15 minutos, límite diario)
+    X-RateLimit-Usage: 12,340       (uso actual en cada ventana)
+y, para peticiones de lectura, las equivalentes X-ReadRateLimit-*.
+
+Las ventanas de 15 minutos se reinician en los cuartos naturales de hora (00, 15, 30, 45)
+y la diaria a medianoche UTC, así que el planificador puede saber cuánto presupuesto
+queda y cuándo se recupera.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+WINDOW_15MIN = 15 * 60
+
+# Errores transitorios que merece la pena reintentar
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+
+def _parse_pair(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Convierte '200,2000' en (200, 2000). Devuelve None si la cabecera no es válida."""
+    if not value:
+        return None
+    try:
+        short, daily = (int(part.strip()) for part in value.split(","))
+        return short, daily
+    except ValueError:
+        return None
+
+
+def seconds_to_window_reset(now: float) -> float:
+    """Segundos hasta el siguiente cuarto de hora natural."""
+    return WINDOW_15MIN - (now % WINDOW_15MIN)
+
+
+def seconds_to_daily_reset(now: float) -> float:
+    """Segundos hasta la próxima medianoche UTC."""
+    current = datetime.fromtimestamp(now, tz=timezone.utc)
+    midnight = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - current).total_seconds()
+
+
+class RateLimitScheduler:
+    """
+    Reparte las peticiones para aprovechar todo el presupuesto sin provocar un 429.
+
+    - Mientras queda más de la mitad de la ventana de 15 minutos, deja pasar las
+      peticiones en ráfaga (las sincronizaciones pequeñas no esperan).
+    - A partir de ahí, reparte las peticiones restantes uniformemente hasta el reinicio.
+    - Si la ventana (o la diaria) está agotada, espera al reinicio.
+
+    El uso se cuenta localmente y se corrige con las cabeceras de cada respuesta, de modo
+    que también se tiene en cuenta el consumo de otros procesos con la misma aplicación.
+    """
+
+    def __init__(self, limit_15min: int = 100, limit_daily: int = 1000,
+                 max_retries: int = 5, backoff_base: float = 1.0, pacing_threshold: float = 0.5):
+        self.limit_15min = limit_15min
+        self.limit_daily = limit_daily
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.pacing_threshold = pacing_threshold
+
+        self._lock = threading.Lock()
+        self._usage_15min = 0
+        self._usage_daily = 0
+        self._window = None
+        self._day = None
+        self._last_request_at = 0.0
+
+    def _roll_windows(self, now: float):
+        """Reinicia los contadores locales al cambiar de ventana."""
+        window = int(now // WINDOW_15MIN)
+        day = datetime.fromtimestamp(now, tz=timezone.utc).date()
+        if window != self._window:
+            self._window = window
+            self._usage_15min = 0
+        if day != self._day:
+            self._day = day
+            self._usage_daily = 0
+
+    def _wait_time(self, now: float) -> float:
+        if self._usage_daily >= self.limit_daily:
+            return seconds_to_daily_reset(now)
+
+        remaining = self.limit_15min - self._usage_15min
+        if remaining <= 0:
+            return seconds_to_window_reset(now)
+
+        if self._usage_15min < self.limit_15min * self.pacing_threshold:
+            return 0.0
+
+        interval = seconds_to_window_reset(now) / remaining
+        return max(0.0, self._last_request_at + interval - now)
+
+    def acquire(self):
+        """Reserva una petición, esperando lo necesario para no superar el presupuesto."""
+        while True:
+            with self._lock:
+                now = time.time()
+                self._roll_windows(now)
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    self._usage_15min += 1
+                    self._usage_daily += 1
+                    self._last_request_at = now
+                    return
+
+            if wait > 5:
+                print(f"⏳ Presupuesto de Strava agotado, esperando {wait:.0f}s...")
+            time.sleep(wait)
+
+    def remaining_daily(self) -> int:
+        """Peticiones que quedan hoy según el uso conocido (local y cabeceras)."""
+        with self._lock:
+            self._roll_windows(time.time())
+            return max(0, self.limit_daily - self._usage_daily)
+
+    def update_from_headers(self, headers):
+        """
+        Ajusta límites y uso con las cabeceras X-RateLimit-* y X-ReadRateLimit-* de la respuesta.
+
+        Strava puede enviar las dos parejas: para cada ventana se usa la que deja menos
+        peticiones disponibles (límite - uso).
+        """
+        pairs = []
+        for prefix in ("X-ReadRateLimit", "X-RateLimit"):
+            limit = _parse_pair(headers.get(f"{prefix}-Limit"))
+            usage = _parse_pair(headers.get(f"{prefix}-Usage"))
+            if limit and usage:
+                pairs.append((limit, usage))
+        if not pairs:
+            return
+
+        # (límite, uso) más restrictivo de cada ventana: índice 0 → 15 minutos, 1 → diaria
+        (limit_15min, usage_15min), (limit_daily, usage_daily) = (
+            min(((limit[i], usage[i]) for limit, usage in pairs), key=lambda pair: pair[0] - pair[1])
+            for i in (0, 1)
+        )
+        with self._lock:
+            self._roll_windows(time.time())
+            self.limit_15min, self.limit_daily = limit_15min, limit_daily
+            # max(): las peticiones aún en vuelo de este proceso no salen en la cabecera
+            self._usage_15min = max(self._usage_15min, usage_15min)
+            self._usage_daily = max(self._usage_daily, usage_daily)
+
+    def on_throttled(self, retry_after: Optional[str] = None) -> float:
+        """
+        Registra un 429 y devuelve los segundos a esperar antes de reintentar.
+
+        Si Strava envía Retry-After se respeta tal cual; si no, se marca la ventana como
+        agotada y acquire() esperará hasta el próximo reinicio.
+        """
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        with self._lock:
+            self._roll_windows(time.time())
+            self._usage_15min = max(self._usage_15min, self.limit_15min)
+        return 0.0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Espera exponencial con jitter para errores transitorios (5xx, red)."""
+        return self.backoff_base * (2 ** attempt) + random.uniform(0, self.backoff_base)
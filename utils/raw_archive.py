@@ -0,0 +1,92 @@
+# utils/raw_archive.py
+"""
+Archivo de las respuestas crudas de Strava (tabla raw_archive).
+
+Cada detalle (/activities/{id}) y lista de laps (/activities/{id}/laps) descargados se
+guarda tal cual, en JSON comprimido con gzip, en la misma transacción que las filas
+derivadas. Si la respuesta no ha cambiado no se duplica (clave activity_id + kind + sha1
+del JSON): solo se actualiza su fetched_at; si ha cambiado se añade una versión nueva.
+Así la versión con el fetched_at más reciente es siempre la última descargada, también
+si una respuesta vuelve a un contenido anterior (A → B → A).
+
+Así, cuando se añade una columna derivada (como private_note), basta con
+strava_client.rebuild_from_archive() para repoblar activities/splits/laps desde la BD,
+sin volver a descargar el historial de Strava.
+"""
+
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Tuple
+
+KIND_DETAIL = "detail"
+KIND_LAPS = "laps"
+
+ARCHIVE_COLUMNS = ("activity_id", "kind", "payload_sha1", "fetched_at", "payload")
+
+
+def create_table(cur, is_postgres: bool):
+    """Crea la tabla del archivo (se llama desde init_db)."""
+    blob = "BYTEA" if is_postgres else "BLOB"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS raw_archive (
+            activity_id BIGINT NOT NULL,
+            kind TEXT NOT NULL,
+            payload_sha1 TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            payload {blob} NOT NULL,
+            PRIMARY KEY (activity_id, kind, payload_sha1)
+        )
+    """)
+
+
+def encode(payload) -> Tuple[str, bytes]:
+    """Devuelve (sha1 del JSON, JSON comprimido con gzip)."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha1(raw).hexdigest(), gzip.compress(raw, compresslevel=6)
+
+
+def decode(blob) -> object:
+    # psycopg2 devuelve BYTEA como memoryview
+    return json.loads(gzip.decompress(bytes(blob)))
+
+
+def archive(cur, kind: str, payloads: Iterable[Tuple[int, object]]):
+    """Guarda las respuestas [(activity_id, payload), ...]; las ya archivadas solo actualizan fetched_at."""
+    fetched_at = datetime.now(timezone.utc).isoformat()
+    # Por clave: en PostgreSQL ON CONFLICT DO UPDATE no puede tocar dos veces la misma fila
+    rows = {}
+    for activity_id, payload in payloads:
+        if payload is None:
+            continue
+        sha1, blob = encode(payload)
+        rows[(activity_id, sha1)] = (activity_id, kind, sha1, fetched_at, blob)
+    cur.upsert_many("raw_archive", ARCHIVE_COLUMNS, rows.values(),
+                    conflict_columns=("activity_id", "kind", "payload_sha1"), update_columns=["fetched_at"])
+
+
+def iter_latest(cur, batch_size: int = 200) -> Iterator[Dict[int, Dict[str, object]]]:
+    """
+    Recorre el archivo en lotes de actividades con la versión más reciente de cada respuesta.
+
+    Devuelve lotes {activity_id: {'detail': ..., 'laps': ...}} (falta la clave si ese tipo
+    de respuesta no está archivado). Solo se descomprime un lote cada vez.
+    """
+    cur.execute("SELECT DISTINCT activity_id FROM raw_archive ORDER BY activity_id")
+    activity_ids = [row[0] for row in cur.fetchall()]
+
+    for start in range(0, len(activity_ids), batch_size):
+        ids = activity_ids[start:start + batch_size]
+        placeholders = ", ".join("?" for _ in ids)
+        cur.execute(
+            f"SELECT activity_id, kind, payload FROM raw_archive WHERE activity_id IN ({placeholders}) "
+            "ORDER BY activity_id, kind, fetched_at",
+            ids,
+        )
+        latest: Dict[int, Dict[str, object]] = {}
+        for activity_id, kind, blob in cur.fetchall():
+            # Ordenado por fetched_at: la última versión sobrescribe a las anteriores
+            latest.setdefault(activity_id, {})[kind] = blob
+        yield {act_id: {kind: decode(blob) for kind, blob in kinds.items()} for act_id, kinds in latest.items()}
+
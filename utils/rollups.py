@@ -0,0 +1,171 @@
+# utils/rollups.py
+"""
+Agregados por semana y por mes de las carreras (tablas weekly_rollup y monthly_rollup).
+
+Cada escritura de activities (_store_activities, delete_activities) recalcula en la misma
+transacción solo las semanas y meses afectados, así que las herramientas del coach y el
+tablero leen una fila por periodo en lugar de agregar todas las actividades en cada
+llamada. rebuild() los recalcula desde cero (python rebuild_rollups.py).
+
+Las semanas se identifican por activities.week_key (lunes, 'YYYY-MM-DD') y los meses por
+'YYYY-MM'. El ritmo medio es la media del ritmo de cada carrera, como en el tablero.
+Solo cuentan las carreras del dueño de la aplicación (athletes.owner_filter()), no las de
+los atletas del club.
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+import pandas as pd
+
+from . import timestamps
+from .athletes import owner_filter
+from .db_config import get_connection
+from .sql_dialect import month_bucket
+
+# Distancia a partir de la cual una carrera cuenta como tirada larga (por defecto del tablero)
+LONG_RUN_KM = float(os.getenv("LONG_RUN_KM", 16))
+
+ROLLUP_TABLES = {"week": ("weekly_rollup", "week_key"), "month": ("monthly_rollup", "month_key")}
+METRIC_COLUMNS = ("runs", "distance_km", "moving_time", "elevation_gain", "avg_pace", "avg_hr", "long_runs")
+
+# IN (...) por sentencia al refrescar muchas semanas
+_CHUNK = 200
+
+
+def create_tables(cur):
+    """Crea las tablas de agregados (se llama desde init_db)."""
+    # REAL es de 4 bytes en PostgreSQL: las sumas perderían decimales respecto a la agregación al vuelo
+    real = "DOUBLE PRECISION" if cur.is_postgres else "REAL"
+    for table, key in ROLLUP_TABLES.values():
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key} TEXT PRIMARY KEY,
+                runs INTEGER NOT NULL,
+                distance_km {real} NOT NULL,
+                moving_time BIGINT NOT NULL,
+                elevation_gain {real},
+                avg_pace {real},
+                avg_hr {real},
+                long_runs INTEGER NOT NULL,
+                updated_at TEXT
+            )
+        """)
+
+
+def _aggregate(cur, period: str, where: str = "", params=()):
+    """
+    Upsert (INSERT ... SELECT ... ON CONFLICT) de los periodos de activities que cumplen 'where'.
+
+    Con ON CONFLICT, dos syncs que recalculan la misma semana a la vez (atletas en paralelo,
+    webhook) no chocan con la clave primaria: en PostgreSQL la segunda espera a la primera
+    y actualiza la fila.
+    """
+    table, key = ROLLUP_TABLES[period]
+    bucket = "week_key" if period == "week" else month_bucket(postgres=cur.is_postgres)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in METRIC_COLUMNS + ("updated_at",))
+    cur.execute(f"""
+        INSERT INTO {table} ({key}, {', '.join(METRIC_COLUMNS)}, updated_at)
+        SELECT
+            {bucket},
+            COUNT(*),
+            SUM(distance) / 1000.0,
+            SUM(moving_time),
+            SUM(total_elevation_gain),
+            AVG(CASE WHEN distance > 0 AND moving_time > 0
+                THEN (moving_time / 60.0) / (distance / 1000.0) END),
+            AVG(average_heartrate),
+            SUM(CASE WHEN distance >= ? THEN 1 ELSE 0 END),
+            ?
+        FROM activities
+        WHERE type = 'Run' AND start_at IS NOT NULL AND {owner_filter()} {where}
+        GROUP BY {bucket}
+        ON CONFLICT ({key}) DO UPDATE SET {updates}
+    """, (LONG_RUN_KM * 1000, datetime.now(timezone.utc).isoformat(), *params))
+
+
+def affected_buckets(cur, activity_ids: Iterable[int]) -> Tuple[set, set]:
+    """(semanas, meses) en los que están guardadas ahora las actividades: llamar antes de cambiarlas o borrarlas."""
+    weeks, months = set(), set()
+    ids = list(activity_ids)
+    for start in range(0, len(ids), _CHUNK):
+        chunk = ids[start:start + _CHUNK]
+        cur.execute(f"SELECT start_date_local FROM activities WHERE type = 'Run' AND id IN "
+                    f"({', '.join('?' for _ in chunk)})", chunk)
+        for (start_date_local,) in cur.fetchall():
+            weeks.add(timestamps.week_key(start_date_local))
+            months.add(timestamps.month_key(start_date_local))
+    weeks.discard(None)
+    months.discard(None)
+    return weeks, months
+
+
+def buckets_of(details) -> Tuple[set, set]:
+    """(semanas, meses) de los detalles de Strava que se van a guardar."""
+    runs = [detail["start_date_local"] for detail in details if detail.get("type") == "Run"]
+    return {timestamps.week_key(start) for start in runs}, {timestamps.month_key(start) for start in runs}
+
+
+def refresh(cur, weeks: Iterable[str] = (), months: Iterable[str] = ()):
+    """Recalcula las semanas y meses indicados desde activities (sin commit)."""
+    weeks = sorted(set(weeks))
+    for start in range(0, len(weeks), _CHUNK):
+        chunk = weeks[start:start + _CHUNK]
+        placeholders = ", ".join("?" for _ in chunk)
+        _aggregate(cur, "week", f"AND week_key IN ({placeholders})", chunk)
+        # Semanas que se han quedado sin carreras (actividad borrada, movida o que ya no es 'Run')
+        cur.execute(f"""
+            DELETE FROM weekly_rollup
+            WHERE week_key IN ({placeholders})
+            AND NOT EXISTS (SELECT 1 FROM activities a
+                            WHERE a.type = 'Run' AND a.start_at IS NOT NULL AND a.week_key = weekly_rollup.week_key
+                            AND {owner_filter("a")})
+        """, chunk)
+
+    for month in sorted(set(months)):
+        # Rango de start_at (indexado) en lugar de agrupar por la expresión del mes
+        month_start, month_end = timestamps.month_range(month)
+        bounds = (timestamps.db_value(month_start, cur.is_postgres), timestamps.db_value(month_end, cur.is_postgres))
+        _aggregate(cur, "month", "AND start_at >= ? AND start_at < ?", bounds)
+        cur.execute(f"""
+            DELETE FROM monthly_rollup
+            WHERE month_key = ?
+            AND NOT EXISTS (SELECT 1 FROM activities
+                            WHERE type = 'Run' AND start_at >= ? AND start_at < ? AND {owner_filter()})
+        """, (month, *bounds))
+
+
+def rebuild(cur) -> Tuple[int, int]:
+    """Recalcula todos los agregados (sin commit). Devuelve (semanas, meses)."""
+    counts = []
+    for period, (table, _) in ROLLUP_TABLES.items():
+        cur.execute(f"DELETE FROM {table}")
+        _aggregate(cur, period)
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        counts.append(cur.fetchone()[0])
+    return tuple(counts)
+
+
+def load_rollup(period: str, since: Optional[str] = None, conn=None) -> pd.DataFrame:
+    """
+    Agregados de 'week' o 'month' en orden cronológico, con la clave en la columna 'bucket'.
+
+    Args:
+        period: 'week' o 'month'
+        since: Primera clave a incluir ('YYYY-MM-DD' del lunes o 'YYYY-MM'); None → todas
+        conn: Conexión a reutilizar (si no, se abre y se cierra una)
+    """
+    table, key = ROLLUP_TABLES[period]
+    query = f"SELECT {key} AS bucket, {', '.join(METRIC_COLUMNS)} FROM {table}"
+    params = ()
+    if since is not None:
+        query += f" WHERE {key} >= ?"
+        params = (since,)
+    own_conn = conn is None
+    conn = conn or get_connection(read_only=True)
+    try:
+        return pd.read_sql_query(query + f" ORDER BY {key}", conn, params=params)
+    finally:
+        if own_conn:
+            conn.close()
@@ -0,0 +1,50 @@
+# utils/sql_dialect.py
+"""
+Fragmentos SQL que cambian entre SQLite y PostgreSQL (agrupación por fechas, concatenación).
+
+Las queries de agregados se escriben una vez e interpolan estas expresiones, así la
+agregación se hace en la BD en los dos backends y solo viajan las filas ya agrupadas.
+Las fechas son la columna tipada start_at (ver utils/timestamps.py): TIMESTAMP en
+PostgreSQL y epoch en SQLite.
+"""
+
+from typing import Optional
+
+from .db_config import is_postgres
+
+PERIODS = ("week", "month")
+
+
+def _postgres(postgres: Optional[bool]) -> bool:
+    return is_postgres() if postgres is None else postgres
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def month_bucket(column: str = "start_at", postgres: Optional[bool] = None) -> str:
+    """Mes de la fecha como 'YYYY-MM'."""
+    if _postgres(postgres):
+        return f"to_char({column}, 'YYYY-MM')"
+    return f"strftime('%Y-%m', {column}, 'unixepoch')"
+
+
+def period_bucket(period: str, postgres: Optional[bool] = None) -> str:
+    """
+    Expresión de agrupación de activities por 'week' o 'month'.
+
+    Las semanas usan la columna precalculada week_key (indexada) en lugar de calcularla.
+    """
+    if period == "week":
+        return "week_key"
+    if period == "month":
+        return month_bucket(postgres=postgres)
+    raise ValueError(f"Periodo desconocido: {period} (esperado uno de {PERIODS})")
+
+
+def string_agg(expression: str, separator: str, postgres: Optional[bool] = None) -> str:
+    """Concatena los valores no nulos del grupo (GROUP_CONCAT / string_agg)."""
+    if _postgres(postgres):
+        return f"string_agg({expression}, {_literal(separator)})"
+    return f"group_concat({expression}, {_literal(separator)})"
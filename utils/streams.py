@@ -0,0 +1,118 @@
+# utils/streams.py
+"""
+Streams de Strava (/activities/{id}/streams) guardados como arrays tipados.
+
+En lugar de una fila por muestra, cada (actividad, tipo de stream) es una sola fila de
+activity_streams con los valores en un blob binario (numpy, little-endian). Leer los
+streams de una actividad son unas pocas filas y np.frombuffer() sobre los bytes, sin
+copiar ni convertir muestra a muestra.
+
+Los índices de laps.start_index / laps.end_index son posiciones en estos mismos arrays:
+ver lap_slice().
+"""
+
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from .db_config import get_connection
+
+# Tipo de cada stream. Las FC y la cadencia caben en int16; latlng es (n, 2).
+STREAM_DTYPES = {
+    "time": "<i4",
+    "distance": "<f4",
+    "heartrate": "<i2",
+    "altitude": "<f4",
+    "velocity_smooth": "<f4",
+    "cadence": "<i2",
+    "latlng": "<f4",
+}
+STREAM_TYPES = tuple(STREAM_DTYPES)
+
+STREAM_COLUMNS = ("activity_id", "stream_type", "dtype", "n_samples", "data")
+
+
+def create_table(cur, is_postgres: bool):
+    """Crea la tabla de streams (se llama desde init_db)."""
+    blob = "BYTEA" if is_postgres else "BLOB"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS activity_streams (
+            activity_id BIGINT NOT NULL,
+            stream_type TEXT NOT NULL,
+            dtype TEXT NOT NULL,
+            n_samples INTEGER NOT NULL,
+            data {blob} NOT NULL,
+            PRIMARY KEY (activity_id, stream_type)
+        )
+    """)
+
+
+def encode(stream_type: str, values) -> np.ndarray:
+    """Convierte los valores de un stream al array tipado que se guarda."""
+    dtype = STREAM_DTYPES.get(stream_type, "<f4")
+    try:
+        return np.asarray(values, dtype=dtype)
+    except (TypeError, ValueError):
+        # Muestras vacías (None): se guardan como float32 con NaN
+        return np.array([np.nan if v is None else v for v in values], dtype="<f4")
+
+
+def stream_rows(activity_id: int, payload) -> list:
+    """
+    Filas de activity_streams a partir de la respuesta de Strava (con key_by_type=true).
+
+    'payload' es {tipo: {'data': [...], ...}}; también se acepta la forma de lista
+    [{'type': tipo, 'data': [...]}, ...] que devuelve la API sin key_by_type.
+    """
+    if isinstance(payload, list):
+        payload = {stream["type"]: stream for stream in payload}
+    rows = []
+    for stream_type, stream in (payload or {}).items():
+        array = encode(stream_type, stream.get("data") or [])
+        rows.append((activity_id, stream_type, array.dtype.str, len(array), array.tobytes()))
+    return rows
+
+
+def store_streams(cur, streams_by_activity: Dict[int, object]):
+    """Upsert de los streams de varias actividades ({activity_id: payload})."""
+    rows = [row for act_id, payload in streams_by_activity.items() for row in stream_rows(act_id, payload)]
+    cur.upsert_many("activity_streams", STREAM_COLUMNS, rows, conflict_columns=("activity_id", "stream_type"))
+
+
+def _decode(stream_type: str, dtype: str, blob) -> np.ndarray:
+    # frombuffer no copia: el array (de solo lectura) apunta a los bytes devueltos por la BD
+    array = np.frombuffer(blob, dtype=np.dtype(dtype))
+    if stream_type == "latlng":
+        array = array.reshape(-1, 2)
+    return array
+
+
+def load_streams(activity_id: int, stream_types: Optional[Iterable[str]] = None, conn=None) -> Dict[str, np.ndarray]:
+    """
+    Streams guardados de una actividad ({tipo: ndarray}); vacío si no se han descargado.
+
+    Args:
+        activity_id: ID de la actividad
+        stream_types: Tipos a leer (por defecto todos)
+        conn: Conexión a reutilizar (si no, se abre y se cierra una)
+    """
+    own_conn = conn is None
+    conn = conn or get_connection(read_only=True)
+    try:
+        cur = conn.cursor()
+        sql = "SELECT stream_type, dtype, data FROM activity_streams WHERE activity_id = ?"
+        params = [activity_id]
+        if stream_types is not None:
+            stream_types = list(stream_types)
+            sql += f" AND stream_type IN ({', '.join('?' for _ in stream_types)})"
+            params.extend(stream_types)
+        cur.execute(sql, params)
+        return {stream_type: _decode(stream_type, dtype, blob) for stream_type, dtype, blob in cur.fetchall()}
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def lap_slice(streams: Dict[str, np.ndarray], start_index: int, end_index: int) -> Dict[str, np.ndarray]:
+    """Vista de los streams de un lap (laps.start_index..laps.end_index, ambos incluidos), sin copia."""
+    return {stream_type: array[int(start_index):int(end_index) + 1] for stream_type, array in streams.items()}
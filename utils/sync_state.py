@@ -0,0 +1,119 @@
+# utils/sync_state.py
+"""
+Registro persistente del progreso de las sincronizaciones con Strava.
+
+- sync_state: una fila por trabajo ('download', 'sync', 'backfill_laps'...) con la página
+  en curso, el 'after' usado, la última actividad procesada y el estado del trabajo.
+- sync_activity_status: estado de cada actividad dentro de un trabajo ('done' / 'failed';
+  los backfills marcan 'unavailable' las que Strava no devolverá nunca: 403/404).
+
+Las sincronizaciones confirman en lotes pequeños junto con este registro, así que si
+se cortan (error de red, 429, reinicio de la app) la siguiente ejecución continúa en
+la misma página y salta las actividades ya guardadas.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_UNAVAILABLE = "unavailable"
+
+STATE_COLUMNS = ("job", "page", "after_ts", "last_activity_id", "status", "updated_at")
+ACTIVITY_STATUS_COLUMNS = ("job", "activity_id", "status", "error", "updated_at")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_tables(cur):
+    """Crea las tablas del registro (se llama desde init_db)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            job TEXT PRIMARY KEY,
+            page INTEGER NOT NULL DEFAULT 1,
+            after_ts BIGINT,
+            last_activity_id BIGINT,
+            status TEXT NOT NULL,
+            updated_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_activity_status (
+            job TEXT NOT NULL,
+            activity_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (job, activity_id)
+        )
+    """)
+
+
+def load_state(cur, job: str) -> Optional[Dict]:
+    """Devuelve el estado guardado del trabajo o None si nunca se ha ejecutado."""
+    cur.execute("SELECT page, after_ts, last_activity_id, status FROM sync_state WHERE job = ?", (job,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    page, after_ts, last_activity_id, status = row
+    return {"page": page, "after_ts": after_ts, "last_activity_id": last_activity_id, "status": status}
+
+
+def save_state(cur, job: str, page: int = 1, after_ts: Optional[int] = None,
+               last_activity_id: Optional[int] = None, status: str = STATUS_RUNNING):
+    cur.upsert_many("sync_state", STATE_COLUMNS,
+                    [(job, page, after_ts, last_activity_id, status, _now())],
+                    conflict_columns=("job",))
+
+
+def start_job(cur, job: str, after_ts: Optional[int] = None) -> Dict:
+    """
+    Reanuda el trabajo si quedó a medias o lo empieza de cero.
+
+    Al empezar de cero se borra el registro por actividad de la ejecución anterior.
+
+    Returns:
+        Estado con el que continuar ({'page', 'after_ts', 'last_activity_id', 'status', 'resumed'})
+    """
+    state = load_state(cur, job)
+    if state is not None and state["status"] == STATUS_RUNNING:
+        state["resumed"] = True
+        return state
+
+    cur.execute("DELETE FROM sync_activity_status WHERE job = ?", (job,))
+    save_state(cur, job, page=1, after_ts=after_ts)
+    return {"page": 1, "after_ts": after_ts, "last_activity_id": None, "status": STATUS_RUNNING, "resumed": False}
+
+
+def finish_job(cur, job: str, page: int, after_ts: Optional[int] = None, last_activity_id: Optional[int] = None):
+    save_state(cur, job, page=page, after_ts=after_ts, last_activity_id=last_activity_id, status=STATUS_DONE)
+
+
+def mark_activities(cur, job: str, activity_ids: Iterable[int], status: str = STATUS_DONE,
+                    error: Optional[str] = None):
+    now = _now()
+    cur.upsert_many("sync_activity_status", ACTIVITY_STATUS_COLUMNS,
+                    [(job, act_id, status, error, now) for act_id in activity_ids],
+                    conflict_columns=("job", "activity_id"))
+
+
+def failed_activities(cur, job: str) -> List[int]:
+    """Actividades marcadas como 'failed' en la última ejecución del trabajo."""
+    cur.execute("SELECT activity_id FROM sync_activity_status WHERE job = ? AND status = ?", (job, STATUS_FAILED))
+    return [row[0] for row in cur.fetchall()]
+
+
+def activity_statuses(cur, job: str, activity_ids) -> Dict[int, str]:
+    """Estado registrado de las actividades indicadas ({activity_id: status})."""
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in activity_ids)
+    cur.execute(
+        f"SELECT activity_id, status FROM sync_activity_status WHERE job = ? AND activity_id IN ({placeholders})",
+        (job, *activity_ids),
+    )
+    return {act_id: status for act_id, status in cur.fetchall()}
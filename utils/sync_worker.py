@@ -0,0 +1,195 @@
+# utils/sync_worker.py
+"""
+Sincronización con Strava en segundo plano (tabla sync_jobs).
+
+El botón de la app ya no ejecuta la sincronización dentro del script de Streamlit:
+start_sync_job() registra un trabajo en sync_jobs y lo lanza en un hilo del proceso.
+La página consulta el progreso con latest_job() sin bloquearse.
+
+Solo puede haber un trabajo activo por tipo: un índice único parcial sobre
+sync_jobs(kind) WHERE status IN ('queued', 'running') lo garantiza también entre
+procesos y sesiones (p.ej. al refrescar el navegador). El hilo actualiza heartbeat_at
+periódicamente; un trabajo 'running' sin latido reciente (proceso reiniciado) se da
+por muerto y deja lanzar uno nuevo, que continúa donde se quedó gracias a sync_state.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+from .db_config import get_connection
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Cada cuántos segundos el hilo marca el trabajo como vivo
+HEARTBEAT_INTERVAL = float(os.getenv("SYNC_JOB_HEARTBEAT", 15))
+# Un trabajo activo sin latido durante este tiempo se considera muerto
+STALE_AFTER = float(os.getenv("SYNC_JOB_STALE_AFTER", 120))
+
+JOB_COLUMNS = ("id", "kind", "status", "page", "processed", "message", "error", "result",
+               "created_at", "started_at", "finished_at", "heartbeat_at")
+
+def create_table(cur):
+    """Crea la tabla de trabajos (se llama desde init_db y antes de lanzar un trabajo)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            page INTEGER,
+            processed INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            error TEXT,
+            result TEXT,
+            created_at BIGINT NOT NULL,
+            started_at BIGINT,
+            finished_at BIGINT,
+            heartbeat_at BIGINT
+        )
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_jobs_one_active
+        ON sync_jobs (kind) WHERE status IN ('queued', 'running')
+    """)
+
+
+def _row_to_job(row) -> Dict:
+    job = dict(zip(JOB_COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def _select_job(cur, where: str, params) -> Optional[Dict]:
+    cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM sync_jobs WHERE {where} "
+                "ORDER BY created_at DESC LIMIT 1", params)
+    row = cur.fetchone()
+    return _row_to_job(row) if row else None
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    conn = get_connection()
+    try:
+        return _select_job(conn.cursor(), "id = ?", (job_id,))
+    finally:
+        conn.close()
+
+
+def latest_job(kind: str = "sync") -> Optional[Dict]:
+    """Último trabajo del tipo indicado (activo o terminado), o None si no hay ninguno."""
+    conn = get_connection()
+    try:
+        return _select_job(conn.cursor(), "kind = ?", (kind,))
+    except Exception:
+        # La tabla aún no existe (ningún trabajo lanzado todavía)
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def _expire_stale(cur, kind: str):
+    """Marca como fallidos los trabajos activos cuyo hilo ya no da señales de vida."""
+    cutoff = int(time.time() - STALE_AFTER)
+    cur.execute(
+        "UPDATE sync_jobs SET status = ?, error = ?, finished_at = ? "
+        "WHERE kind = ? AND status IN (?, ?) AND COALESCE(heartbeat_at, created_at) < ?",
+        (STATUS_FAILED, "Trabajo interrumpido (sin latido del proceso)", int(time.time()),
+         kind, *ACTIVE_STATUSES, cutoff),
+    )
+
+
+def _update(job_id: str, **fields):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        cur.execute(f"UPDATE sync_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def start_sync_job(target: Callable, kind: str = "sync", **kwargs) -> Dict:
+    """
+    Lanza 'target' en un hilo en segundo plano, salvo que ya haya un trabajo activo de ese tipo.
+
+    'target' recibe los 'kwargs' más un callback progress(page=..., processed=..., message=...)
+    y lo que devuelva (p.ej. la lista de IDs sincronizados) se guarda en sync_jobs.result.
+
+    Returns:
+        El trabajo lanzado o el que ya estaba en marcha (dict con las columnas de sync_jobs)
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        create_table(cur)
+        _expire_stale(cur, kind)
+        now = int(time.time())
+        job_id = uuid.uuid4().hex
+        cur.execute(
+            "INSERT INTO sync_jobs (id, kind, status, processed, created_at, heartbeat_at) VALUES (?, ?, ?, 0, ?, ?)",
+            (job_id, kind, STATUS_QUEUED, now, now),
+        )
+        conn.commit()
+    except Exception:
+        # El índice único ha rechazado el INSERT: ya hay un trabajo activo
+        conn.rollback()
+        job = _select_job(cur, "kind = ? AND status IN (?, ?)", (kind, *ACTIVE_STATUSES))
+        conn.close()
+        if job is None:
+            raise
+        return job
+    conn.close()
+
+    threading.Thread(target=_run, args=(job_id, target, kwargs), name=f"sync-job-{kind}", daemon=True).start()
+    return get_job(job_id)
+
+
+def _run(job_id: str, target: Callable, kwargs):
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                _update(job_id, heartbeat_at=int(time.time()))
+            except Exception as e:
+                print(f"⚠️  No se pudo actualizar el latido del trabajo {job_id}: {e}")
+
+    def progress(page=None, processed=None, message=None):
+        fields = {"heartbeat_at": int(time.time())}
+        if page is not None:
+            fields["page"] = page
+        if processed is not None:
+            fields["processed"] = processed
+        if message is not None:
+            fields["message"] = message
+        try:
+            _update(job_id, **fields)
+        except Exception as e:
+            # El progreso es informativo: un fallo al guardarlo no debe parar la sincronización
+            print(f"⚠️  No se pudo guardar el progreso del trabajo {job_id}: {e}")
+
+    _update(job_id, status=STATUS_RUNNING, started_at=int(time.time()), heartbeat_at=int(time.time()))
+    threading.Thread(target=heartbeat, name=f"sync-heartbeat-{job_id[:8]}", daemon=True).start()
+    try:
+        result = target(progress=progress, **kwargs)
+        _update(job_id, status=STATUS_DONE, result=json.dumps(result, default=str),
+                finished_at=int(time.time()), heartbeat_at=int(time.time()))
+        print(f"✅ Trabajo de sincronización {job_id} terminado")
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status=STATUS_FAILED, error=str(e), finished_at=int(time.time()))
+    finally:
+        stop.set()
+
+
+def is_active(job: Optional[Dict]) -> bool:
+    return job is not None and job["status"] in ACTIVE_STATUSES
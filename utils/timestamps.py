@@ -0,0 +1,90 @@
+# utils/timestamps.py
+"""
+Fecha de inicio de las actividades como columnas tipadas (start_at, week_key).
+
+Strava devuelve start_date_local como '2025-01-01T07:00:00Z': la hora local del atleta
+con una 'Z' que no significa UTC. Ese texto se sigue guardando tal cual en
+start_date_local (para mostrarlo), y además:
+
+- start_at: la misma hora de pared como TIMESTAMP nativo en PostgreSQL, o como segundos
+  desde epoch (contando esa hora como si fuera UTC) en SQLite. Los filtros de rango
+  comparan este valor, indexado, en lugar de cadenas ISO con formatos distintos.
+- week_key: fecha ISO del lunes de la semana ('2025-01-13'), igual en los dos backends,
+  para agrupar por semanas sin strftime (que PostgreSQL no tiene).
+
+Las fechas de corte de las consultas (datetime.now() - ...) también son hora local sin
+zona, así que se comparan con start_at sin conversiones: pásalas con db_timestamp().
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from .db_config import is_postgres
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def start_at_type(postgres: bool) -> str:
+    return "TIMESTAMP" if postgres else "INTEGER"
+
+
+def parse_local(value) -> Optional[datetime]:
+    """start_date_local de Strava, un datetime o una fecha → datetime local sin zona."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    text = str(value).strip()
+    if text.endswith("Z"):
+        text = text[:-1]  # fromisoformat no acepta 'Z' antes de Python 3.11
+    return datetime.fromisoformat(text).replace(tzinfo=None)
+
+
+def to_epoch(value) -> Optional[int]:
+    """Segundos desde epoch de la hora local (el valor de start_at en SQLite)."""
+    dt = parse_local(value)
+    return None if dt is None else int((dt - EPOCH).total_seconds())
+
+
+def from_epoch(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def week_key(value) -> Optional[str]:
+    """Lunes de la semana de 'value' en ISO ('YYYY-MM-DD')."""
+    dt = parse_local(value)
+    if dt is None:
+        return None
+    return (dt.date() - timedelta(days=dt.weekday())).isoformat()
+
+
+def month_key(value) -> Optional[str]:
+    """Mes de 'value' ('YYYY-MM')."""
+    dt = parse_local(value)
+    return None if dt is None else dt.strftime("%Y-%m")
+
+
+def month_range(key: str) -> tuple:
+    """Inicio del mes 'YYYY-MM' y del siguiente, como datetimes locales."""
+    start = datetime.strptime(key, "%Y-%m")
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def db_value(value, postgres: bool):
+    """Valor de start_at para el backend indicado: datetime en PostgreSQL, epoch en SQLite."""
+    dt = parse_local(value)
+    if dt is None or postgres:
+        return dt
+    return to_epoch(dt)
+
+
+def db_timestamp(value):
+    """Parámetro para comparar con start_at en la BD configurada."""
+    return db_value(value, is_postgres())
+
+
+def start_columns(start_date_local) -> tuple:
+    """(start_at, week_key) de una actividad a partir de su start_date_local."""
+    return db_timestamp(start_date_local), week_key(start_date_local)
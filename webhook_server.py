@@ -0,0 +1,216 @@
+# webhook_server.py
+# como usar:
+#   python webhook_server.py serve                          → recibe los eventos de Strava (puerto WEBHOOK_PORT)
+#   python webhook_server.py subscribe https://host/webhook → da de alta la suscripción en Strava
+#   python webhook_server.py send-event create 123456789    → envía un evento de prueba al servidor local
+# Funciona con SQLite local o PostgreSQL (Supabase)
+"""
+Receptor del webhook de Strava (push subscriptions).
+
+Strava avisa de cada actividad creada, editada o borrada con un POST a la URL de
+callback. El servidor solo encola el evento en activity_jobs y responde enseguida
+(Strava exige respuesta en menos de 2 segundos); un hilo aparte ejecuta
+strava_client.process_activity_jobs(), que hace una petición por actividad cambiada
+en lugar de listar páginas desde la última fecha.
+
+Los POST de Strava no van firmados: solo se aceptan eventos con el subscription_id
+configurado (obligatorio), un borrado solo se aplica si Strava confirma que la actividad
+ya no existe, y una revocación de acceso solo si el token del atleta ya no es válido.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from strava_client import (CLIENT_ID, CLIENT_SECRET, STRAVA_API_URL, AuthHeaders, get_secret, init_db,
+                           process_activity_jobs, strava_get, strava_request)
+from utils import activity_jobs, athletes
+from utils.db_config import get_connection
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+VERIFY_TOKEN = get_secret("STRAVA_WEBHOOK_VERIFY_TOKEN")
+# ID devuelto por 'subscribe': sin él no se aceptan eventos (se ignoran los de otras suscripciones)
+SUBSCRIPTION_ID = get_secret("STRAVA_WEBHOOK_SUBSCRIPTION_ID")
+
+# Espera tras un evento antes de procesar la cola, para agrupar ráfagas (p.ej. create + update)
+PROCESS_DELAY = float(os.getenv("WEBHOOK_PROCESS_DELAY", 2))
+# Cada cuánto se revisa la cola aunque no lleguen eventos (reintentos de errores transitorios)
+PROCESS_INTERVAL = float(os.getenv("WEBHOOK_PROCESS_INTERVAL", 300))
+
+_wake = threading.Event()
+
+
+def handle_event(event: dict) -> bool:
+    """Encola un evento de Strava. Devuelve False si se ignora."""
+    if not SUBSCRIPTION_ID or str(event.get("subscription_id")) != str(SUBSCRIPTION_ID):
+        return False
+
+    if event.get("object_type") == "athlete":
+        if (event.get("updates") or {}).get("authorized") == "false":
+            # Se comprueba con Strava en otro hilo: hay que responder en menos de 2 segundos
+            threading.Thread(target=_confirm_deauthorization, args=(int(event["owner_id"]),), daemon=True).start()
+        return False
+
+    if event.get("object_type") != "activity" or event.get("aspect_type") not in activity_jobs.ASPECTS:
+        return False
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        activity_jobs.enqueue(cur, int(event["object_id"]), event["aspect_type"], event.get("event_time"),
+                              athlete_id=event.get("owner_id"))
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"📬 Evento {event['aspect_type']} de la actividad {event['object_id']} encolado")
+    _wake.set()
+    return True
+
+
+def _confirm_deauthorization(athlete_id: int):
+    """Desactiva el atleta solo si Strava rechaza su token (ha revocado de verdad el acceso)."""
+    conn = get_connection()
+    try:
+        if athletes.get_refresh_token(conn.cursor(), athlete_id) is None:
+            return
+    finally:
+        conn.close()
+    try:
+        strava_get(f"{STRAVA_API_URL}/athlete", AuthHeaders(athlete_id))
+        print(f"⚠️  Revocación de acceso del atleta {athlete_id} ignorada: su token sigue siendo válido")
+        return
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code not in (400, 401):
+            print(f"❌ No se ha podido comprobar la revocación del atleta {athlete_id}: {e}")
+            return
+    print(f"⚠️  El atleta {athlete_id} ha revocado el acceso a la aplicación")
+    conn = get_connection()
+    try:
+        athletes.deactivate_athlete(conn.cursor(), athlete_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data=None):
+        body = json.dumps(data or {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Validación de la suscripción: Strava envía hub.challenge y espera que se devuelva."""
+        url = urlparse(self.path)
+        if url.path != WEBHOOK_PATH:
+            return self._send_json(404)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if query.get("hub.mode") != "subscribe" or not VERIFY_TOKEN or query.get("hub.verify_token") != VERIFY_TOKEN:
+            print("❌ Validación de suscripción rechazada (verify_token incorrecto)")
+            return self._send_json(403)
+        print("✅ Suscripción validada")
+        self._send_json(200, {"hub.challenge": query.get("hub.challenge")})
+
+    def do_POST(self):
+        if urlparse(self.path).path != WEBHOOK_PATH:
+            return self._send_json(404)
+        try:
+            event = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            handle_event(event)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"❌ Evento no válido: {e}")
+            return self._send_json(400)
+        self._send_json(200)
+
+
+def _worker():
+    """Consume la cola cuando llegan eventos (o cada PROCESS_INTERVAL segundos)."""
+    while True:
+        if _wake.wait(PROCESS_INTERVAL):
+            time.sleep(PROCESS_DELAY)
+        _wake.clear()
+        try:
+            process_activity_jobs()
+        except Exception as e:
+            print(f"❌ Error procesando la cola de actividades: {e}")
+
+
+def serve(host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    if not VERIFY_TOKEN:
+        print("⚠️  STRAVA_WEBHOOK_VERIFY_TOKEN no configurado: la validación de la suscripción fallará")
+    if not SUBSCRIPTION_ID:
+        print("❌ Falta STRAVA_WEBHOOK_SUBSCRIPTION_ID (el id que devuelve 'subscribe'): "
+              "sin él cualquiera podría enviar eventos")
+        sys.exit(1)
+    init_db("data/strava_activities.db")
+    threading.Thread(target=_worker, name="activity-jobs", daemon=True).start()
+    _wake.set()  # procesar lo que quedara pendiente
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    print(f"🚀 Webhook de Strava escuchando en http://{host}:{port}{WEBHOOK_PATH}")
+    server.serve_forever()
+
+
+def subscribe(callback_url: str):
+    """Da de alta la suscripción del webhook en Strava (una por aplicación)."""
+    response = strava_request("POST", f"{STRAVA_API_URL}/push_subscriptions", data={
+        "client_id": CLIENT_ID,
+        "client_secret": CLIENT_SECRET,
+        "callback_url": callback_url,
+        "verify_token": VERIFY_TOKEN,
+    })
+    print(f"✅ Suscripción creada: {response.json()}")
+
+
+def send_event(aspect: str, activity_id: int, url: str, owner_id: int = 0, updates=None):
+    """Envía un evento de ejemplo con el mismo formato que Strava (para probar en local)."""
+    event = {
+        "aspect_type": aspect,
+        "event_time": int(time.time()),
+        "object_id": activity_id,
+        "object_type": "activity",
+        "owner_id": owner_id,
+        "subscription_id": int(SUBSCRIPTION_ID or 0),
+        "updates": updates or {},
+    }
+    response = httpx.post(url, json=event, timeout=10)
+    print(f"📤 {aspect} {activity_id} → {response.status_code}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook de Strava")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="Recibe eventos de Strava")
+    serve_cmd.add_argument("--host", default=WEBHOOK_HOST)
+    serve_cmd.add_argument("--port", type=int, default=WEBHOOK_PORT)
+
+    subscribe_cmd = commands.add_parser("subscribe", help="Da de alta la suscripción en Strava")
+    subscribe_cmd.add_argument("callback_url")
+
+    send_cmd = commands.add_parser("send-event", help="Envía un evento de prueba")
+    send_cmd.add_argument("aspect", choices=activity_jobs.ASPECTS)
+    send_cmd.add_argument("activity_id", type=int)
+    send_cmd.add_argument("--url", default=f"http://localhost:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    send_cmd.add_argument("--updates", default="{}", help='p.ej. \'{"title": "Nuevo nombre"}\'')
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.host, args.port)
+    elif args.command == "subscribe":
+        subscribe(args.callback_url)
+    else:
+        send_event(args.aspect, args.activity_id, args.url, updates=json.loads(args.updates))